@@ -0,0 +1,87 @@
+import os
+import sys
+import asyncio
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+import asyncparse
+from asyncparse import ParseCancelled, parse_async
+from lex import VerilogLexerPlex
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'verilog', 'verilog_example_1.v')
+CHECK_EVERY = 64
+
+
+def _big_source(copies=40):
+    with open(EXAMPLE) as fd:
+        text = fd.read()
+    return ''.join(text.replace('module top', 'module top%d' % i) for i in range(copies))
+
+
+class _CountingLexer(object):
+    """ Sets ``cancel`` after ``after`` tokens and counts the tokens pulled """
+
+    def __init__(self, cancel, after):
+        self.cancel = cancel
+        self.after = after
+        self.pulled = 0
+
+    def __call__(self, error_func):
+        self.lexer = VerilogLexerPlex(error_func=error_func)
+        return self
+
+    def input(self, text):
+        self.lexer.input(text)
+
+    def __iter__(self):
+        for tok in self.lexer:
+            self.pulled += 1
+            if self.pulled == self.after:
+                self.cancel.set()
+            yield tok
+
+
+def test_cancel_stops_within_check_every(tmp_path, monkeypatch):
+    cancel = threading.Event()
+    lexer = _CountingLexer(cancel, 500)
+    monkeypatch.setattr(asyncparse, 'VerilogLexerPlex', lexer)
+
+    async def main():
+        await parse_async(_big_source(), cancel=cancel, check_every=CHECK_EVERY,
+                          outputdir=str(tmp_path))
+
+    try:
+        asyncio.run(main())
+    except ParseCancelled:
+        pass
+    else:
+        raise AssertionError('parse was not cancelled')
+    assert cancel.is_set()
+    assert lexer.after <= lexer.pulled <= lexer.after + CHECK_EVERY
+
+
+def test_cancelled_task_sets_the_event(tmp_path):
+    cancel = threading.Event()
+    text = _big_source(2000)
+
+    async def main():
+        await parse_async('module warm; endmodule\n', outputdir=str(tmp_path))
+        task = asyncio.ensure_future(parse_async(text, cancel=cancel, check_every=CHECK_EVERY,
+                                                 outputdir=str(tmp_path)))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(main())
+    assert cancel.is_set()
+
+
+def test_uncancelled_parse(tmp_path):
+    ast = asyncio.run(parse_async(_big_source(2), outputdir=str(tmp_path)))
+    names = [d.name for d in ast.description.definitions]
+    assert names == ['top0', 'top1']
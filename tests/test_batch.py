@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+from batch import BatchStats, _Batch, parse_many
+
+
+def _module(i):
+    return 'module m%d(input a, output y);\n  assign y = a;\nendmodule\n' % i
+
+
+def _names(result):
+    return [d.name for d in result.ast.description.definitions]
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_results_keep_input_order(tmp_path, processes):
+    sources = (('f%d.v' % i, _module(i)) for i in range(20))
+    results = list(parse_many(sources, processes, chunksize=3, outputdir=str(tmp_path)))
+    assert [r.name for r in results] == ['f%d.v' % i for i in range(20)]
+    assert [_names(r) for r in results] == [['m%d' % i] for i in range(20)]
+    assert all(r.error is None for r in results)
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_bad_source_does_not_stop_the_batch(tmp_path, processes):
+    sources = [_module(0), 'module bad; assign = ; endmodule\n', _module(2)]
+    stats = BatchStats()
+    results = list(parse_many(sources, processes, chunksize=1, stats=stats,
+                              outputdir=str(tmp_path)))
+    assert [r.name for r in results] == ['<source 0>', '<source 1>', '<source 2>']
+    assert results[1].ast is None and results[1].error
+    assert _names(results[0]) == ['m0'] and _names(results[2]) == ['m2']
+    assert stats.items == 3 and stats.failures == 1
+
+
+def test_no_state_leaks_between_sources(tmp_path):
+    batch = _Batch(str(tmp_path))
+    first = batch.parse('first.v', '`default_nettype none\n`define W 8\n' + _module(1))
+    assert first.error is None
+    assert batch.lexer.default_nettype == 'none'
+    assert len(batch.lexer.directives) == 2
+
+    second = batch.parse('second.v', _module(2))
+    assert second.error is None
+    assert _names(second) == ['m2']
+    assert batch.lexer.filename == 'second.v'
+    assert batch.lexer.directives == []
+    assert batch.lexer.default_nettype == 'wire'
+    assert batch.context.filename == 'second.v'
+    assert batch.context.directives == []
+    assert batch.context.default_nettype == 'wire'
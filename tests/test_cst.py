@@ -0,0 +1,69 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+from cst import ConcreteSyntaxTree
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'verilog', 'verilog_example_1.v')
+
+COMMENTED = '''// leading comment
+`timescale 1ns / 1ps
+/* block
+   comment */ module top ( // after paren
+    input  wire clk ,   /* trailing */
+    output reg  [7:0] q
+);
+\t// tab-indented comment
+  always @(posedge clk) begin   // begin
+    q <= q + /* inline */ 8'd1 ;
+  end
+endmodule   // end
+/* trailing block comment */'''
+
+
+def _sources():
+    with open(EXAMPLE, newline='') as fd:
+        example = fd.read()
+    return [example, COMMENTED, COMMENTED.replace('\n', '\r\n'), 'module m; endmodule', '']
+
+
+def _write(cst):
+    buf = io.StringIO()
+    cst.write(buf)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize('source', _sources())
+def test_round_trip(source):
+    assert _write(ConcreteSyntaxTree.from_source(source)) == source
+
+
+@pytest.mark.parametrize('source', _sources()[:3])
+def test_round_trip_after_parse(source):
+    cst = ConcreteSyntaxTree.from_source(source)
+    assert cst.parse() is not None
+    assert _write(cst) == source
+
+
+def test_file_round_trip(tmp_path):
+    path = tmp_path / 'crlf.v'
+    path.write_bytes(COMMENTED.replace('\n', '\r\n').encode())
+    out = tmp_path / 'out.v'
+    ConcreteSyntaxTree.from_file(str(path)).to_file(str(out))
+    assert out.read_bytes() == path.read_bytes()
+
+
+def test_node_spans_keep_comments():
+    cst = ConcreteSyntaxTree.from_source(COMMENTED)
+    module = cst.parse().description.definitions[0]
+    always = module.items[0]
+    assert cst.node_text(always).startswith('always @(posedge clk) begin   // begin')
+    start, end = cst.node_trivia(always)
+    assert '// tab-indented comment' in cst.source[start:end]
+    cst.replace_node(always.statement.statements[0].right, 'q - 1')
+    assert _write(cst) == COMMENTED.replace("q + /* inline */ 8'd1", 'q - 1')
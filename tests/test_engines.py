@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+from astnode import Node
+from lalr import LRParser
+from actions import POSITIONAL
+from lex import VerilogLexerPlex
+from par_lalr import VerilogParser
+from codegen import to_source
+from lrcompile import CompiledParser
+from stats import ParseStats
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'verilog', 'verilog_example_1.v')
+
+EXPRESSIONS = '''module expr(input [31:0] a, input [31:0] b, input [31:0] c, input s,
+            output [31:0] y, output [31:0] z, output [7:0] w, output v);
+  assign y = a + b * c - (a << 2) ^ b & ~c | a >> 3;
+  assign z = s ? -a + b : (a - 1) * (b + c) / c % 7;
+  assign w = {a[7:4], b[3:0]} + c[a +: 8] - {2{a[3:0]}};
+  assign v = !(a == b) && (b != c) || a <= c && b >= a || a < b ^ ~&c;
+  always @* begin
+    if (a > b) y = a ** 2 - b;
+    else y = s ? a : s ? b : c;
+  end
+endmodule
+'''
+
+ENGINES = [
+    ('unit-elimination', dict(unit_elimination=True)),
+    ('positional', dict(convention=POSITIONAL)),
+    ('unit-elimination-positional', dict(unit_elimination=True, convention=POSITIONAL)),
+    ('mixed-convention',
+     dict(convention={'p_assignment': POSITIONAL, 'p_expression_plus': POSITIONAL})),
+    ('expressions', dict(expressions=True)),
+    ('expressions-unit-elimination-positional',
+     dict(unit_elimination=True, convention=POSITIONAL, expressions=True)),
+]
+
+
+def _error(msg, line, column):
+    raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+
+def _tokens(text):
+    lexer = VerilogLexerPlex(error_func=_error)
+    lexer.input(text)
+    return list(lexer)
+
+
+def _dump(node):
+    """ Structure of an AST: class, attributes and children, recursively """
+    if not isinstance(node, Node):
+        return node
+    attrs = tuple(getattr(node, a) for a in node.attr_names)
+    return (type(node).__name__, attrs, tuple(_dump(c) for c in node.children()))
+
+
+def _sources():
+    with open(EXAMPLE) as fd:
+        return [fd.read(), EXPRESSIONS]
+
+
+@pytest.mark.parametrize('source', _sources(), ids=['example', 'expressions'])
+@pytest.mark.parametrize('label,options', ENGINES, ids=[e[0] for e in ENGINES])
+def test_same_ast_as_baseline(source, label, options):
+    tokens = _tokens(source)
+    expected = LRParser(VerilogParser()).parse(tokens)
+    assert expected is not None
+    got = LRParser(VerilogParser(), **options).parse(tokens)
+    assert _dump(got) == _dump(expected)
+    assert to_source(got) == to_source(expected)
+
+
+@pytest.mark.parametrize('source', _sources(), ids=['example', 'expressions'])
+def test_compiled_parser_same_ast(source, tmp_path):
+    tokens = _tokens(source)
+    expected = LRParser(VerilogParser()).parse(tokens)
+    engine = CompiledParser(VerilogParser(), True, str(tmp_path))
+    got = engine.parse(tokens, VerilogParser.context())
+    assert _dump(got) == _dump(expected)
+
+    # Actions wrapped on the instance are called instead of inlined.
+    stats = ParseStats()
+    got = CompiledParser(VerilogParser(stats=stats), True, str(tmp_path)).parse(tokens)
+    assert _dump(got) == _dump(expected)
+    reference = ParseStats()
+    LRParser(VerilogParser(stats=reference), True).parse(tokens)
+    assert stats.reductions == reference.reductions
@@ -0,0 +1,122 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+from lex import VerilogLexerPlex
+from parlex import ParallelLexer, split_lines
+
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'verilog', 'verilog_example_1.v')
+
+PROCESSES = [1, 3]
+
+
+def _sequential(text):
+    errors = []
+    lexer = VerilogLexerPlex(error_func=lambda *e: errors.append(e))
+    lexer.input(text)
+    tokens = [(t.type, t.value, t.lineno, t.lexpos) for t in lexer]
+    return tokens, errors, lexer.directives, lexer.default_nettype
+
+
+def _parallel(text, processes, chunk_size):
+    errors = []
+    lexer = ParallelLexer(lambda *e: errors.append(e), processes, chunk_size)
+    lexer.input(text)
+    tokens = [tuple(t) for t in lexer]
+    return (tokens, errors, lexer.directives, lexer.default_nettype), lexer
+
+
+def _check(text, processes, chunk_size=1):
+    assert len(split_lines(text, chunk_size)) > 1
+    result, lexer = _parallel(text, processes, chunk_size)
+    assert result == _sequential(text)
+    return lexer
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+@pytest.mark.parametrize('chunk_size', [1, 64, 256])
+def test_example_tokens(processes, chunk_size):
+    with open(EXAMPLE) as fd:
+        _check(fd.read(), processes, chunk_size)
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+def test_errors_keep_line_and_column(processes):
+    text = ('module m;\n'
+            '\\ wire a;\n'
+            '  wire b; \\ \\\n'
+            'endmodule \\\n')
+    lexer = _check(text, processes, chunk_size=12)
+    errors = _sequential(text)[1]
+    assert [e[1:] for e in errors] == [(2, 2), (3, 12), (3, 14), (4, 12)]
+    assert lexer.repaired == 0
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+def test_directives_and_default_nettype(processes):
+    text = ('`define WIDTH 8\n'
+            'module a; endmodule\n'
+            '`default_nettype none\n'
+            'module b; endmodule\n'
+            '`timescale 1ns/1ps\n'
+            '`default_nettype tri\n'
+            'module c; endmodule\n')
+    _check(text, processes)
+    tokens, errors, directives, default_nettype = _sequential(text)
+    assert [n for n, value in directives] == [1, 3, 5, 6]
+    assert default_nettype == 'tri'
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+def test_comment_across_one_boundary(processes):
+    text = ('module a; /* starts here\n'
+            'and ends here */ wire w;\n'
+            'endmodule\n')
+    lexer = _check(text, processes)
+    assert lexer.repaired == 1
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+def test_comment_across_several_chunks(processes):
+    # The lines inside the comment look like code, directives and errors
+    # to the speculative lexers; none of it may come through.
+    text = ('module a;\n'
+            '  wire x; /*\n'
+            '  wire hidden;\n'
+            '`default_nettype none\n'
+            '  \\ not an error\n'
+            '  // not a line comment */ wire y;\n'
+            '`default_nettype tri\n'
+            '  /* second */ /* third\n'
+            '  */ wire z;\n'
+            'endmodule\n')
+    lexer = _check(text, processes)
+    assert lexer.repaired == 2
+    tokens, errors, directives, default_nettype = _sequential(text)
+    assert not errors and directives == [(7, '`default_nettype tri\n')]
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+def test_unterminated_comment_at_eof(processes):
+    text = ('module a;\n'
+            '  wire x;\n'
+            '/* never closed\n'
+            '  wire y;\n'
+            '  \\\n'
+            'endmodule\n')
+    _check(text, processes)
+
+
+@pytest.mark.parametrize('processes', PROCESSES)
+def test_many_boundaries_in_comments(processes):
+    with open(EXAMPLE) as fd:
+        module = fd.read()
+    comment = '/*\n' + ' * wrapped comment line\n' * 10 + ' */\n'
+    text = ''.join(module.replace('module top', 'module top%d' % i) + comment
+                   for i in range(5))
+    lexer = _check(text, processes, chunk_size=len(text) // 23)
+    assert lexer.repaired > 0
@@ -0,0 +1,43 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+from parser_ply import VerilogParser
+
+
+SOURCE = '''module top(input a, input b, output reg r, output reg q);
+  always @* begin
+    r = 1 +;
+    r = a;
+    q = b;
+  end
+  wire $$ y;
+  always @* begin
+    r = b;
+    q = a -;
+    r = ~a;
+  end
+  assign y = a;
+endmodule
+'''
+
+
+def _parse(tmp_path, text):
+    parser = VerilogParser(outputdir=str(tmp_path), debug=False, recover=True)
+    return parser.parse(text), parser.get_diagnostics()
+
+
+def test_every_error_in_one_pass(tmp_path):
+    ast, diagnostics = _parse(tmp_path, SOURCE)
+    assert [d.lineno for d in diagnostics] == [3, 7, 10]
+
+
+def test_statements_after_an_error_survive(tmp_path):
+    ast, diagnostics = _parse(tmp_path, SOURCE)
+    items = ast.description.definitions[0].items
+    blocks = [item.statement for item in items if type(item).__name__ == 'Always']
+    assigned = [[s.left.var.name for s in block.statements] for block in blocks]
+    # The statement in error is dropped, its neighbours are kept.
+    assert assigned == [['r', 'q'], ['r', 'r']]
+    assert type(items[-1]).__name__ == 'Assign'
@@ -0,0 +1,105 @@
+import os
+import sys
+import socket
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'verilog'))
+
+from server import ParseServer
+from parseclient import ParseClient, ParseFailed, NAME, PARSE, SOURCE
+
+
+SOURCE_TEXT = '''module adder(input [7:0] a, input [7:0] b, output [8:0] y);
+  assign y = a + b;
+endmodule
+'''
+
+
+@pytest.fixture
+def server(tmp_path):
+    path = str(tmp_path / 'parse.sock')
+    srv = ParseServer(path, outputdir=str(tmp_path))
+    thread = threading.Thread(target=srv.serve_forever)
+    thread.start()
+    yield srv
+    if thread.is_alive():
+        srv.shutdown()
+    thread.join()
+    srv.server_close()
+
+
+def _client(srv):
+    client = ParseClient(srv.server_address)
+    client.sock.settimeout(30)
+    return client
+
+
+def test_ping_and_parse_replies(server):
+    with _client(server) as c:
+        c.ping()
+        assert c.check(SOURCE_TEXT, 'adder.v') is None
+        ast = c.parse(SOURCE_TEXT, 'adder.v')
+        assert [d.name for d in ast.description.definitions] == ['adder']
+        text = c.parse(SOURCE_TEXT, 'adder.v', SOURCE)
+        assert 'module adder' in text
+        assert 'assign y = a + b;' in text
+
+
+def test_errors_keep_the_connection(server):
+    with _client(server) as c:
+        with pytest.raises(ParseFailed):
+            c.check('module bad; assign = ; endmodule\n', 'bad.v')
+        name = b'x.v'
+        with pytest.raises(ParseFailed, match='unknown reply format'):
+            c.request(PARSE, NAME.pack(len(name)) + name + SOURCE_TEXT.encode(), 7)
+        with pytest.raises(ParseFailed, match='unknown operation'):
+            c.request(42)
+        c.ping()
+
+
+def test_index(server, tmp_path):
+    path = tmp_path / 'adder.v'
+    path.write_text(SOURCE_TEXT)
+    with _client(server) as c:
+        assert c.index(str(path)) is True
+        assert c.index(str(path)) is False
+        with pytest.raises(ParseFailed):
+            c.index(str(tmp_path / 'missing.v'))
+
+
+def test_connections_are_served_concurrently(server):
+    with _client(server) as first, _client(server) as second:
+        first.ping()
+        # The first connection stays open while the second one is served.
+        second.check(SOURCE_TEXT)
+        first.check(SOURCE_TEXT)
+
+
+def test_stop(server):
+    with _client(server) as c:
+        c.stop()
+    # serve_forever returns: the fixture joins the thread.
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / 'stale.sock')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+    srv = ParseServer(path, outputdir=str(tmp_path))
+    srv.server_close()
+    assert not os.path.exists(path)
+
+
+def test_refuses_regular_file_and_live_server(server, tmp_path):
+    path = tmp_path / 'not-a-socket'
+    path.write_text('keep me')
+    with pytest.raises(FileExistsError):
+        ParseServer(str(path), outputdir=str(tmp_path))
+    assert path.read_text() == 'keep me'
+    with pytest.raises(OSError, match='already listening'):
+        ParseServer(server.server_address, outputdir=str(tmp_path))
+    with _client(server) as c:
+        c.ping()
@@ -0,0 +1,147 @@
+"""
+   Positional calling convention for the ``p_*`` semantic actions.
+
+   The Pison convention calls ``action(p)`` with a fresh sequence holding the
+   right-hand-side values at ``p[1:]`` and reads the result back from
+   ``p[0]``. ``compile_positional`` rewrites the source of a ``p_*`` method
+   into ``action(self, v1, ..., vn)`` returning the result, so a reduction
+   costs one call with no sequence object and no ``__getitem__``/
+   ``__setitem__``. Actions that use ``p`` in any other way, and actions an
+   instrumenting object has wrapped, fall back to ``adapter``.
+"""
+
+import ast
+import types
+import inspect
+import textwrap
+
+
+SEQUENCE = 'sequence'
+POSITIONAL = 'positional'
+
+_compiled = {}
+
+
+def adapter(action):
+    """ Call a sequence-convention ``action`` with positional values """
+    def call(*args):
+        p = [None]
+        p.extend(args)
+        action(p)
+        return p[0]
+    call.__name__ = getattr(action, '__name__', 'action')
+    return call
+
+
+class _Rewrite(ast.NodeTransformer):
+    def __init__(self, p, nargs):
+        self.p = p
+        self.nargs = nargs
+        self.ok = True
+
+    def _index(self, node):
+        if isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, int):
+            return node.slice.value
+        return None
+
+    def visit_Subscript(self, node):
+        if isinstance(node.value, ast.Name) and node.value.id == self.p:
+            k = self._index(node)
+            if k is None or k > self.nargs or (k and not isinstance(node.ctx, ast.Load)):
+                self.ok = False
+                return node
+            return ast.copy_location(ast.Name('_p%d' % k, node.ctx), node)
+        return self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id == self.p:
+            self.ok = False
+        return node
+
+    def visit_Return(self, node):
+        if node.value is not None:
+            self.ok = False
+            return node
+        return ast.copy_location(ast.Return(ast.Name('_p0', ast.Load())), node)
+
+    def visit_FunctionDef(self, node):
+        # Nested scopes would see ``_p0`` as a free variable.
+        self.ok = False
+        return node
+
+    visit_Lambda = visit_ClassDef = visit_AsyncFunctionDef = visit_FunctionDef
+
+
+def compile_positional(func, nargs):
+    """ ``func(self, p)`` rewritten as ``f(self, v1, ..., vn)``, or None """
+    key = (func, nargs)
+    if key in _compiled:
+        return _compiled[key]
+    _compiled[key] = ret = _compile(func, nargs)
+    return ret
+
+
+def rewrite_action(func, nargs):
+    """ The ``ast.FunctionDef`` of ``func`` in the positional convention.
+
+    Its arguments are ``self, _p1, ..., _pn`` and its body returns the
+    value the original stored in ``p[0]``. Returns None if ``func`` cannot
+    be rewritten.
+    """
+    code = getattr(func, '__code__', None)
+    if code is None or code.co_freevars or code.co_argcount != 2:
+        return None
+    try:
+        source = textwrap.dedent(inspect.getsource(func))
+    except (OSError, TypeError):
+        return None
+    node = ast.parse(source).body[0]
+    if not isinstance(node, ast.FunctionDef):
+        return None
+    p = node.args.args[1].arg
+    body = [stmt for stmt in node.body
+            if not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant))]
+
+    rewrite = _Rewrite(p, nargs)
+    body = [rewrite.visit(stmt) for stmt in body]
+    if not rewrite.ok:
+        return None
+    if (len(body) == 1 and isinstance(body[0], ast.Assign) and len(body[0].targets) == 1 and
+            isinstance(body[0].targets[0], ast.Name) and body[0].targets[0].id == '_p0'):
+        # The common ``p[0] = expr`` becomes ``return expr``.
+        body = [ast.Return(body[0].value)]
+    else:
+        body = ([ast.Assign([ast.Name('_p0', ast.Store())], ast.Constant(None))] + body +
+                [ast.Return(ast.Name('_p0', ast.Load()))])
+
+    args = [node.args.args[0]] + [ast.arg('_p%d' % k) for k in range(1, nargs + 1)]
+    node.args = ast.arguments(posonlyargs=[], args=args, vararg=None, kwonlyargs=[],
+                              kw_defaults=[], kwarg=None, defaults=[])
+    node.body = body
+    node.decorator_list = []
+    return node
+
+
+def _compile(func, nargs):
+    node = rewrite_action(func, nargs)
+    if node is None:
+        return None
+    code = func.__code__
+    module = ast.fix_missing_locations(ast.Module([node], type_ignores=[]))
+    ast.increment_lineno(module, code.co_firstlineno - 1)
+    namespace = {}
+    exec(compile(module, code.co_filename, 'exec'), func.__globals__, namespace)
+    ret = namespace[node.name]
+    ret.__qualname__ = func.__qualname__
+    return ret
+
+
+def positional_action(parser, name, nargs, convention=POSITIONAL):
+    """ Bound callable of ``nargs`` positional values for ``parser.name`` """
+    action = getattr(parser, name)
+    if convention == POSITIONAL and name not in vars(parser):
+        func = getattr(type(parser), name)
+        compiled = compile_positional(func, nargs)
+        if compiled is not None:
+            return types.MethodType(compiled, parser)
+    return adapter(action)
@@ -19,6 +19,8 @@ from __future__ import print_function
 import sys
 import re
 
+from bitvec import decode_literal
+
 
 class Node(object):
     """ Abstact class for every element in parser """
@@ -258,7 +260,11 @@ class Constant(Value):
 
 
 class IntConst(Constant):
-    pass
+
+    @property
+    def decoded(self):
+        """ Width, signedness and 4-state bits of the literal as a BitVector """
+        return decode_literal(self.value)
 
 
 class FloatConst(Constant):
@@ -0,0 +1,157 @@
+"""
+   asyncio entry points for lexing and parsing.
+
+   ``lex_async`` and ``parse_async`` run ``VerilogLexerPlex`` and the
+   parser in an executor, so a long parse does not block the event loop.
+   Parsing pulls tokens from the lexer as it goes, and every ``check_every``
+   tokens the worker looks at a ``threading.Event``; once it is set the work
+   stops with ``ParseCancelled``. The event is set when the awaiting task is
+   cancelled, and a caller can pass its own to abort a stale parse when a
+   newer edit arrives.
+
+   The parse runs on ``lrcompile.shared_parser``, whose tables are shared
+   by every worker thread, with a fresh ``VerilogParser.context`` per call.
+   Its generated module is kept in ``outputdir``, by default
+   ``lrcompile.cache_dir()``.
+"""
+
+import asyncio
+import threading
+import itertools
+import concurrent.futures
+
+from lex import VerilogLexerPlex
+from par_lalr import VerilogParser
+from lrcompile import shared_parser
+
+
+CHECK_EVERY = 1024
+
+
+class ParseCancelled(Exception):
+    pass
+
+
+def _raise_error(msg, line, column):
+    raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+
+def _checked(tokens, cancel, check_every):
+    """ Yield ``tokens``, raising ``ParseCancelled`` once ``cancel`` is set """
+    it = iter(tokens)
+    while True:
+        if cancel is not None and cancel.is_set():
+            raise ParseCancelled()
+        chunk = list(itertools.islice(it, check_every))
+        if not chunk:
+            return
+        yield from chunk
+
+
+def lex(text, error_func=None, cancel=None, check_every=CHECK_EVERY):
+    """ Token list of ``text``; the worker of ``lex_async`` """
+    lexer = VerilogLexerPlex(error_func=error_func or _raise_error)
+    lexer.input(text)
+    return list(_checked(lexer, cancel, check_every))
+
+
+def parse(text, filename='__FILE__', error_func=None, cancel=None, check_every=CHECK_EVERY,
+          outputdir=None):
+    """ AST of ``text``; the worker of ``parse_async`` """
+    lexer = VerilogLexerPlex(error_func=error_func or _raise_error)
+    lexer.input(text)
+    engine = shared_parser(VerilogParser, outputdir=outputdir)
+    return engine.parse(_checked(lexer, cancel, check_every), VerilogParser.context(filename))
+
+
+async def _run(executor, cancel, func, *args):
+    loop = asyncio.get_running_loop()
+    if cancel is None:
+        cancel = threading.Event()
+    if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+        # An Event does not cross processes: a cancelled task only drops
+        # the result there.
+        future = loop.run_in_executor(executor, func, *(args + (None,)))
+    else:
+        future = loop.run_in_executor(executor, func, *(args + (cancel,)))
+    try:
+        return await future
+    except asyncio.CancelledError:
+        cancel.set()
+        raise
+
+
+async def lex_async(text, executor=None, cancel=None, check_every=CHECK_EVERY):
+    """ Lex ``text`` in ``executor`` (the loop's default if None).
+
+    ``cancel`` does not reach a ``ProcessPoolExecutor``: there the lexer
+    runs to the end and only its result is dropped.
+    """
+    return await _run(executor, cancel, _lex_worker, text, check_every)
+
+
+async def parse_async(text, filename='__FILE__', executor=None, cancel=None,
+                      check_every=CHECK_EVERY, outputdir=None):
+    """ Lex and parse ``text`` in ``executor`` (the loop's default if None).
+
+    Raises ``ParseCancelled`` if ``cancel`` is set before the parse is done;
+    the worker stops within ``check_every`` tokens. ``cancel`` does not
+    reach a ``ProcessPoolExecutor``: there the parse runs to the end and
+    only its result is dropped.
+    """
+    return await _run(executor, cancel, _parse_worker, text, filename, check_every, outputdir)
+
+
+# The workers are module level so that a ProcessPoolExecutor can pickle them.
+def _lex_worker(text, check_every, cancel):
+    return lex(text, cancel=cancel, check_every=check_every)
+
+
+def _parse_worker(text, filename, check_every, outputdir, cancel):
+    return parse(text, filename, cancel=cancel, check_every=check_every, outputdir=outputdir)
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import time
+    import tempfile
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__),
+                                                              'verilog_example_1.v')
+    with open(path) as fd:
+        text = fd.read()
+    outputdir = tempfile.mkdtemp()
+
+    async def main():
+        # Warm the shared tables first.
+        await parse_async(text, outputdir=outputdir)
+
+        ticks = []
+
+        async def heartbeat():
+            while True:
+                ticks.append(time.perf_counter())
+                await asyncio.sleep(0.001)
+
+        beat = asyncio.ensure_future(heartbeat())
+        big = text * 50
+        start = time.perf_counter()
+        await parse_async(big, outputdir=outputdir)
+        elapsed = time.perf_counter() - start
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        print('parse of %d bytes: %.1f ms, longest event loop stall %.1f ms' %
+              (len(big), elapsed * 1e3, max(gaps) * 1e3 if gaps else 0.0))
+
+        cancel = threading.Event()
+        task = asyncio.ensure_future(parse_async(big, cancel=cancel, outputdir=outputdir))
+        await asyncio.sleep(0.01)
+        start = time.perf_counter()
+        cancel.set()
+        try:
+            await task
+        except ParseCancelled:
+            print('stale parse cancelled after %.1f ms' % ((time.perf_counter() - start) * 1e3))
+        beat.cancel()
+
+    asyncio.run(main())
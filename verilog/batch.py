@@ -0,0 +1,178 @@
+"""
+   Batch parsing of many small sources.
+
+   ``parse_many`` runs every source through one ``VerilogLexerPlex`` and one
+   ``VerilogParser.context``, resetting both between inputs instead of
+   building new objects, on the process-wide ``lrcompile.shared_parser``.
+   Results come back as an iterator, in input order, one ``BatchResult``
+   per source. A source that fails to lex or parse yields its diagnostic
+   and the batch continues.
+
+   With ``processes`` the sources are sent in chunks to a
+   ``multiprocessing.Pool`` whose workers each keep their own lexer and
+   context; the ASTs travel back pickled. ``BatchStats`` adds up per-item
+   times and the aggregate throughput. The generated parser module is kept
+   in ``outputdir``, by default ``lrcompile.cache_dir()``.
+"""
+
+import sys
+import time
+import itertools
+from collections import namedtuple
+
+from lex import VerilogLexerPlex
+from par_lalr import VerilogParser
+from lrcompile import shared_parser
+
+
+BatchResult = namedtuple('BatchResult', ('name', 'ast', 'error', 'seconds'))
+
+
+class BatchStats(object):
+    """ Per-item and aggregate throughput of ``parse_many`` """
+
+    def __init__(self):
+        self.items = 0
+        self.failures = 0
+        self.chars = 0
+        self.busy = 0.0         # sum of the per-item parse times
+        self.slowest = None     # (seconds, name)
+        self.start = None
+        self.end = None
+
+    def add(self, result, chars):
+        self.items += 1
+        self.chars += chars
+        self.busy += result.seconds
+        if result.error is not None:
+            self.failures += 1
+        if self.slowest is None or result.seconds > self.slowest[0]:
+            self.slowest = (result.seconds, result.name)
+
+    @property
+    def wall(self):
+        return (self.end or time.perf_counter()) - self.start if self.start else 0.0
+
+    def show(self, buf=sys.stdout):
+        wall = self.wall or 1e-9
+        buf.write('items:           %d (%d failed)\n' % (self.items, self.failures))
+        buf.write('characters:      %d\n' % self.chars)
+        buf.write('wall time:       %.6fs\n' % wall)
+        buf.write('throughput:      %.1f items/s, %.1f kchars/s\n' %
+                  (self.items / wall, self.chars / wall / 1e3))
+        if self.items:
+            buf.write('per item:        %.1f us mean\n' % (self.busy / self.items * 1e6))
+            buf.write('slowest:         %.1f us (%s)\n' % (self.slowest[0] * 1e6, self.slowest[1]))
+
+
+def _raise_error(msg, line, column):
+    raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+
+class _Batch(object):
+    """ One lexer and one parser context, reused for every source """
+
+    def __init__(self, outputdir=None):
+        self.lexer = VerilogLexerPlex(error_func=_raise_error)
+        self.context = VerilogParser.context()
+        self.engine = shared_parser(VerilogParser, outputdir=outputdir)
+
+    def parse(self, name, text):
+        start = time.perf_counter()
+        self.lexer.reset(name)
+        self.context.reset(name)
+        self.lexer.input(text)
+        try:
+            ast = self.engine.parse(self.lexer, self.context)
+            error = None
+        except Exception as e:
+            ast = None
+            error = '%s: %s' % (type(e).__name__, e)
+        return BatchResult(name, ast, error, time.perf_counter() - start)
+
+
+_worker = None
+
+
+def _init_worker(outputdir):
+    global _worker
+    _worker = _Batch(outputdir)
+
+
+def _parse_chunk(chunk):
+    return [(_worker.parse(name, text), len(text)) for name, text in chunk]
+
+
+def _named(sources):
+    for i, source in enumerate(sources):
+        if isinstance(source, str):
+            yield '<source %d>' % i, source
+        else:
+            yield source
+
+
+def parse_many(sources, processes=None, chunksize=256, stats=None, outputdir=None):
+    """ Yield a ``BatchResult`` per source, in order.
+
+    ``sources`` holds source texts or ``(name, text)`` pairs and may be a
+    generator. With ``processes`` (a count, or 0 for one per CPU) chunks of
+    ``chunksize`` sources are parsed in worker processes.
+    """
+    items = _named(sources)
+    if stats is not None:
+        stats.start = time.perf_counter()
+    try:
+        if processes is None:
+            batch = _Batch(outputdir)
+            for name, text in items:
+                result = batch.parse(name, text)
+                if stats is not None:
+                    stats.add(result, len(text))
+                yield result
+            return
+
+        import multiprocessing
+        # Make sure the generated parser module exists before the workers
+        # look for it.
+        shared_parser(VerilogParser, outputdir=outputdir)
+        chunks = iter(lambda: list(itertools.islice(items, chunksize)), [])
+        with multiprocessing.Pool(processes or None, _init_worker, (outputdir,)) as pool:
+            for results in pool.imap(_parse_chunk, chunks):
+                for result, chars in results:
+                    if stats is not None:
+                        stats.add(result, chars)
+                    yield result
+    finally:
+        if stats is not None:
+            stats.end = time.perf_counter()
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    outputdir = tempfile.mkdtemp()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    sources = [('gen%d.v' % i,
+                'module gen%d(input a, input b, output y);\n'
+                '  wire t;\n  assign t = a & b;\n  assign y = t ^ %d;\n'
+                'endmodule\n' % (i, i % 2)) for i in range(count)]
+
+    def error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    shared_parser(VerilogParser, outputdir=outputdir)
+    start = time.perf_counter()
+    for name, text in sources:
+        lexer = VerilogLexerPlex(error_func=error)
+        lexer.input(text)
+        shared_parser(VerilogParser, outputdir=outputdir).parse(lexer, VerilogParser.context(name))
+    fresh = time.perf_counter() - start
+    print('fresh lexer and context per source: %.1f items/s' % (count / fresh))
+
+    for processes in (None, os.cpu_count()):
+        stats = BatchStats()
+        for result in parse_many(sources, processes, stats=stats, outputdir=outputdir):
+            assert result.error is None, result.error
+        print('parse_many(processes=%s):' % processes)
+        stats.show()
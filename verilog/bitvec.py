@@ -0,0 +1,356 @@
+"""
+   4-state bit vectors for Verilog constants.
+
+   A ``BitVector`` keeps its bits in three Python ints used as bit sets:
+   ``value`` for 0/1 bits, ``xmask`` for x bits and ``zmask`` for z bits.
+   ``decode_literal`` turns a number lexeme such as ``8'hFF``, ``'bx01z`` or
+   ``32'sd5`` into a ``BitVector``; it is LRU-cached, so each distinct
+   literal text is only decoded once.
+"""
+
+import re
+from functools import lru_cache
+
+
+def _div(a, b):
+    # Verilog division truncates toward zero.
+    if b == 0:
+        return None
+    q = abs(a) // abs(b)
+    return -q if (a < 0) != (b < 0) else q
+
+
+def _pow(base, exp, width):
+    if exp >= 0:
+        return pow(base, exp, 1 << width)
+    if base == 0:
+        return None
+    if base == 1:
+        return 1
+    if base == -1:
+        return 1 if exp % 2 == 0 else -1
+    return 0
+
+
+class BitVector(object):
+    """ Fixed-width 4-state value """
+
+    __slots__ = ('width', 'signed', 'value', 'xmask', 'zmask')
+
+    def __init__(self, width, value=0, signed=False, xmask=0, zmask=0):
+        mask = (1 << width) - 1
+        self.width = width
+        self.signed = signed
+        self.xmask = xmask & mask
+        self.zmask = zmask & mask & ~self.xmask
+        self.value = value & mask & ~(self.xmask | self.zmask)
+
+    @classmethod
+    def from_int(cls, value, width=32, signed=True):
+        return cls(width, value, signed)
+
+    @classmethod
+    def unknown(cls, width, signed=False):
+        return cls(width, 0, signed, (1 << width) - 1)
+
+    @property
+    def mask(self):
+        return (1 << self.width) - 1
+
+    @property
+    def is_known(self):
+        return not (self.xmask or self.zmask)
+
+    def to_int(self):
+        if not self.is_known:
+            raise ValueError('value has x/z bits: %s' % self.literal())
+        if self.signed and self.value >> (self.width - 1) & 1:
+            return self.value - (1 << self.width)
+        return self.value
+
+    __int__ = to_int
+
+    def __index__(self):
+        return self.to_int()
+
+    def __eq__(self, other):
+        if not isinstance(other, BitVector):
+            return NotImplemented
+        return (self.width, self.signed, self.value, self.xmask, self.zmask) == \
+            (other.width, other.signed, other.value, other.xmask, other.zmask)
+
+    def __hash__(self):
+        return hash((self.width, self.signed, self.value, self.xmask, self.zmask))
+
+    def __repr__(self):
+        return 'BitVector(%s)' % self.literal()
+
+    def literal(self):
+        """ Verilog source text of this value """
+        sign = 's' if self.signed else ''
+        if self.is_known:
+            return "%d'%sh%x" % (self.width, sign, self.value)
+        bits = []
+        for i in range(self.width - 1, -1, -1):
+            if self.xmask >> i & 1:
+                bits.append('x')
+            elif self.zmask >> i & 1:
+                bits.append('z')
+            else:
+                bits.append('1' if self.value >> i & 1 else '0')
+        return "%d'%sb%s" % (self.width, sign, ''.join(bits))
+
+    # --------------------------------------------------------------------------
+    def resize(self, width, signed=None):
+        """ Truncate or extend to ``width`` (sign-extending signed values) """
+        signed = self.signed if signed is None else signed
+        if width <= self.width:
+            return BitVector(width, self.value, signed, self.xmask, self.zmask)
+        value, xmask, zmask = self.value, self.xmask, self.zmask
+        top = self.width - 1
+        fill = ((1 << width) - 1) ^ self.mask
+        if self.signed and self.width:
+            if xmask >> top & 1:
+                xmask |= fill
+            elif zmask >> top & 1:
+                zmask |= fill
+            elif value >> top & 1:
+                value |= fill
+        return BitVector(width, value, signed, xmask, zmask)
+
+    def _common(self, other):
+        width = max(self.width, other.width)
+        signed = self.signed and other.signed
+        return self.resize(width, signed), other.resize(width, signed), width, signed
+
+    def _arith(self, other, fn):
+        a, b, width, signed = self._common(other)
+        if not (a.is_known and b.is_known):
+            return BitVector.unknown(width, signed)
+        ret = fn(a.to_int(), b.to_int())
+        if ret is None:
+            return BitVector.unknown(width, signed)
+        return BitVector(width, ret, signed)
+
+    def add(self, other):
+        return self._arith(other, lambda a, b: a + b)
+
+    def sub(self, other):
+        return self._arith(other, lambda a, b: a - b)
+
+    def mul(self, other):
+        return self._arith(other, lambda a, b: a * b)
+
+    def div(self, other):
+        return self._arith(other, _div)
+
+    def mod(self, other):
+        return self._arith(other, lambda a, b: None if b == 0 else a - b * _div(a, b))
+
+    def pow(self, other):
+        if not (self.is_known and other.is_known):
+            return BitVector.unknown(self.width, self.signed)
+        ret = _pow(self.to_int(), other.to_int(), self.width)
+        if ret is None:
+            return BitVector.unknown(self.width, self.signed)
+        return BitVector(self.width, ret, self.signed)
+
+    def neg(self):
+        if not self.is_known:
+            return BitVector.unknown(self.width, self.signed)
+        return BitVector(self.width, -self.value, self.signed)
+
+    # --------------------------------------------------------------------------
+    def _shift(self, other, fn):
+        if not (self.is_known and other.is_known):
+            return BitVector.unknown(self.width, self.signed)
+        return fn(other.value)
+
+    def shl(self, other):
+        return self._shift(other, lambda n: BitVector(self.width, self.value << n, self.signed))
+
+    def shr(self, other):
+        return self._shift(other, lambda n: BitVector(self.width, self.value >> n, self.signed))
+
+    def ashl(self, other):
+        return self.shl(other)
+
+    def ashr(self, other):
+        if not self.signed:
+            return self.shr(other)
+        return self._shift(other, lambda n: BitVector(self.width, self.to_int() >> n, True))
+
+    # --------------------------------------------------------------------------
+    def _bits(self):
+        unknown = self.xmask | self.zmask
+        ones = self.value & ~unknown
+        zeros = self.mask & ~self.value & ~unknown
+        return ones, zeros
+
+    def band(self, other):
+        a, b, width, signed = self._common(other)
+        a1, a0 = a._bits()
+        b1, b0 = b._bits()
+        ones, zeros = a1 & b1, a0 | b0
+        return BitVector(width, ones, signed, a.mask & ~(ones | zeros))
+
+    def bor(self, other):
+        a, b, width, signed = self._common(other)
+        a1, a0 = a._bits()
+        b1, b0 = b._bits()
+        ones, zeros = a1 | b1, a0 & b0
+        return BitVector(width, ones, signed, a.mask & ~(ones | zeros))
+
+    def bxor(self, other):
+        a, b, width, signed = self._common(other)
+        unknown = a.xmask | a.zmask | b.xmask | b.zmask
+        return BitVector(width, a.value ^ b.value, signed, unknown)
+
+    def bxnor(self, other):
+        return self.bxor(other).bnot()
+
+    def bnot(self):
+        ones, zeros = self._bits()
+        return BitVector(self.width, zeros, self.signed, self.xmask | self.zmask)
+
+    # --------------------------------------------------------------------------
+    def truth(self):
+        """ 1, 0 or None (x) as a condition """
+        ones, zeros = self._bits()
+        if ones:
+            return 1
+        if zeros == self.mask:
+            return 0
+        return None
+
+    @staticmethod
+    def _bit(v):
+        return BitVector(1, 0, False, 1) if v is None else BitVector(1, int(v))
+
+    def lnot(self):
+        t = self.truth()
+        return self._bit(None if t is None else not t)
+
+    def land(self, other):
+        a, b = self.truth(), other.truth()
+        if a == 0 or b == 0:
+            return self._bit(0)
+        return self._bit(None if a is None or b is None else 1)
+
+    def lor(self, other):
+        a, b = self.truth(), other.truth()
+        if a == 1 or b == 1:
+            return self._bit(1)
+        return self._bit(None if a is None or b is None else 0)
+
+    def _compare(self, other, fn):
+        a, b, width, signed = self._common(other)
+        if not (a.is_known and b.is_known):
+            return self._bit(None)
+        return self._bit(fn(a.to_int(), b.to_int()))
+
+    def lt(self, other):
+        return self._compare(other, lambda a, b: a < b)
+
+    def gt(self, other):
+        return self._compare(other, lambda a, b: a > b)
+
+    def le(self, other):
+        return self._compare(other, lambda a, b: a <= b)
+
+    def ge(self, other):
+        return self._compare(other, lambda a, b: a >= b)
+
+    def eq(self, other):
+        return self._compare(other, lambda a, b: a == b)
+
+    def ne(self, other):
+        return self._compare(other, lambda a, b: a != b)
+
+    def eql(self, other):
+        a, b, width, signed = self._common(other)
+        return self._bit((a.value, a.xmask, a.zmask) == (b.value, b.xmask, b.zmask))
+
+    def nel(self, other):
+        return self._bit(not self.eql(other).value)
+
+    # --------------------------------------------------------------------------
+    def _reduce(self, op):
+        ret = BitVector(1, self.value, False, self.xmask, self.zmask)
+        for i in range(1, self.width):
+            ret = op(ret, BitVector(1, self.value >> i, False, self.xmask >> i, self.zmask >> i))
+        return BitVector(1, ret.value, False, ret.xmask, ret.zmask)
+
+    def rand(self):
+        return self._reduce(BitVector.band)
+
+    def ror(self):
+        return self._reduce(BitVector.bor)
+
+    def rxor(self):
+        unknown = self.xmask | self.zmask
+        if unknown:
+            return self._bit(None)
+        return self._bit(bin(self.value).count('1') & 1)
+
+    def rnand(self):
+        return self.rand().bnot()
+
+    def rnor(self):
+        return self.ror().bnot()
+
+    def rxnor(self):
+        return self.rxor().bnot()
+
+
+# ------------------------------------------------------------------------------
+_LITERAL = re.compile(r"^\s*([0-9]*)\s*'\s*([sS]?)([bBoOhHdD])\s*([0-9a-fA-FxXzZ?]+)\s*$")
+_BITS = {'b': 1, 'o': 3, 'h': 4}
+
+
+@lru_cache(maxsize=1 << 16)
+def decode_literal(text):
+    """ Decode a Verilog integer literal into a ``BitVector`` """
+    text = str(text).replace('_', '')
+    if "'" not in text:
+        value = int(text)
+        return BitVector(max(32, value.bit_length() + 1), value, True)
+
+    m = _LITERAL.match(text)
+    if m is None:
+        raise ValueError('invalid integer literal: %s' % text)
+    size, sign, base, digits = m.groups()
+    width = int(size) if size else 32
+    signed = bool(sign)
+    base = base.lower()
+    digits = digits.lower().replace('?', 'z')
+
+    if base == 'd':
+        if digits[0] == 'x':
+            return BitVector(width, 0, signed, xmask=(1 << width) - 1)
+        if digits[0] == 'z':
+            return BitVector(width, 0, signed, zmask=(1 << width) - 1)
+        return BitVector(width, int(digits), signed)
+
+    step = _BITS[base]
+    full = (1 << step) - 1
+    value = xmask = zmask = 0
+    for c in digits:
+        value <<= step
+        xmask <<= step
+        zmask <<= step
+        if c == 'x':
+            xmask |= full
+        elif c == 'z':
+            zmask |= full
+        else:
+            value |= int(c, 16)
+    nbits = step * len(digits)
+    if nbits < width:
+        # An x or z in the leftmost digit extends over the missing bits.
+        fill = ((1 << width) - 1) ^ ((1 << nbits) - 1)
+        if digits[0] == 'x':
+            xmask |= fill
+        elif digits[0] == 'z':
+            zmask |= fill
+    return BitVector(width, value, signed, xmask, zmask)
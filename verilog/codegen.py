@@ -0,0 +1,515 @@
+"""
+   Verilog code generator.
+
+   ``VerilogCodegen`` writes any ``astnode`` tree back as Verilog source. The
+   output is collected into chunks and written to the target file object
+   once ``chunk_size`` characters have accumulated, so memory use stays flat
+   no matter how large the netlist is. Expressions are parenthesized only
+   where ``VerilogParser.precedence`` requires it.
+"""
+
+import io
+import sys
+
+from astnode import *
+from par_lalr import VerilogParser
+
+
+OPERATORS = {
+    # class: (precedence token, text)
+    Power: ('POWER', '**'),
+    Times: ('TIMES', '*'),
+    Divide: ('DIVIDE', '/'),
+    Mod: ('MOD', '%'),
+    Plus: ('PLUS', '+'),
+    Minus: ('MINUS', '-'),
+    Sll: ('LSHIFT', '<<'),
+    Srl: ('RSHIFT', '>>'),
+    Sla: ('LSHIFTA', '<<<'),
+    Sra: ('RSHIFTA', '>>>'),
+    LessThan: ('LT', '<'),
+    GreaterThan: ('GT', '>'),
+    LessEq: ('LE', '<='),
+    GreaterEq: ('GE', '>='),
+    Eq: ('EQ', '=='),
+    NotEq: ('NE', '!='),
+    Eql: ('EQL', '==='),
+    NotEql: ('NEL', '!=='),
+    And: ('AND', '&'),
+    Xor: ('XOR', '^'),
+    Xnor: ('XNOR', '~^'),
+    Or: ('OR', '|'),
+    Land: ('LAND', '&&'),
+    Lor: ('LOR', '||'),
+    Uplus: ('UPLUS', '+'),
+    Uminus: ('UMINUS', '-'),
+    Ulnot: ('ULNOT', '!'),
+    Unot: ('UNOT', '~'),
+    Uand: ('UAND', '&'),
+    Unand: ('UNAND', '~&'),
+    Uor: ('UOR', '|'),
+    Unor: ('UNOR', '~|'),
+    Uxor: ('UXOR', '^'),
+    Uxnor: ('UXNOR', '~^'),
+}
+
+
+def _precedence_levels(precedence):
+    """ ``{token: (level, assoc)}``; level 0 is reserved for ``?:`` """
+    ret = {}
+    for level, row in enumerate(precedence, 1):
+        for token in row[1:]:
+            ret[token] = (level, row[0])
+    return ret
+
+
+_LEVELS = _precedence_levels(VerilogParser.precedence)
+PRECEDENCE = dict((cls, _LEVELS[tok]) for cls, (tok, _) in OPERATORS.items())
+ATOM = (len(VerilogParser.precedence) + 1, 'left')
+COND = (0, 'right')
+
+_DECL_KEYWORDS = [
+    (Input, 'input'),
+    (Output, 'output'),
+    (Inout, 'inout'),
+    (Tri, 'tri'),
+    (Wire, 'wire'),
+    (Reg, 'reg'),
+    (Genvar, 'genvar'),
+    (Integer, 'integer'),
+    (Real, 'real'),
+]
+
+
+def _keyword(var):
+    for cls, kw in _DECL_KEYWORDS:
+        if type(var) is cls:
+            return kw
+    raise TypeError('not a declaration: %s' % type(var).__name__)
+
+
+class VerilogCodegen(object):
+    """ Streams Verilog text for ``astnode`` trees to a file object """
+
+    def __init__(self, buf=sys.stdout, chunk_size=1 << 16, indent='  '):
+        self.buf = buf
+        self.chunk_size = chunk_size
+        self.indent = indent
+        self._parts = []
+        self._size = 0
+        self._depth = 0
+        self._dispatch = {}
+
+    # --------------------------------------------------------------------------
+    def _emit(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.chunk_size:
+            self.flush()
+
+    def _line(self, text):
+        self._emit(self.indent * self._depth + text + '\n')
+
+    def flush(self):
+        if self._parts:
+            self.buf.write(''.join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def write(self, node):
+        """ Write ``node`` (any item, statement or expression) and flush """
+        self.visit(node)
+        self.flush()
+
+    def visit(self, node):
+        cls = type(node)
+        method = self._dispatch.get(cls)
+        if method is None:
+            for klass in cls.__mro__:
+                method = getattr(self, 'visit_' + klass.__name__, None)
+                if method is not None:
+                    break
+            else:
+                raise TypeError('cannot generate code for %s' % cls.__name__)
+            self._dispatch[cls] = method
+        method(node)
+
+    # --------------------------------------------------------------------------
+    # Expressions are small, so they are built as strings.
+    def expr(self, node, parent=COND, side=None):
+        """ Text of ``node``, parenthesized if ``parent`` binds tighter """
+        cls = type(node)
+        if cls in PRECEDENCE:
+            level, assoc = mine = PRECEDENCE[cls]
+            if isinstance(node, UnaryOperator):
+                right = node.right
+                text = self.expr(right, mine, 'unary')
+                if isinstance(right, UnaryOperator) and not text.startswith('('):
+                    text = '(' + text + ')'
+                text = OPERATORS[cls][1] + text
+            else:
+                text = '%s %s %s' % (self.expr(node.left, mine, 'left'), OPERATORS[cls][1],
+                                     self.expr(node.right, mine, 'right'))
+        elif cls is Cond:
+            mine = COND
+            text = '%s ? %s : %s' % (self.expr(node.cond, mine, 'left'),
+                                     self.expr(node.true_value),
+                                     self.expr(node.false_value, mine, 'right'))
+        else:
+            return self.atom(node)
+
+        if self._needs_parens(mine, parent, side):
+            return '(' + text + ')'
+        return text
+
+    @staticmethod
+    def _needs_parens(mine, parent, side):
+        if side is None:
+            return False
+        if mine[0] != parent[0]:
+            return mine[0] < parent[0]
+        if side == 'unary':
+            return False
+        # Same level: only the side matching the associativity is free.
+        return side != parent[1]
+
+    def atom(self, node):
+        cls = type(node)
+        if cls is IntConst or cls is FloatConst:
+            return str(node.value)
+        if cls is StringConst:
+            return '"%s"' % node.value
+        if cls is Identifier:
+            if node.scope is None:
+                return node.name
+            return self.scope(node.scope) + node.name
+        if isinstance(node, (Rvalue, Lvalue)):
+            return self.expr(node.var)
+        if isinstance(node, Concat):
+            return '{' + ', '.join(self.expr(c) for c in node.list) + '}'
+        if cls is Repeat:
+            return '{%s%s}' % (self.expr(node.times, ATOM, 'unary'), self.atom(node.value))
+        if cls is Pointer:
+            return '%s[%s]' % (self.atom(node.var), self.expr(node.ptr))
+        if cls is Partselect:
+            return '%s[%s:%s]' % (self.atom(node.var), self.expr(node.msb), self.expr(node.lsb))
+        if cls is FunctionCall:
+            return '%s(%s)' % (self.atom(node.name), ', '.join(self.expr(a) for a in node.args))
+        if cls is SystemCall:
+            if not node.args:
+                return '$' + node.syscall
+            return '$%s(%s)' % (node.syscall, ', '.join(self.expr(a) for a in node.args))
+        if isinstance(node, Width):
+            return '[%s:%s]' % (self.expr(node.msb), self.expr(node.lsb))
+        if cls is Dimensions:
+            return ''.join(self.atom(l) for l in node.lengths)
+        if cls is DelayStatement:
+            if isinstance(node.delay, (Identifier, IntConst, FloatConst)):
+                return '#' + self.atom(node.delay)
+            return '#(' + self.expr(node.delay) + ')'
+        if cls is SensList:
+            return self.senslist(node)
+        raise TypeError('not an expression: %s' % cls.__name__)
+
+    def scope(self, scope):
+        ret = []
+        for label in scope.labellist:
+            if label.loop is None:
+                ret.append(label.name + '.')
+            else:
+                ret.append('%s[%s].' % (label.name, self.expr(label.loop)))
+        return ''.join(ret)
+
+    def senslist(self, node):
+        if len(node.list) == 1 and node.list[0].type == 'all':
+            return '@(*)'
+        sens = []
+        for s in node.list:
+            if s.type in ('posedge', 'negedge'):
+                sens.append('%s %s' % (s.type, self.expr(s.sig)))
+            else:
+                sens.append(self.expr(s.sig))
+        return '@(' + ' or '.join(sens) + ')'
+
+    # --------------------------------------------------------------------------
+    def visit_Node(self, node):
+        # Bare expressions, e.g. when generating a single subtree.
+        self._line(self.expr(node))
+
+    def visit_Source(self, node):
+        self.visit(node.description)
+
+    def visit_Description(self, node):
+        for i, definition in enumerate(node.definitions):
+            if i:
+                self._emit('\n')
+            self.visit(definition)
+
+    def visit_Pragma(self, node):
+        entry = node.entry
+        if entry.value is None:
+            self._line('(* %s *)' % entry.name)
+        else:
+            self._line('(* %s = %s *)' % (entry.name, self.expr(entry.value)))
+
+    def visit_ModuleDef(self, node):
+        head = 'module ' + node.name
+        params = [self.param(p) for d in (node.paramlist.params if node.paramlist else ())
+                  for p in d.list]
+        if params:
+            head += ' #(\n' + ',\n'.join(self.indent + p for p in params) + '\n)'
+        ports = node.portlist.ports if node.portlist else ()
+        if ports:
+            head += '\n(\n' + ',\n'.join(self.indent + self.port(p) for p in ports) + '\n)'
+        self._line(head + ';')
+        self._depth += 1
+        for item in node.items or ():
+            self.visit(item)
+        self._depth -= 1
+        self._line('endmodule')
+
+    def port(self, node):
+        if isinstance(node, Port):
+            return node.name
+        first = node.first
+        head = _keyword(first)
+        if node.second is not None:
+            head += ' ' + _keyword(node.second)
+        return self.variable(head, first)
+
+    def variable(self, head, var):
+        parts = [head]
+        if var.signed and type(var) is not Integer:
+            parts.append('signed')
+        if var.width is not None and type(var) not in (Integer, Real, Genvar):
+            parts.append(self.atom(var.width))
+        parts.append(var.name)
+        text = ' '.join(parts)
+        if var.dimensions is not None:
+            text += ' ' + self.atom(var.dimensions)
+        return text
+
+    def param(self, node):
+        parts = ['localparam' if type(node) is Localparam else 'parameter']
+        if node.signed:
+            parts.append('signed')
+        if node.width is not None:
+            parts.append(self.atom(node.width))
+        parts.append('%s = %s' % (node.name, self.expr(node.value)))
+        return ' '.join(parts)
+
+    def visit_Paramlist(self, node):
+        for decl in node.params:
+            self.visit(decl)
+
+    def visit_Decl(self, node):
+        items = list(node.list)
+        i = 0
+        while i < len(items):
+            item = items[i]
+            if isinstance(item, Supply):
+                self._line('supply%s %s%s;' % (item.value.value,
+                                               self.atom(item.width) + ' ' if item.width else '',
+                                               item.name))
+            elif isinstance(item, Parameter):
+                self._line(self.param(item) + ';')
+            elif isinstance(item, Assign):
+                self.visit(item)
+            else:
+                # ``output reg q`` and ``wire w = e`` arrive as several
+                # entries for the same name.
+                head = _keyword(item)
+                while i + 1 < len(items) and isinstance(items[i + 1], Variable) and \
+                        items[i + 1].name == item.name:
+                    i += 1
+                    head += ' ' + _keyword(items[i])
+                text = self.variable(head, item)
+                if i + 1 < len(items) and isinstance(items[i + 1], Assign) and \
+                        items[i + 1].left.var.name == item.name and items[i + 1].ldelay is None:
+                    i += 1
+                    text += ' = ' + self.expr(items[i].right)
+                elif item.value is not None:
+                    text += ' = ' + self.expr(item.value)
+                self._line(text + ';')
+            i += 1
+
+    def visit_Assign(self, node):
+        self._line('assign %s;' % self.substitution(node, '='))
+
+    def substitution(self, node, op):
+        text = self.expr(node.left)
+        if node.ldelay is not None:
+            text = self.atom(node.ldelay) + ' ' + text
+        text += ' ' + op + ' '
+        if node.rdelay is not None:
+            text += self.atom(node.rdelay) + ' '
+        return text + self.expr(node.right)
+
+    def visit_Always(self, node):
+        kw = {AlwaysFF: 'always_ff', AlwaysComb: 'always_comb',
+              AlwaysLatch: 'always_latch'}.get(type(node), 'always')
+        head = kw
+        if type(node) is not AlwaysComb:
+            head += ' ' + self.senslist(node.sens_list)
+        self.statement(head, node.statement)
+
+    def visit_Initial(self, node):
+        self.statement('initial', node.statement)
+
+    def statement(self, head, node):
+        """ ``head`` followed by a statement, keeping ``begin`` on its line """
+        if isinstance(node, (Block, ParallelBlock)):
+            self._block(head + ' ' if head else '', node)
+        elif node is None:
+            self._line(head + ';')
+        else:
+            if head:
+                self._line(head)
+            self._depth += 1
+            self.visit(node)
+            self._depth -= 1
+
+    def _block(self, prefix, node):
+        begin, end = ('fork', 'join') if isinstance(node, ParallelBlock) else ('begin', 'end')
+        self._line(prefix + begin + (' : ' + node.scope if node.scope else ''))
+        self._depth += 1
+        for s in node.statements or ():
+            self.visit(s)
+        self._depth -= 1
+        self._line(end)
+
+    def visit_Block(self, node):
+        self._block('', node)
+
+    visit_ParallelBlock = visit_Block
+
+    def visit_BlockingSubstitution(self, node):
+        self._line(self.substitution(node, '=') + ';')
+
+    def visit_NonblockingSubstitution(self, node):
+        self._line(self.substitution(node, '<=') + ';')
+
+    def visit_IfStatement(self, node):
+        self._if('if', node)
+        false = node.false_statement
+        while isinstance(false, IfStatement):
+            self._if('else if', false)
+            false = false.false_statement
+        if false is not None:
+            self.statement('else', false)
+
+    def _if(self, kw, node):
+        true = node.true_statement
+        if node.false_statement is not None and self._dangling(true):
+            # Keep the else attached to this if, not to the nested one.
+            true = Block((true,), lineno=true.lineno)
+        self.statement('%s (%s)' % (kw, self.expr(node.cond)), true)
+
+    @staticmethod
+    def _dangling(node):
+        while isinstance(node, IfStatement):
+            if node.false_statement is None:
+                return True
+            node = node.false_statement
+        return False
+
+    def visit_ForStatement(self, node):
+        pre = self.substitution(node.pre, '=') if node.pre is not None else ''
+        cond = self.expr(node.cond) if node.cond is not None else ''
+        post = self.substitution(node.post, '=') if node.post is not None else ''
+        self.statement('for (%s; %s; %s)' % (pre, cond, post), node.statement)
+
+    def visit_WhileStatement(self, node):
+        self.statement('while (%s)' % self.expr(node.cond), node.statement)
+
+    def visit_WaitStatement(self, node):
+        self.statement('wait (%s)' % self.expr(node.cond), node.statement)
+
+    def visit_ForeverStatement(self, node):
+        self.statement('forever', node.statement)
+
+    def visit_EventStatement(self, node):
+        self._line(self.senslist(node.senslist) + ';')
+
+    def visit_SingleStatement(self, node):
+        if isinstance(node.statement, Disable):
+            self.visit(node.statement)
+        else:
+            self._line(self.atom(node.statement) + ';')
+
+    def visit_Disable(self, node):
+        self._line('disable %s;' % node.dest)
+
+    def visit_CaseStatement(self, node):
+        kw = {CasexStatement: 'casex', CasezStatement: 'casez',
+              UniqueCaseStatement: 'unique case'}.get(type(node), 'case')
+        self._line('%s (%s)' % (kw, self.expr(node.comp)))
+        self._depth += 1
+        for case in node.caselist:
+            if case.cond is None:
+                label = 'default:'
+            else:
+                label = ', '.join(self.expr(c) for c in case.cond) + ':'
+            self.statement(label, case.statement)
+        self._depth -= 1
+        self._line('endcase')
+
+    def visit_InstanceList(self, node):
+        head = node.module
+        if node.parameterlist:
+            head += ' #(%s)' % ', '.join(self._arg(p.paramname, p.argname)
+                                         for p in node.parameterlist)
+        bodies = []
+        for inst in node.instances:
+            body = inst.name
+            if inst.array is not None:
+                body += ' ' + self.atom(inst.array)
+            ports = ', '.join(self._arg(p.portname, p.argname) for p in inst.portlist or ())
+            bodies.append('%s(%s)' % (body + ' ' if body else '', ports))
+        self._line(head + ' ' + ', '.join(bodies) + ';')
+
+    def _arg(self, name, value):
+        if name is None:
+            return self.expr(value)
+        return '.%s(%s)' % (name, '' if value is None else self.expr(value))
+
+    def visit_Function(self, node):
+        self._line('function %s %s;' % (self.atom(node.retwidth), node.name))
+        self._depth += 1
+        for s in node.statement:
+            self.visit(s)
+        self._depth -= 1
+        self._line('endfunction')
+
+    def visit_Task(self, node):
+        self._line('task %s;' % node.name)
+        self._depth += 1
+        for s in node.statement:
+            self.visit(s)
+        self._depth -= 1
+        self._line('endtask')
+
+    def visit_TaskCall(self, node):
+        self._line('%s(%s);' % (self.atom(node.name), ', '.join(self.expr(a) for a in node.args)))
+
+    def visit_GenerateStatement(self, node):
+        self._line('generate')
+        self._depth += 1
+        for item in node.items:
+            self.visit(item)
+        self._depth -= 1
+        self._line('endgenerate')
+
+    def visit_EmbeddedCode(self, node):
+        self._emit(node.code)
+
+
+def generate(node, buf=sys.stdout, **kwargs):
+    """ Write the Verilog text of ``node`` to ``buf`` """
+    VerilogCodegen(buf, **kwargs).write(node)
+
+
+def to_source(node, **kwargs):
+    buf = io.StringIO()
+    generate(node, buf, **kwargs)
+    return buf.getvalue()
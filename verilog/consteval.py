@@ -0,0 +1,277 @@
+"""
+   Constant-expression evaluation and folding.
+
+   ``ConstEvaluator.module_params`` resolves the parameters and localparams
+   of a ``ModuleDef`` for one parameter binding and memoizes the result per
+   (module, binding). Each binding owns a ``ParamEnv`` whose expression cache
+   is keyed by node, so width and range expressions shared by many
+   declarations are only evaluated once per binding.
+
+   ``ConstEvaluator.fold`` replaces constant subtrees in place with
+   ``IntConst`` literals.
+"""
+
+from astnode import *
+from bitvec import BitVector, decode_literal
+
+
+class NotConstant(Exception):
+    pass
+
+
+BINARY_OPS = {
+    Power: BitVector.pow,
+    Times: BitVector.mul,
+    Divide: BitVector.div,
+    Mod: BitVector.mod,
+    Plus: BitVector.add,
+    Minus: BitVector.sub,
+    Sll: BitVector.shl,
+    Srl: BitVector.shr,
+    Sla: BitVector.ashl,
+    Sra: BitVector.ashr,
+    LessThan: BitVector.lt,
+    GreaterThan: BitVector.gt,
+    LessEq: BitVector.le,
+    GreaterEq: BitVector.ge,
+    Eq: BitVector.eq,
+    NotEq: BitVector.ne,
+    Eql: BitVector.eql,
+    NotEql: BitVector.nel,
+    And: BitVector.band,
+    Xor: BitVector.bxor,
+    Xnor: BitVector.bxnor,
+    Or: BitVector.bor,
+    Land: BitVector.land,
+    Lor: BitVector.lor,
+}
+
+UNARY_OPS = {
+    Uplus: lambda v: v,
+    Uminus: BitVector.neg,
+    Ulnot: BitVector.lnot,
+    Unot: BitVector.bnot,
+    Uand: BitVector.rand,
+    Unand: BitVector.rnand,
+    Uor: BitVector.ror,
+    Unor: BitVector.rnor,
+    Uxor: BitVector.rxor,
+    Uxnor: BitVector.rxnor,
+}
+
+
+def _clog2(v):
+    n = v.to_int()
+    return BitVector.from_int(0 if n <= 1 else (n - 1).bit_length())
+
+
+SYSTEM_FUNCS = {
+    'clog2': _clog2,
+    'signed': lambda v: v.resize(v.width, True),
+    'unsigned': lambda v: v.resize(v.width, False),
+}
+
+
+def to_bitvector(value):
+    if isinstance(value, BitVector):
+        return value
+    if isinstance(value, bool):
+        return BitVector(1, int(value))
+    if isinstance(value, int):
+        return BitVector.from_int(value)
+    if isinstance(value, str):
+        return decode_literal(value)
+    raise TypeError('not a constant value: %r' % (value,))
+
+
+class ParamEnv(object):
+    """ Values visible to constant expressions under one binding """
+
+    def __init__(self, values=None, parent=None):
+        self.values = dict(values or ())
+        self.parent = parent
+        self.memo = {}
+
+    def lookup(self, name):
+        env = self
+        while env is not None:
+            if name in env.values:
+                return env.values[name]
+            env = env.parent
+        raise NotConstant(name)
+
+    def child(self, values):
+        """ A nested scope, e.g. one generate-loop iteration """
+        return ParamEnv(values, self)
+
+    def key(self):
+        items = []
+        env = self
+        while env is not None:
+            items.extend(sorted(env.values.items(), key=lambda kv: kv[0]))
+            env = env.parent
+        return tuple(items)
+
+
+class ConstEvaluator(object):
+    """ Evaluates constant expressions of ``astnode`` trees """
+
+    def __init__(self):
+        self.bindings = {}
+
+    # --------------------------------------------------------------------------
+    def module_params(self, moduledef, overrides=None):
+        """ Return the ``ParamEnv`` of ``moduledef`` under ``overrides``.
+
+        ``overrides`` maps parameter names to ints, literals or BitVectors.
+        Localparams cannot be overridden. Results are memoized per module name
+        and binding.
+        """
+        overrides = dict((k, to_bitvector(v)) for k, v in (overrides or {}).items())
+        key = (moduledef.name, tuple(sorted(overrides.items(), key=lambda kv: kv[0])))
+        env = self.bindings.get(key)
+        if env is not None:
+            return env
+
+        env = ParamEnv()
+        decls = []
+        if moduledef.paramlist:
+            decls.extend(moduledef.paramlist.params)
+        decls.extend(item for item in moduledef.items or () if isinstance(item, Decl))
+        for decl in decls:
+            self.bind(decl, env, overrides)
+        self.bindings[key] = env
+        return env
+
+    def bind(self, decl, env, overrides=None):
+        """ Add the parameters and localparams of ``decl`` to ``env``.
+
+        A value that is not constant is left out; using it raises later.
+        """
+        for param in decl.list:
+            if not isinstance(param, Parameter):
+                continue
+            if type(param) is Parameter and overrides and param.name in overrides:
+                value = overrides[param.name]
+            else:
+                try:
+                    value = self.evaluate(param.value, env)
+                except NotConstant:
+                    continue
+            env.values[param.name] = self._param_type(param, value, env)
+
+    def _param_type(self, param, value, env):
+        if param.width is not None:
+            msb, lsb = self.range(param.width, env)
+            return value.resize(abs(msb - lsb) + 1, param.signed)
+        if param.signed and not value.signed:
+            return value.resize(value.width, True)
+        return value
+
+    # --------------------------------------------------------------------------
+    def evaluate(self, node, env=None):
+        """ Evaluate ``node`` to a ``BitVector`` or raise ``NotConstant`` """
+        if env is None:
+            return self._eval(node, None)
+        hit = env.memo.get(id(node))
+        if hit is not None and hit[0] is node:
+            return hit[1]
+        value = self._eval(node, env)
+        env.memo[id(node)] = (node, value)
+        return value
+
+    def value(self, node, env=None):
+        """ Evaluate ``node`` to a Python int """
+        try:
+            return self.evaluate(node, env).to_int()
+        except ValueError:
+            raise NotConstant(node)
+
+    def range(self, width, env=None):
+        """ ``(msb, lsb)`` of a ``Width``/``Length`` node as ints """
+        return self.value(width.msb, env), self.value(width.lsb, env)
+
+    def _eval(self, node, env):
+        cls = type(node)
+        op = BINARY_OPS.get(cls)
+        if op is not None:
+            return op(self.evaluate(node.left, env), self.evaluate(node.right, env))
+        op = UNARY_OPS.get(cls)
+        if op is not None:
+            return op(self.evaluate(node.right, env))
+        if cls is IntConst:
+            return decode_literal(node.value)
+        if cls is Identifier:
+            if env is None or node.scope is not None:
+                raise NotConstant(node)
+            return env.lookup(node.name)
+        if cls is Cond:
+            cond = self.evaluate(node.cond, env).truth()
+            if cond is None:
+                t, f, width, signed = self.evaluate(node.true_value, env)._common(
+                    self.evaluate(node.false_value, env))
+                # Bits on which both branches agree survive, the rest become x.
+                differ = t.value ^ f.value | t.xmask | t.zmask | f.xmask | f.zmask
+                return BitVector(width, t.value, signed, differ)
+            return self.evaluate(node.true_value if cond else node.false_value, env)
+        if cls is Rvalue:
+            return self.evaluate(node.var, env)
+        if cls is Concat:
+            ret = None
+            for item in node.list:
+                v = self.evaluate(item, env)
+                ret = v if ret is None else BitVector(
+                    ret.width + v.width, ret.value << v.width | v.value, False,
+                    ret.xmask << v.width | v.xmask, ret.zmask << v.width | v.zmask)
+            return ret.resize(ret.width, False)
+        if cls is Repeat:
+            times = self.value(node.times, env)
+            v = self.evaluate(node.value, env)
+            ret = BitVector(0)
+            for _ in range(times):
+                ret = BitVector(ret.width + v.width, ret.value << v.width | v.value, False,
+                                ret.xmask << v.width | v.xmask, ret.zmask << v.width | v.zmask)
+            return ret
+        if cls is Pointer:
+            v = self.evaluate(node.var, env)
+            i = self.value(node.ptr, env)
+            return BitVector(1, v.value >> i, False, v.xmask >> i, v.zmask >> i)
+        if cls is Partselect:
+            v = self.evaluate(node.var, env)
+            msb, lsb = self.value(node.msb, env), self.value(node.lsb, env)
+            lo, hi = min(msb, lsb), max(msb, lsb)
+            return BitVector(hi - lo + 1, v.value >> lo, False, v.xmask >> lo, v.zmask >> lo)
+        if cls is SystemCall:
+            fn = SYSTEM_FUNCS.get(node.syscall)
+            if fn is None or len(node.args) != 1:
+                raise NotConstant(node)
+            return fn(self.evaluate(node.args[0], env))
+        raise NotConstant(node)
+
+    # --------------------------------------------------------------------------
+    def fold(self, node, env=None):
+        """ Replace constant subtrees below ``node`` with ``IntConst`` in place.
+
+        Without ``env`` only literal-only subtrees are folded; with ``env``
+        parameter references are substituted as well. Assignment targets are
+        left untouched. Returns the (possibly replaced) ``node``.
+        """
+        if isinstance(node, (Operator, SystemCall)) or (env is not None and type(node) is Identifier):
+            try:
+                value = self.evaluate(node, env)
+            except (NotConstant, ValueError, TypeError):
+                pass
+            else:
+                return IntConst(value.literal(), lineno=node.lineno)
+        if isinstance(node, Lvalue):
+            return node
+        for attr, child in node.__dict__.items():
+            if isinstance(child, Node):
+                new = self.fold(child, env)
+                if new is not child:
+                    setattr(node, attr, new)
+            elif isinstance(child, (tuple, list)) and child and isinstance(child[0], Node):
+                items = [self.fold(c, env) if isinstance(c, Node) else c for c in child]
+                if any(a is not b for a, b in zip(items, child)):
+                    setattr(node, attr, type(child)(items))
+        return node
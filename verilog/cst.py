@@ -0,0 +1,235 @@
+"""
+   Whitespace- and comment-preserving concrete syntax tree mode.
+
+   ``ConcreteSyntaxTree`` keeps the source buffer plus, for every token, its
+   type and its ``[start, end)`` offsets in two ``array('q')`` columns. The
+   trivia of a token (whitespace, comments and compiler directives, which
+   ``VerilogLexerPlex`` drops) is the gap between the end of the previous
+   token and the start of this one, so it needs no storage of its own and no
+   text is copied per token.
+
+   ``write`` reproduces the input byte-for-byte. Edits made through
+   ``replace``/``insert_before``/``delete`` are recorded as offset ranges
+   and spliced in while printing, so everything outside an edit is copied
+   verbatim in large slices.
+
+   ``parse`` runs the LALR tables over the same tokens and sets ``span``, the
+   ``(first, last)`` token indices it was reduced from, on every ``Node`` it
+   builds; ``node_text``, ``node_trivia`` and ``replace_node`` go from an AST
+   node back to its tokens and trivia.
+"""
+
+import re
+import bisect
+from array import array
+
+from astnode import Node
+from lex import VerilogLexerPlex
+
+
+_TRIVIA = re.compile(r'(?P<newline>\n+)|(?P<space>[ \t\r\f\v]+)|(?P<linecomment>//[^\n]*)|'
+                     r'(?P<comment>/\*.*?\*/)|(?P<directive>`[^\n]*)|(?P<other>.)', re.S)
+
+
+class ConcreteSyntaxTree(object):
+    """ Token offsets over an untouched source buffer """
+
+    def __init__(self, source, tokens):
+        self.source = source
+        self.types = []
+        self.starts = array('q')
+        self.ends = array('q')
+        for tok in tokens:
+            self.types.append(tok.type)
+            self.starts.append(tok.lexpos)
+            self.ends.append(tok.lexpos + len(tok.value))
+        self.edits = []
+        self._lines = None
+
+    @classmethod
+    def from_source(cls, source, error_func=None):
+        lexer = VerilogLexerPlex(error_func=error_func or cls._raise_error)
+        lexer.input(source)
+        return cls(source, lexer)
+
+    @classmethod
+    def from_file(cls, path, error_func=None):
+        # newline='' keeps CRLF line endings intact.
+        with open(path, newline='') as fd:
+            return cls.from_source(fd.read(), error_func)
+
+    @staticmethod
+    def _raise_error(msg, line, column):
+        # The lexer has no rule for the CR of CRLF line endings; the
+        # character simply stays in the trivia.
+        if msg == 'Illegal character %r' % '\r':
+            return
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    # --------------------------------------------------------------------------
+    def __len__(self):
+        return len(self.types)
+
+    def text(self, k):
+        return self.source[self.starts[k]:self.ends[k]]
+
+    def trivia(self, k):
+        """ ``(start, end)`` of the trivia before token ``k`` """
+        return (self.ends[k - 1] if k > 0 else 0), self.starts[k]
+
+    def trailing_trivia(self):
+        """ ``(start, end)`` of the trivia after the last token """
+        return (self.ends[-1] if len(self.ends) else 0), len(self.source)
+
+    def iter_trivia(self, k=None):
+        """ Yield ``(kind, start, end)`` pieces of the trivia before token ``k``
+
+        ``kind`` is one of newline, space, linecomment, comment, directive or
+        other. With ``k=None`` the trailing trivia is split.
+        """
+        start, end = self.trailing_trivia() if k is None else self.trivia(k)
+        pos = start
+        while pos < end:
+            m = _TRIVIA.match(self.source, pos, end)
+            yield m.lastgroup, m.start(), m.end()
+            pos = m.end()
+
+    def comments(self, k):
+        """ Comment texts attached in front of token ``k`` """
+        return [self.source[s:e] for kind, s, e in self.iter_trivia(k)
+                if kind in ('linecomment', 'comment')]
+
+    def token_at(self, offset):
+        """ Index of the token covering or following ``offset`` """
+        k = bisect.bisect_right(self.starts, offset) - 1
+        if k >= 0 and offset < self.ends[k]:
+            return k
+        return k + 1
+
+    def line_start(self, lineno):
+        if self._lines is None:
+            self._lines = array('q', [0])
+            self._lines.extend(m.end() for m in re.finditer('\n', self.source))
+        return self._lines[lineno - 1]
+
+    def tokens_on_line(self, lineno):
+        """ ``range`` of the token indices starting on ``lineno`` """
+        start = self.line_start(lineno)
+        try:
+            end = self.line_start(lineno + 1)
+        except IndexError:
+            end = len(self.source)
+        return range(bisect.bisect_left(self.starts, start), bisect.bisect_left(self.starts, end))
+
+    # --------------------------------------------------------------------------
+    def replace_span(self, start, end, text):
+        """ Replace ``source[start:end]`` with ``text`` when printing """
+        self.edits.append((start, end, text))
+
+    def replace(self, first, text, last=None):
+        """ Replace tokens ``first..last`` (inclusive) and the trivia between them """
+        last = first if last is None else last
+        self.replace_span(self.starts[first], self.ends[last], text)
+
+    def insert_before(self, k, text):
+        self.replace_span(self.starts[k], self.starts[k], text)
+
+    def insert_after(self, k, text):
+        self.replace_span(self.ends[k], self.ends[k], text)
+
+    def delete(self, first, last=None, trivia=True):
+        """ Delete tokens ``first..last``, with their leading trivia by default """
+        last = first if last is None else last
+        start = self.trivia(first)[0] if trivia else self.starts[first]
+        self.replace_span(start, self.ends[last], '')
+
+    # --------------------------------------------------------------------------
+    def parse(self, engine=None):
+        """ Parse the tokens with ``engine`` (an ``lalr.LRParser``, by default
+        over ``par_lalr.VerilogParser``) and return the AST; every ``Node``
+        gets the ``span`` of the tokens it covers.
+        """
+        from lalr import END, LRParser
+        if engine is None:
+            from par_lalr import VerilogParser
+            engine = LRParser(VerilogParser())
+        # Expressions go through the plain tables so that each of their
+        # reductions is seen here, see pratt.ExpressionTables.
+        action = engine.tables.action
+        goto = engine.tables.goto
+        rhs_len = engine.tables.rhs_len
+        lhs = engine.tables.lhs
+        types = self.types
+        n_tokens = len(types)
+
+        states = [0]
+        values = [None]
+        firsts = [0]
+        k = 0
+        while True:
+            a = types[k] if k < n_tokens else END
+            act = action[states[-1]].get(a)
+            if act is None:
+                if k == n_tokens:
+                    raise SyntaxError('at end of input')
+                lineno = self.source.count('\n', 0, self.starts[k]) + 1
+                raise SyntaxError('before: "%s": line:%s' % (self.text(k), lineno))
+            if act > 0:
+                states.append(act)
+                values.append(self.text(k))
+                firsts.append(k)
+                k += 1
+            elif act < 0:
+                r = -act
+                n = rhs_len[r]
+                args = values[len(values) - n:]
+                first = firsts[-n] if n else k
+                if n:
+                    del states[-n:]
+                    del values[-n:]
+                    del firsts[-n:]
+                value = engine.reduce(r, args)
+                # A node handed up unchanged keeps its innermost span.
+                if n and isinstance(value, Node) and getattr(value, 'span', None) is None:
+                    value.span = (first, k - 1)
+                states.append(goto[states[-1]][lhs[r]])
+                values.append(value)
+                firsts.append(first)
+            else:
+                return values[-1]
+
+    def node_text(self, node):
+        """ Source text of ``node``, trivia between its tokens included """
+        first, last = node.span
+        return self.source[self.starts[first]:self.ends[last]]
+
+    def node_trivia(self, node):
+        """ ``(start, end)`` of the trivia in front of ``node`` """
+        return self.trivia(node.span[0])
+
+    def replace_node(self, node, text):
+        first, last = node.span
+        self.replace(first, text, last)
+
+    def delete_node(self, node, trivia=True):
+        first, last = node.span
+        self.delete(first, last, trivia)
+
+    def write(self, buf):
+        """ Write the (edited) source to ``buf`` """
+        pos = 0
+        source = self.source
+        # Stable sort keeps insertions at the same offset in call order.
+        for start, end, text in sorted(self.edits, key=lambda e: (e[0], e[1])):
+            if start < pos:
+                raise ValueError('overlapping edits at offset %d' % start)
+            if start > pos:
+                buf.write(source[pos:start])
+            buf.write(text)
+            pos = end
+        if pos < len(source):
+            buf.write(source[pos:])
+
+    def to_file(self, path):
+        with open(path, 'w', newline='') as fd:
+            self.write(fd)
@@ -0,0 +1,305 @@
+"""
+   Def-use analysis of always blocks and continuous assignments.
+
+   Every ``Always``/``AlwaysFF``/``AlwaysComb``/``AlwaysLatch`` and ``Assign``
+   of a module becomes a ``Process`` whose read and written signals are kept
+   as int bitsets indexed by the module's own ``SignalTable``, so their
+   width is the module's signal count, not the design's. Reads are the
+   upward-exposed ones: a signal read after an unconditional blocking
+   assignment to the whole signal in the same block is not a dependency.
+
+   ``ModuleDataflow.update`` only re-walks items that changed since the last
+   call (items are tracked by identity) and then refreshes the dependency
+   graph of the signals those items write. The multi-driver and
+   combinational-loop checks run over the bitsets in linear time.
+"""
+
+from astnode import *
+
+
+def iter_bits(bits):
+    """ Indices of the set bits of an int, lowest first """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class SignalTable(object):
+    """ Interned signal names """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+    def intern(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def bit(self, name):
+        return 1 << self.intern(name)
+
+    def names_of(self, bits):
+        return [self.names[i] for i in iter_bits(bits)]
+
+
+class Process(object):
+    """ Signals read and written by one always block or assign """
+
+    def __init__(self, node, kind, reads, writes, partial):
+        self.node = node
+        self.kind = kind          # 'comb', 'seq' or 'latch'
+        self.reads = reads
+        self.writes = writes
+        self.partial = partial    # written only through a bit/part select
+        self.lineno = node.lineno
+
+
+class _Walker(object):
+    def __init__(self, table):
+        self.table = table
+        self.reads = 0
+        self.writes = 0
+        self.whole = 0
+
+    def expr(self, node, defined):
+        if node is None or isinstance(node, Constant):
+            return
+        if isinstance(node, Identifier):
+            bit = self.table.bit(node.name)
+            if not bit & defined:
+                self.reads |= bit
+            return
+        if isinstance(node, FunctionCall):
+            for arg in node.args or ():
+                self.expr(arg, defined)
+            return
+        for c in node.children():
+            self.expr(c, defined)
+
+    def target(self, node, defined):
+        """ Record the signals written by an lvalue; return the whole ones """
+        if isinstance(node, Lvalue):
+            return self.target(node.var, defined)
+        if isinstance(node, Identifier):
+            bit = self.table.bit(node.name)
+            self.writes |= bit
+            self.whole |= bit
+            return bit
+        if isinstance(node, (Pointer, Partselect)) and isinstance(node.var, Identifier):
+            self.writes |= self.table.bit(node.var.name)
+        if isinstance(node, Pointer):
+            self.expr(node.ptr, defined)
+            if not isinstance(node.var, Identifier):
+                self.target(node.var, defined)
+            return 0
+        if isinstance(node, Partselect):
+            self.expr(node.msb, defined)
+            self.expr(node.lsb, defined)
+            if not isinstance(node.var, Identifier):
+                self.target(node.var, defined)
+            return 0
+        if isinstance(node, Concat):
+            whole = 0
+            for c in node.list:
+                whole |= self.target(c, defined)
+            return whole
+        self.expr(node, defined)
+        return 0
+
+    def stmt(self, node, defined):
+        """ Walk a statement; return the signals defined after it """
+        if node is None:
+            return defined
+        if isinstance(node, BlockingSubstitution):
+            self.expr(node.right, defined)
+            return defined | self.target(node.left, defined)
+        if isinstance(node, NonblockingSubstitution):
+            self.expr(node.right, defined)
+            self.target(node.left, defined)
+            return defined
+        if isinstance(node, (Block, ParallelBlock)):
+            for s in node.statements or ():
+                defined = self.stmt(s, defined)
+            return defined
+        if isinstance(node, IfStatement):
+            self.expr(node.cond, defined)
+            t = self.stmt(node.true_statement, defined)
+            f = self.stmt(node.false_statement, defined)
+            return t & f
+        if isinstance(node, CaseStatement):
+            self.expr(node.comp, defined)
+            ret = None
+            has_default = False
+            for case in node.caselist or ():
+                if case.cond is None:
+                    has_default = True
+                for c in case.cond or ():
+                    self.expr(c, defined)
+                d = self.stmt(case.statement, defined)
+                ret = d if ret is None else ret & d
+            if ret is None or not has_default:
+                return defined
+            return ret
+        if isinstance(node, ForStatement):
+            defined = self.stmt(node.pre, defined)
+            self.expr(node.cond, defined)
+            self.stmt(node.post, self.stmt(node.statement, defined))
+            return defined
+        if isinstance(node, (WhileStatement, WaitStatement)):
+            self.expr(node.cond, defined)
+            self.stmt(node.statement, defined)
+            return defined
+        if isinstance(node, (ForeverStatement, SingleStatement)):
+            self.stmt(node.statement, defined)
+            return defined
+        self.expr(node, defined)
+        return defined
+
+
+def process_kind(node):
+    if isinstance(node, Assign) or isinstance(node, AlwaysComb):
+        return 'comb'
+    if isinstance(node, AlwaysFF):
+        return 'seq'
+    if isinstance(node, AlwaysLatch):
+        return 'latch'
+    for sens in node.sens_list.list if node.sens_list else ():
+        if sens.type in ('posedge', 'negedge'):
+            return 'seq'
+    return 'comb'
+
+
+def analyze_process(node, table):
+    """ Build the ``Process`` of an ``Always`` or ``Assign`` """
+    w = _Walker(table)
+    if isinstance(node, Assign):
+        w.expr(node.right, 0)
+        w.target(node.left, 0)
+    else:
+        for sens in node.sens_list.list if node.sens_list else ():
+            w.expr(sens.sig, 0)
+        w.stmt(node.statement, 0)
+    return Process(node, process_kind(node), w.reads, w.writes, w.writes & ~w.whole)
+
+
+class ModuleDataflow(object):
+    """ Incrementally maintained def-use information of one module """
+
+    def __init__(self, table=None):
+        self.table = table or SignalTable()
+        self.processes = {}   # id(item) -> Process
+        self.writers = {}     # signal id -> [Process]
+        self.deps = {}        # signal id -> bitset of comb inputs
+        self.walked = 0
+
+    def update(self, moduledef):
+        """ Re-analyze the items of ``moduledef`` that changed """
+        old = self.processes
+        self.processes = {}
+        added = []
+        removed = []
+        for item in moduledef.items or ():
+            if not isinstance(item, (Always, Assign)):
+                continue
+            p = old.pop(id(item), None)
+            if p is None or p.node is not item:
+                if p is not None:
+                    removed.append(p)
+                p = analyze_process(item, self.table)
+                added.append(p)
+            self.processes[id(item)] = p
+        self.walked += len(added)
+        removed.extend(old.values())
+
+        dirty = 0
+        for p in removed:
+            dirty |= p.writes
+            for s in iter_bits(p.writes):
+                self.writers[s].remove(p)
+        for p in added:
+            dirty |= p.writes
+            for s in iter_bits(p.writes):
+                self.writers.setdefault(s, []).append(p)
+        for s in iter_bits(dirty):
+            deps = 0
+            for p in self.writers.get(s, ()):
+                if p.kind == 'comb':
+                    deps |= p.reads
+            self.deps[s] = deps
+        return len(added)
+
+    # --------------------------------------------------------------------------
+    def drivers(self, name):
+        s = self.table.ids.get(name)
+        return list(self.writers.get(s, ())) if s is not None else []
+
+    def multi_drivers(self):
+        """ ``(name, [Process])`` of signals driven by more than one process """
+        ret = []
+        for s, ps in self.writers.items():
+            if len(ps) > 1 and any(not p.partial >> s & 1 for p in ps):
+                ret.append((self.table.names[s], list(ps)))
+        return ret
+
+    def comb_loops(self):
+        """ Signal cycles through combinational processes (Tarjan's SCC) """
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        loops = []
+        counter = 0
+        for root in self.deps:
+            if root in index:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter_bits(self.deps.get(root, 0)))]
+            while work:
+                v, it = work[-1]
+                for w in it:
+                    if w not in index:
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack.add(w)
+                        work.append((w, iter_bits(self.deps.get(w, 0))))
+                        break
+                    if w in on_stack:
+                        low[v] = min(low[v], index[w])
+                else:
+                    work.pop()
+                    if work:
+                        u = work[-1][0]
+                        low[u] = min(low[u], low[v])
+                    if low[v] == index[v]:
+                        scc = []
+                        while True:
+                            w = stack.pop()
+                            on_stack.discard(w)
+                            scc.append(w)
+                            if w == v:
+                                break
+                        if len(scc) > 1 or self.deps.get(v, 0) >> v & 1:
+                            loops.append(sorted(self.table.names[s] for s in scc))
+        return loops
+
+
+class Dataflow(object):
+    """ ``ModuleDataflow`` of every module, each with its own ``SignalTable`` """
+
+    def __init__(self):
+        self.modules = {}
+
+    def update(self, moduledef):
+        df = self.modules.get(moduledef.name)
+        if df is None:
+            df = self.modules[moduledef.name] = ModuleDataflow()
+        df.update(moduledef)
+        return df
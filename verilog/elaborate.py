@@ -0,0 +1,253 @@
+"""
+   Instance hierarchy elaboration.
+
+   ``Elaborator`` starts from a top ``ModuleDef`` and resolves every
+   ``InstanceList``/``Instance`` with its ``ParamArg`` and ``PortArg``
+   bindings. Each module is specialized once per distinct parameter set: a
+   ``ModuleSpec`` is shared by all instances that resolve to the same
+   parameters, so the hierarchy is a DAG whose size grows with the number of
+   distinct specializations rather than with the number of instances.
+   Hierarchical paths are produced lazily by ``iter_paths``.
+
+   Instances inside generate regions are found through
+   ``generate.GenerateExpander``; a run of identical loop iterations becomes a
+   single ``Child`` whose ``scopes`` carry the genvar values.
+"""
+
+import sys
+
+from astnode import *
+from consteval import ConstEvaluator, NotConstant
+from generate import GenerateExpander, iter_instances, scope_names
+
+
+class ElaborationError(Exception):
+    pass
+
+
+class Child(object):
+    """ An instance inside a ``ModuleSpec`` """
+
+    def __init__(self, name, spec, ports, array=None, scopes=(), lineno=0):
+        self.name = name
+        self.spec = spec
+        self.ports = ports    # ((portname, expression), ...)
+        self.array = array    # (msb, lsb) of an instance array
+        self.scopes = scopes  # enclosing generate blocks, see generate.iter_instances
+        self.lineno = lineno
+
+    @property
+    def count(self):
+        count = 1
+        if self.array is not None:
+            count = abs(self.array[0] - self.array[1]) + 1
+        for label, values in self.scopes:
+            if values is not None:
+                count *= len(values)
+        return count
+
+    @property
+    def label(self):
+        parts = []
+        for label, values in self.scopes:
+            if values is None:
+                parts.append(label)
+            elif len(values) == 1:
+                parts.append('%s[%d]' % (label, values[0]))
+            else:
+                parts.append('%s[%d..%d]' % (label, values[0], values[-1]))
+        parts.append(self.name)
+        return '.'.join(parts)
+
+    def _leaf_names(self):
+        if self.array is None:
+            yield self.name
+            return
+        msb, lsb = self.array
+        step = -1 if msb > lsb else 1
+        for i in range(msb, lsb + step, step):
+            yield '%s[%d]' % (self.name, i)
+
+    def names(self):
+        if not self.scopes:
+            for name in self._leaf_names():
+                yield name
+            return
+        for scope in scope_names(self.scopes):
+            for name in self._leaf_names():
+                yield scope + '.' + name
+
+
+class ModuleSpec(object):
+    """ A module specialized for one parameter binding """
+
+    def __init__(self, name, module, params):
+        self.name = name
+        self.module = module      # None for unknown (black-box) modules
+        self.params = params      # consteval.ParamEnv, or None
+        self.children = []
+        self._size = None
+
+    @property
+    def is_blackbox(self):
+        return self.module is None
+
+    def label(self):
+        if not self.params or not self.params.values:
+            return self.name
+        return '%s #(%s)' % (self.name, ', '.join(
+            '%s=%s' % (k, v.to_int() if v.is_known else v.literal())
+            for k, v in sorted(self.params.values.items())))
+
+    def instance_count(self):
+        """ Number of instances below (and including) this one """
+        if self._size is None:
+            self._size = 1 + sum(c.count * c.spec.instance_count() for c in self.children)
+        return self._size
+
+
+def port_names(moduledef):
+    names = []
+    if moduledef.portlist is None:
+        return names
+    for port in moduledef.portlist.ports:
+        if isinstance(port, Ioport):
+            names.append(port.first.name)
+        else:
+            names.append(port.name)
+    return names
+
+
+def param_names(moduledef):
+    """ Overridable parameters in declaration order """
+    decls = []
+    if moduledef.paramlist and moduledef.paramlist.params:
+        decls = moduledef.paramlist.params
+    else:
+        decls = [item for item in moduledef.items or () if isinstance(item, Decl)]
+    return [p.name for d in decls for p in d.list if type(p) is Parameter]
+
+
+class Elaborator(object):
+    """ Builds the specialized instance hierarchy of a design """
+
+    def __init__(self, modules, evaluator=None):
+        if isinstance(modules, Source):
+            modules = modules.description.definitions
+        if not isinstance(modules, dict):
+            modules = dict((m.name, m) for m in modules if isinstance(m, ModuleDef))
+        self.modules = modules
+        self.evaluator = evaluator or ConstEvaluator()
+        self.generator = GenerateExpander(self.evaluator)
+        self.specs = {}
+        self.missing = set()
+        self._active = set()
+
+    # --------------------------------------------------------------------------
+    def elaborate(self, top, overrides=None):
+        """ Return the ``ModuleSpec`` of ``top`` (a name or ``ModuleDef``) """
+        if isinstance(top, ModuleDef):
+            top = top.name
+        return self.specialize(top, overrides)
+
+    def specialize(self, name, overrides=None):
+        moduledef = self.modules.get(name)
+        if moduledef is None:
+            self.missing.add(name)
+            key = (name, None)
+            spec = self.specs.get(key)
+            if spec is None:
+                spec = self.specs[key] = ModuleSpec(name, None, None)
+            return spec
+
+        env = self.evaluator.module_params(moduledef, overrides)
+        key = (name, env.key())
+        spec = self.specs.get(key)
+        if spec is not None:
+            return spec
+        if key in self._active:
+            raise ElaborationError('recursive instantiation of module %s' % name)
+
+        self._active.add(key)
+        try:
+            spec = ModuleSpec(name, moduledef, env)
+            for inst, parameterlist, scope, prefix in self._instances(moduledef, env):
+                spec.children.append(self._child(inst, parameterlist, scope, prefix))
+        finally:
+            self._active.discard(key)
+        self.specs[key] = spec
+        return spec
+
+    def _instances(self, moduledef, env):
+        """ Yield ``(Instance, parameterlist, ParamEnv, prefix)`` of ``moduledef`` """
+        for item in moduledef.items or ():
+            if isinstance(item, InstanceList):
+                for inst in item.instances:
+                    yield inst, inst.parameterlist or item.parameterlist, env, ()
+            elif isinstance(item, GenerateStatement):
+                for ret in iter_instances(self.generator.expand(item, env)):
+                    yield ret
+
+    def _child(self, inst, parameterlist, env, prefix=()):
+        ev = self.evaluator
+        target = self.modules.get(inst.module)
+        overrides = {}
+        if parameterlist and target is not None:
+            positional = param_names(target)
+            for i, arg in enumerate(parameterlist):
+                name = arg.paramname
+                if name is None:
+                    if i >= len(positional):
+                        raise ElaborationError('%s: too many parameters for %s' %
+                                               (inst.name, inst.module))
+                    name = positional[i]
+                if arg.argname is None:
+                    continue
+                try:
+                    overrides[name] = ev.evaluate(arg.argname, env)
+                except NotConstant:
+                    raise ElaborationError('%s: parameter %s of %s is not constant' %
+                                           (inst.name, name, inst.module))
+
+        ports = []
+        if inst.portlist:
+            names = port_names(target) if target is not None else []
+            for i, arg in enumerate(inst.portlist):
+                name = arg.portname
+                if name is None and i < len(names):
+                    name = names[i]
+                ports.append((name, arg.argname))
+
+        array = None
+        if inst.array is not None:
+            array = ev.range(inst.array, env)
+        return Child(inst.name, self.specialize(inst.module, overrides),
+                     tuple(ports), array, prefix, inst.lineno)
+
+    # --------------------------------------------------------------------------
+    def iter_paths(self, spec, prefix=None):
+        """ Lazily yield ``(path, ModuleSpec)`` of every instance below ``spec`` """
+        stack = [(prefix or spec.name, spec)]
+        while stack:
+            path, spec = stack.pop()
+            yield path, spec
+            for child in reversed(spec.children):
+                for name in reversed(list(child.names())):
+                    stack.append((path + '.' + name, child.spec))
+
+    def show(self, spec, buf=sys.stdout):
+        """ Print the hierarchy, expanding each specialization only once """
+        seen = set()
+        stack = [(0, spec.name, spec, 1)]
+        while stack:
+            depth, name, spec, count = stack.pop()
+            lead = '  ' * depth
+            times = ' x%d' % count if count > 1 else ''
+            if id(spec) in seen and spec.children:
+                buf.write('%s%s%s: %s (shared)\n' % (lead, name, times, spec.label()))
+                continue
+            seen.add(id(spec))
+            buf.write('%s%s%s: %s [%d instances]\n' %
+                      (lead, name, times, spec.label(), spec.instance_count()))
+            for child in reversed(spec.children):
+                stack.append((depth + 1, child.label, child.spec, child.count))
@@ -0,0 +1,224 @@
+"""
+   Generate-region elaboration.
+
+   ``GenerateExpander`` evaluates genvar ``for`` loops and conditional
+   generates of a ``GenerateStatement`` under a parameter binding. The result
+   is a tree of ``GenerateScope`` objects that reference the original AST
+   items; nothing is copied.
+
+   Consecutive loop iterations with the same signature (the branches chosen
+   by nested generate ifs, the parameter values of the instances, and the
+   shape of nested loops) are collapsed into a single ``GenerateRun``, which
+   keeps one template scope plus ``start``/``step``/``count``. A
+   4096-iteration bus generator therefore costs one scope, not 4096.
+
+   Parameters and localparams declared in a generate scope are evaluated
+   into that scope's ``ParamEnv``, a child of the enclosing one. The
+   template of a run keeps the values of its first iteration.
+"""
+
+import itertools
+
+from astnode import *
+from bitvec import BitVector
+from consteval import ConstEvaluator, NotConstant
+
+
+class GenerateError(Exception):
+    pass
+
+
+class GenerateScope(object):
+    """ Items selected in one generate scope under one genvar binding """
+
+    def __init__(self, name, env):
+        self.name = name
+        self.env = env
+        self.items = []
+        self.blocks = []    # nested GenerateScope / GenerateRun
+        self.signature = []
+
+
+class GenerateRun(object):
+    """ Consecutive loop iterations sharing one template scope """
+
+    def __init__(self, name, genvar, start, scope):
+        self.name = name
+        self.genvar = genvar
+        self.start = start
+        self.step = 0
+        self.count = 1
+        self.scope = scope
+
+    @property
+    def values(self):
+        if self.count == 1:
+            return range(self.start, self.start + 1)
+        return range(self.start, self.start + self.step * self.count, self.step)
+
+    def accepts(self, value, signature):
+        if signature != self.scope.signature:
+            return False
+        if self.count == 1:
+            return value != self.start
+        return value == self.start + self.step * self.count
+
+    def append(self, value):
+        if self.count == 1:
+            self.step = value - self.start
+        self.count += 1
+
+    def key(self):
+        return (self.name, self.start, self.step, self.count, self.scope.signature)
+
+
+class GenerateExpander(object):
+    """ Evaluates generate constructs into compact ``GenerateScope`` trees """
+
+    max_iterations = 1 << 20
+
+    def __init__(self, evaluator=None):
+        self.evaluator = evaluator or ConstEvaluator()
+        self.iterations = 0
+        self.runs = 0
+
+    def expand(self, generate, env, name=None):
+        """ Expand a ``GenerateStatement`` under ``env`` """
+        scope = GenerateScope(name, env.child({}))
+        self._items(generate.items, scope)
+        scope.signature = tuple(scope.signature)
+        return scope
+
+    # --------------------------------------------------------------------------
+    def _items(self, items, scope):
+        for item in items or ():
+            self._item(item, scope)
+
+    def _item(self, item, scope):
+        if isinstance(item, GenerateStatement):
+            self._items(item.items, scope)
+        elif isinstance(item, IfStatement):
+            cond = self._condition(item.cond, scope.env)
+            scope.signature.append(('if', id(item), cond))
+            branch = item.true_statement if cond else item.false_statement
+            if branch is not None:
+                self._body(branch, scope)
+        elif isinstance(item, ForStatement):
+            self._loop(item, scope)
+        elif isinstance(item, Decl):
+            self.evaluator.bind(item, scope.env)
+            scope.items.append(item)
+        else:
+            scope.items.append(item)
+            if isinstance(item, InstanceList):
+                scope.signature.append(('inst', self._instance_key(item, scope.env)))
+
+    def _body(self, node, scope):
+        if not isinstance(node, Block):
+            self._item(node, scope)
+        elif node.scope is None:
+            self._items(node.statements, scope)
+        else:
+            child = GenerateScope(node.scope, scope.env.child({}))
+            self._items(node.statements, child)
+            child.signature = tuple(child.signature)
+            scope.blocks.append(child)
+            scope.signature.append(('block', node.scope, child.signature))
+
+    def _condition(self, cond, env):
+        try:
+            value = self.evaluator.evaluate(cond, env).truth()
+        except NotConstant as e:
+            raise GenerateError('generate condition is not constant: %s' % e)
+        if value is None:
+            raise GenerateError('generate condition evaluates to x')
+        return bool(value)
+
+    def _instance_key(self, item, env):
+        key = []
+        for inst in item.instances:
+            params = []
+            for arg in inst.parameterlist or item.parameterlist or ():
+                try:
+                    value = self.evaluator.evaluate(arg.argname, env)
+                except NotConstant:
+                    # Unknown: never the same as another iteration's
+                    value = object()
+                params.append((arg.paramname, value))
+            array = None
+            if inst.array is not None:
+                array = self.evaluator.range(inst.array, env)
+            key.append((inst.name, tuple(params), array))
+        return tuple(key)
+
+    def _loop(self, loop, scope):
+        ev = self.evaluator
+        if loop.pre is None or loop.cond is None or loop.post is None:
+            raise GenerateError('generate for needs an initialization, condition and step')
+        genvar = loop.pre.left.var.name
+        body = loop.statement
+        if isinstance(body, Block) and body.scope is not None:
+            name = body.scope
+        else:
+            name = 'genblk%d' % (len(scope.blocks) + 1)
+
+        runs = []
+        run = None
+        value = ev.value(loop.pre.right, scope.env)
+        n = 0
+        while True:
+            env = scope.env.child({genvar: BitVector.from_int(value)})
+            if not self._condition(loop.cond, env):
+                break
+            n += 1
+            if n > self.max_iterations:
+                raise GenerateError('generate loop over %s does not terminate' % genvar)
+            iteration = GenerateScope(name, env)
+            if isinstance(body, Block):
+                self._items(body.statements, iteration)
+            else:
+                self._item(body, iteration)
+            iteration.signature = tuple(iteration.signature)
+            if run is not None and run.accepts(value, iteration.signature):
+                run.append(value)
+            else:
+                run = GenerateRun(name, genvar, value, iteration)
+                runs.append(run)
+            value = ev.value(loop.post.right, env)
+
+        self.iterations += n
+        self.runs += len(runs)
+        scope.blocks.extend(runs)
+        scope.signature.append(('for', name, tuple(r.key() for r in runs)))
+
+
+def iter_instances(scope, prefix=()):
+    """ Yield ``(Instance, parameterlist, ParamEnv, prefix)`` below ``scope``
+
+    ``prefix`` is a tuple of ``(label, values)`` pairs naming the enclosing
+    generate blocks; ``values`` is None for a plain named block and the
+    genvar values of a ``GenerateRun`` otherwise.
+    """
+    for item in scope.items:
+        if isinstance(item, InstanceList):
+            for inst in item.instances:
+                yield inst, inst.parameterlist or item.parameterlist, scope.env, prefix
+    for block in scope.blocks:
+        if isinstance(block, GenerateRun):
+            for ret in iter_instances(block.scope, prefix + ((block.name, block.values),)):
+                yield ret
+        else:
+            for ret in iter_instances(block, prefix + ((block.name, None),)):
+                yield ret
+
+
+def scope_names(prefix):
+    """ Expand a ``prefix`` into every hierarchical name it denotes """
+    parts = []
+    for label, values in prefix:
+        if values is None:
+            parts.append((label,))
+        else:
+            parts.append(['%s[%d]' % (label, v) for v in values])
+    for combo in itertools.product(*parts):
+        yield '.'.join(combo)
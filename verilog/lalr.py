@@ -0,0 +1,641 @@
+"""
+   In-tree LALR(1) table construction and a table-driven parse loop.
+
+   ``LRTables`` are built from the ``@__`` rules of a parser class (see
+   ``rules.get_rules``) and its ``precedence`` list, resolving shift/reduce
+   conflicts the way PLY does. ``LRParser`` drives them with the ``p_*``
+   actions of a parser instance, so it produces the same trees as the Pison
+   engine.
+
+   With ``unit_elimination=True`` the tables skip pass-through reductions:
+   a state whose only item is a completed unit production ``A -> B`` whose
+   action just forwards ``p[1]`` is removed by pointing every transition on
+   ``B`` into it at the ``A`` transition of the same predecessor state.
+
+   Items are numbered per production, so closures and kernels are tuples of
+   ints, and the lookaheads are computed as terminal bitsets with the
+   DeRemer-Pennello relations (``reads``, ``includes``, ``lookback``)
+   instead of propagating through an LR(1) closure of every kernel item.
+   ``get_tables(..., cachedir=...)`` pickles the finished tables under the
+   grammar signature for the next process.
+"""
+
+import os
+import sys
+import types
+import pickle
+import hashlib
+import pathlib
+import tempfile
+import threading
+
+from rules import Rule, get_rules, passthrough_names
+from actions import SEQUENCE, POSITIONAL, positional_action
+
+
+TABLE_VERSION = 2
+END = '$end'
+ACCEPT = '$accept'
+
+
+class GrammarError(Exception):
+    pass
+
+
+class Grammar(object):
+    """ Productions, symbols, precedences and nullable symbols of a parser class """
+
+    def __init__(self, rules, precedence=(), passthrough=()):
+        if not rules:
+            raise GrammarError('no productions')
+        self.productions = [Rule(None, ACCEPT, (rules[0].lhs,), None, None)] + list(rules)
+        self.nonterminals = []
+        self.by_lhs = {}
+        for i, prod in enumerate(self.productions):
+            if prod.lhs not in self.by_lhs:
+                self.nonterminals.append(prod.lhs)
+                self.by_lhs[prod.lhs] = []
+            self.by_lhs[prod.lhs].append(i)
+        self.terminals = [END]
+        seen = set(self.terminals)
+        for prod in self.productions:
+            for sym in prod.rhs:
+                if sym not in self.by_lhs and sym not in seen:
+                    seen.add(sym)
+                    self.terminals.append(sym)
+
+        self.prec = {}
+        for level, entry in enumerate(precedence):
+            for term in entry[1:]:
+                self.prec[term] = (level + 1, entry[0])
+        self.rule_prec = [self._rule_prec(prod) for prod in self.productions]
+        # Unit productions whose action is ``p[0] = p[1]``
+        self.passthrough = frozenset(
+            i for i, prod in enumerate(self.productions)
+            if i and len(prod.rhs) == 1 and prod.name in passthrough)
+        self._nullable()
+
+    def _rule_prec(self, prod):
+        if prod.prec is not None:
+            return self.prec.get(prod.prec, (0, 'right'))
+        for sym in reversed(prod.rhs):
+            if sym not in self.by_lhs:
+                return self.prec.get(sym, (0, 'right'))
+        return (0, 'right')
+
+    def _nullable(self):
+        self.nullable = set()
+        changed = True
+        while changed:
+            changed = False
+            for prod in self.productions:
+                if prod.lhs not in self.nullable and all(sym in self.nullable for sym in prod.rhs):
+                    self.nullable.add(prod.lhs)
+                    changed = True
+
+    def signature(self):
+        """ Hash of the productions, precedences and pass-through set """
+        h = hashlib.sha1()
+        h.update(repr(sorted(self.prec.items())).encode())
+        h.update(repr(sorted(self.passthrough)).encode())
+        for prod in self.productions:
+            h.update(repr((prod.name, prod.lhs, prod.rhs, prod.prec)).encode())
+        return h.hexdigest()[:16]
+
+
+class LRTables(object):
+    """ LALR(1) ACTION/GOTO tables.
+
+    ``action[state][terminal]`` is a state to shift to (> 0), a production
+    to reduce by (< 0, negated) or 0 to accept. ``goto[state][nonterminal]``
+    is the state entered after a reduction.
+    """
+
+    def __init__(self, grammar, unit_elimination=False):
+        self.grammar = grammar
+        self.conflicts = []     # (state, terminal, 'shift/reduce'|'reduce/reduce')
+        self.eliminated = {}    # production index -> transitions bypassed
+        self.unit_states = {}
+        self._items()
+        self._lr0()
+        self._lookaheads()
+        self._build()
+        self.kernels = [tuple((self._item_prod[i], i - self._item_base[self._item_prod[i]])
+                              for i in kernel) for kernel in self.kernels]
+        del self._item_base, self._item_prod, self._item_sym, self._nt_closure
+        del self._reductions, self._la
+        self.rhs_len = [len(prod.rhs) for prod in grammar.productions]
+        self.lhs = [prod.lhs for prod in grammar.productions]
+        if unit_elimination:
+            self._eliminate_units()
+        self._freeze()
+
+    def _freeze(self):
+        # Shared by every engine and thread from here on
+        self.action = tuple(types.MappingProxyType(row) for row in self.action)
+        self.goto = tuple(types.MappingProxyType(row) for row in self.goto)
+
+    def __getstate__(self):
+        # The grammar holds the action functions; get_tables reattaches it.
+        state = dict(self.__dict__)
+        del state['grammar']
+        state['action'] = [dict(row) for row in self.action]
+        state['goto'] = [dict(row) for row in self.goto]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._freeze()
+
+    # --------------------------------------------------------------------------
+    def _items(self):
+        """ Number the LR(0) items: production ``p`` with the dot at ``d`` is
+        ``_item_base[p] + d``, so sorting the numbers sorts by (p, d).
+        """
+        g = self.grammar
+        self._item_base = []
+        self._item_prod = []
+        self._item_sym = []     # symbol after the dot, None if complete
+        for p, prod in enumerate(g.productions):
+            self._item_base.append(len(self._item_prod))
+            self._item_prod.extend([p] * (len(prod.rhs) + 1))
+            self._item_sym.extend(prod.rhs)
+            self._item_sym.append(None)
+
+        # Closure items of a nonterminal, through leading nonterminals
+        leading = dict((n, set(g.productions[p].rhs[0] for p in g.by_lhs[n]
+                               if g.productions[p].rhs and g.productions[p].rhs[0] in g.by_lhs))
+                       for n in g.nonterminals)
+        self._nt_closure = {}
+        for n in g.nonterminals:
+            seen = set([n])
+            work = [n]
+            while work:
+                for m in leading[work.pop()]:
+                    if m not in seen:
+                        seen.add(m)
+                        work.append(m)
+            self._nt_closure[n] = [self._item_base[p] for m in seen for p in g.by_lhs[m]]
+
+    def _lr0(self):
+        start = (0,)
+        self.kernels = [start]
+        self.transitions = [{}]
+        self._reductions = []
+        item_sym = self._item_sym
+        nt_closure = self._nt_closure
+        index = {start: 0}
+        k = 0
+        while k < len(self.kernels):
+            items = set(self.kernels[k])
+            for i in self.kernels[k]:
+                if item_sym[i] in nt_closure:
+                    items.update(nt_closure[item_sym[i]])
+            moves = {}
+            reductions = []
+            for i in sorted(items):
+                sym = item_sym[i]
+                if sym is None:
+                    reductions.append(self._item_prod[i])
+                else:
+                    moves.setdefault(sym, []).append(i + 1)
+            self._reductions.append(reductions)
+            for sym, kernel in moves.items():
+                kernel = tuple(kernel)
+                t = index.get(kernel)
+                if t is None:
+                    t = index[kernel] = len(self.kernels)
+                    self.kernels.append(kernel)
+                    self.transitions.append({})
+                self.transitions[k][sym] = t
+            k += 1
+
+    @staticmethod
+    def _digraph(rel, base):
+        """ ``F(x) = base[x] | F(y) for x rel y``, with SCCs collapsed """
+        n = len(base)
+        done = n + 2
+        F = list(base)
+        N = [0] * n
+        stack = []
+        for x0 in range(n):
+            if N[x0]:
+                continue
+            stack.append(x0)
+            N[x0] = len(stack)
+            work = [(x0, 0, N[x0])]
+            while work:
+                x, i, depth = work[-1]
+                edges = rel[x]
+                if i < len(edges):
+                    work[-1] = (x, i + 1, depth)
+                    y = edges[i]
+                    if not N[y]:
+                        stack.append(y)
+                        N[y] = len(stack)
+                        work.append((y, 0, N[y]))
+                    else:
+                        if N[y] < N[x]:
+                            N[x] = N[y]
+                        F[x] |= F[y]
+                    continue
+                work.pop()
+                if N[x] == depth:
+                    while True:
+                        y = stack.pop()
+                        N[y] = done
+                        F[y] = F[x]
+                        if y == x:
+                            break
+                if work:
+                    parent = work[-1][0]
+                    if N[x] < N[parent]:
+                        N[parent] = N[x]
+                    F[parent] |= F[x]
+        return F
+
+    def _lookaheads(self):
+        """ DeRemer-Pennello LALR(1) lookaheads as terminal bitsets.
+
+        ``Read`` and ``Follow`` of every nonterminal transition come from the
+        ``reads`` and ``includes`` relations; the lookahead of a reduction
+        is the union of ``Follow`` over its ``lookback`` transitions.
+        """
+        g = self.grammar
+        trans = self.transitions
+        by_lhs = g.by_lhs
+        nullable = g.nullable
+        bit = dict((t, 1 << i) for i, t in enumerate(g.terminals))
+
+        xs = []
+        xindex = {}
+        for p, row in enumerate(trans):
+            for sym in row:
+                if sym in by_lhs:
+                    xindex[(p, sym)] = len(xs)
+                    xs.append((p, sym))
+
+        shifts = [0] * len(trans)
+        for p, row in enumerate(trans):
+            for sym in row:
+                if sym not in by_lhs:
+                    shifts[p] |= bit[sym]
+        direct = [shifts[trans[p][n]] for p, n in xs]
+        direct[xindex[(0, g.productions[0].rhs[0])]] |= bit[END]
+        reads = [[xindex[(trans[p][n], m)] for m in trans[trans[p][n]] if m in nullable]
+                 for p, n in xs]
+        read = self._digraph(reads, direct)
+
+        includes = [[] for x in xs]
+        lookback = {}
+        for x, (p, n) in enumerate(xs):
+            for prod in by_lhs[n]:
+                rhs = g.productions[prod].rhs
+                tail = len(rhs)
+                while tail and rhs[tail - 1] in nullable:
+                    tail -= 1
+                s = p
+                for j, sym in enumerate(rhs):
+                    if j >= tail - 1 and sym in by_lhs:
+                        includes[xindex[(s, sym)]].append(x)
+                    s = trans[s][sym]
+                lookback.setdefault((s, prod), []).append(x)
+        follow = self._digraph(includes, read)
+
+        self._la = {}
+        for key, xl in lookback.items():
+            bits = 0
+            for x in xl:
+                bits |= follow[x]
+            self._la[key] = bits
+        self._la[(trans[0][g.productions[0].rhs[0]], 0)] = bit[END]
+
+    def _build(self):
+        g = self.grammar
+        terminals = g.terminals
+        self.action = []
+        self.goto = []
+        for k in range(len(self.kernels)):
+            action = {}
+            goto = {}
+            for sym, t in self.transitions[k].items():
+                if sym in g.by_lhs:
+                    goto[sym] = t
+                else:
+                    action[sym] = t
+            for prod in self._reductions[k]:
+                bits = self._la.get((k, prod), 0)
+                while bits:
+                    low = bits & -bits
+                    self._add_reduce(k, action, terminals[low.bit_length() - 1], prod)
+                    bits ^= low
+            self.action.append(action)
+            self.goto.append(goto)
+
+    def _add_reduce(self, k, action, a, prod):
+        g = self.grammar
+        cur = action.get(a)
+        if cur is None:
+            action[a] = -prod
+        elif cur <= 0:
+            # reduce/reduce: the earlier production wins
+            self.conflicts.append((k, a, 'reduce/reduce'))
+            if prod < -cur:
+                action[a] = -prod
+        else:
+            # PLY's resolution, which the grammar was written against: a
+            # terminal without precedence loses against a rule with one.
+            # Reported as PLY reports them: a reduce only if neither side
+            # has a precedence, a shift only if the rule has none.
+            level, assoc = g.rule_prec[prod]
+            tlevel = g.prec.get(a, (0, 'right'))[0]
+            if tlevel < level or (tlevel == level and assoc == 'left'):
+                action[a] = -prod
+                if not level and not tlevel:
+                    self.conflicts.append((k, a, 'shift/reduce'))
+            elif tlevel == level and assoc == 'nonassoc':
+                del action[a]
+            elif not level:
+                self.conflicts.append((k, a, 'shift/reduce'))
+
+    # --------------------------------------------------------------------------
+    def _unit_states(self):
+        g = self.grammar
+        ret = {}
+        for k, kernel in enumerate(self.kernels):
+            if len(kernel) == 1 and kernel[0][1] == 1 and kernel[0][0] in g.passthrough:
+                ret[k] = kernel[0][0]
+        return ret
+
+    def _eliminate_units(self):
+        units = self._unit_states()
+        for k in range(len(self.action)):
+            # Follow chains through the original row, so the counts do not
+            # depend on the order the row is rewritten in.
+            goto = dict(self.goto[k])
+            for table in (self.action[k], self.goto[k]):
+                for sym, t in table.items():
+                    if t <= 0:
+                        continue
+                    hops = 0
+                    while t in units:
+                        prod = units[t]
+                        self.eliminated[prod] = self.eliminated.get(prod, 0) + 1
+                        t = goto[self.lhs[prod]]
+                        hops += 1
+                        if hops > len(units):
+                            raise GrammarError('cycle of unit productions at state %d' % k)
+                    table[sym] = t
+        self.unit_states = units
+
+    # --------------------------------------------------------------------------
+    def show_conflicts(self, buf=sys.stdout):
+        for k, a, kind in self.conflicts:
+            buf.write('state %d: %s conflict on %s\n' % (k, kind, a))
+
+    def show_eliminated(self, buf=sys.stdout):
+        g = self.grammar
+        for prod, count in sorted(self.eliminated.items()):
+            rule = g.productions[prod]
+            buf.write('%5d  %s -> %s  (%s)\n' % (count, rule.lhs, ' '.join(rule.rhs), rule.name))
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_tables(parser_cls, unit_elimination=False, cachedir=None):
+    """ Build, or return the cached, ``LRTables`` of ``parser_cls``.
+
+    With ``cachedir`` the tables are also pickled there, under the grammar
+    signature, and later processes load them instead of building.
+    The tables are built once per process, whichever thread asks first.
+    """
+    key = (parser_cls, unit_elimination)
+    tables = _tables.get(key)
+    if tables is not None:
+        return tables
+    with _tables_lock:
+        tables = _tables.get(key)
+        if tables is None:
+            tables = _tables[key] = _load_tables(parser_cls, unit_elimination, cachedir)
+    return tables
+
+
+def write_file(path, data):
+    """ Write ``data`` to ``path`` through a temporary file of our own, so
+    processes filling the same cache concurrently never see a partial file.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        # Another process may hold the file it just wrote (Windows); its
+        # copy is as good as ours.
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        if not os.path.exists(path):
+            raise
+
+
+def _load_tables(parser_cls, unit_elimination, cachedir):
+    grammar = Grammar(get_rules(parser_cls), getattr(parser_cls, 'precedence', ()),
+                      passthrough_names(parser_cls))
+    if cachedir is None:
+        tables = LRTables(grammar, unit_elimination)
+    else:
+        cachedir = pathlib.Path(cachedir)
+        cachedir.mkdir(parents=True, exist_ok=True)
+        path = cachedir / ('lalr_%s_%s_%d_%d.pickle' % (parser_cls.__name__, grammar.signature(),
+                                                       unit_elimination, TABLE_VERSION))
+        try:
+            with open(path, 'rb') as fd:
+                tables = pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            tables = LRTables(grammar, unit_elimination)
+            write_file(path, pickle.dumps(tables, pickle.HIGHEST_PROTOCOL))
+        else:
+            tables.grammar = grammar
+    return tables
+
+
+class _Abort(Exception):
+    pass
+
+
+class LRParser(object):
+    """ Table-driven LALR(1) parser running the actions of ``parser`` """
+
+    def __init__(self, parser, unit_elimination=False, convention=SEQUENCE, expressions=False):
+        """ ``convention`` is ``'sequence'``, ``'positional'`` or a dict mapping
+        ``p_*`` names to either; unlisted rules use the Pison sequence.
+        ``expressions=True`` parses ``expression`` with ``pratt.ExpressionParser``.
+        """
+        self.parser = parser
+        self.stats = getattr(parser, 'stats', None)
+        if self.stats is not None:
+            with self.stats.phase('table'):
+                self.tables = get_tables(type(parser), unit_elimination)
+        else:
+            self.tables = get_tables(type(parser), unit_elimination)
+        self.actions = [None]
+        self.positional = [False]
+        for prod in self.tables.grammar.productions[1:]:
+            conv = convention.get(prod.name, SEQUENCE) if isinstance(convention, dict) else convention
+            if conv == POSITIONAL:
+                self.actions.append(positional_action(parser, prod.name, len(prod.rhs)))
+            else:
+                self.actions.append(getattr(parser, prod.name))
+            self.positional.append(conv == POSITIONAL)
+        self.action = self.tables.action
+        self.goto = self.tables.goto
+        self.expressions = None
+        if expressions:
+            from pratt import ExpressionParser
+            self.expressions = ExpressionParser(self)
+            self.action = self.expressions.tables.action
+            self.goto = self.expressions.tables.goto
+
+    def reduce(self, r, args):
+        """ Run the action of production ``r`` on the values ``args`` """
+        if self.positional[r]:
+            return self.actions[r](*args)
+        p = [None]
+        p.extend(args)
+        self.actions[r](p)
+        return p[0]
+
+    def parse(self, tokens):
+        if self.stats is None:
+            return self._parse(tokens)
+        return self.stats.measure_parse(self._parse, tokens)
+
+    def _parse(self, tokens):
+        nxt = iter(tokens).__next__
+        try:
+            tok = nxt()
+            a = tok.type
+        except StopIteration:
+            tok = None
+            a = END
+        try:
+            return self.run([0], [None], tok, a, nxt)[0]
+        except _Abort:
+            return None
+
+    def run(self, states, values, tok, a, nxt):
+        """ Run the automaton from ``states``/``values`` until it accepts.
+
+        ``tok`` is the lookahead token (``a`` its type) and ``nxt`` pulls the
+        following ones. Returns ``(value, tok, a)``.
+        """
+        action = self.action
+        goto = self.goto
+        rhs_len = self.tables.rhs_len
+        lhs = self.tables.lhs
+        actions = self.actions
+        positional = self.positional
+        fast = len(action)
+
+        while True:
+            act = action[states[-1]].get(a)
+            if act is None:
+                self.parser.error(tok)
+                raise _Abort()
+            if act > 0:
+                if act >= fast:
+                    # An expression begins, see pratt.ExpressionTables
+                    value, tok, a = self.expressions.parse(states[-1], tok, a, nxt)
+                    states.append(goto[states[-1]][self.expressions.symbol])
+                    values.append(value)
+                    continue
+                states.append(act)
+                values.append(tok.value)
+                try:
+                    tok = nxt()
+                    a = tok.type
+                except StopIteration:
+                    tok = None
+                    a = END
+            elif act < 0:
+                r = -act
+                n = rhs_len[r]
+                if positional[r]:
+                    if n == 1:
+                        states.pop()
+                        value = actions[r](values.pop())
+                    elif n:
+                        args = values[-n:]
+                        del states[-n:]
+                        del values[-n:]
+                        value = actions[r](*args)
+                    else:
+                        value = actions[r]()
+                else:
+                    p = [None]
+                    if n:
+                        p.extend(values[-n:])
+                        del states[-n:]
+                        del values[-n:]
+                    actions[r](p)
+                    value = p[0]
+                states.append(goto[states[-1]][lhs[r]])
+                values.append(value)
+            else:
+                return values[-1], tok, a
+
+
+if __name__ == '__main__':
+    import time
+    from lex import VerilogLexerPlex
+    from par_lalr import VerilogParser
+    from stats import ParseStats
+
+    def error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    paths = sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'verilog_example_1.v')]
+    sources = []
+    for path in paths:
+        with open(path) as fd:
+            lexer = VerilogLexerPlex(error_func=error)
+            lexer.input(fd.read())
+            sources.append(list(lexer))
+
+    cachedir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    get_rules(VerilogParser)
+    passthrough_names(VerilogParser)
+    print('rules from source:     %.1f ms' % ((time.perf_counter() - start) * 1e3))
+    for label in ('build', 'build + pickle', 'unpickle'):
+        _tables.clear()
+        start = time.perf_counter()
+        get_tables(VerilogParser, True, None if label == 'build' else cachedir)
+        print('tables, %-14s %.1f ms' % (label + ':', (time.perf_counter() - start) * 1e3))
+
+    counts = {}
+    for unit_elimination in (False, True):
+        stats = ParseStats()
+        engine = LRParser(VerilogParser(stats=stats), unit_elimination)
+        for tokens in sources:
+            engine.parse(tokens)
+        counts[unit_elimination] = stats.total_reductions
+    tables = get_tables(VerilogParser, True)
+    print('reductions: %d -> %d, eliminated %d (%.1f%%), %d unit states' %
+          (counts[False], counts[True], counts[False] - counts[True],
+           100.0 * (counts[False] - counts[True]) / max(counts[False], 1),
+           len(tables.unit_states)))
+
+    repeat = 20
+    for unit_elimination in (False, True):
+        for convention in (SEQUENCE, POSITIONAL):
+            engine = LRParser(VerilogParser(), unit_elimination, convention)
+            start = time.perf_counter()
+            for i in range(repeat):
+                for tokens in sources:
+                    engine.parse(tokens)
+            elapsed = time.perf_counter() - start
+            print('unit_elimination=%-5s convention=%-10s %.3f ms/pass' %
+                  (unit_elimination, convention, elapsed / repeat * 1e3))
@@ -22,17 +22,31 @@ import re
 from plex import Lexer
 
 
+DEFAULT_NETTYPE = re.compile(r"^`default_nettype\s+(.+)\n")
+
+
 class VerilogLexerPlex(Lexer):
     """ Verilog Lexical Analayzer by Plex"""
     __ = __
 
-    def __init__(self ,error_func):
+    def __init__(self ,error_func, stats=None):
         super().__init__()
-        self.filename = ''
         self.error_func = error_func
+        self.stats = stats
+        self.reset()
+
+    def reset(self, filename=''):
+        """ Clear the state collected from the previous input """
+        self.filename = filename
         self.directives = []
         self.default_nettype = 'wire'
 
+    def __iter__(self):
+        tokens = super().__iter__()
+        if self.stats is None:
+            return tokens
+        return self.stats.count_tokens(tokens)
+
     def _error(self, msg, token):
         location = self._make_tok_location(token)
         self.error_func(msg, location[0], location[1])
@@ -72,7 +86,7 @@ class VerilogLexerPlex(Lexer):
     def t_DIRECTIVE(self, t):
         self.directives.append((self.lexer.lineno, t.value))
         self.lineno += t.value.count("\n")
-        m = re.match(r"^`default_nettype\s+(.+)\n", t.value)
+        m = DEFAULT_NETTYPE.match(t.value)
         if m:
             self.default_nettype = m.group(1)
         pass
@@ -0,0 +1,465 @@
+"""
+   Compile the LALR(1) automaton of a parser class into a Python module.
+
+   ``generate`` writes one function ``_s<K>(self, a, tok, states, values)``
+   per state, with the ACTION row of the state turned into code: shifts on
+   a few token types are ``if`` tests, larger shift sets one lookup in a
+   dict of the state, and the biggest group of reductions of the state is
+   its default, taken without looking at the token at all. The state stack
+   holds the state functions themselves, so the parse loop is a threaded
+   dispatch: it calls ``states[-1]`` until a token is shifted.
+
+   After a reduction the GOTO target is written into the state function
+   whenever the states the right-hand side can sit on all lead to the same
+   one; only the others look it up in the GOTO column of the nonterminal.
+   The value stack is handled inline as well:
+   the reduction unpacks the right-hand side into locals and runs the body
+   of the ``p_*`` action, rewritten by ``actions.rewrite_action``.
+   Pass-through productions only touch the state stack. Actions that
+   cannot be rewritten, or that are wrapped on the parser instance (stats,
+   profiler), go to a reducer ``_r<N>(self, values)`` calling them with the
+   usual ``p`` sequence.
+
+   ``load`` keeps the generated module in ``outputdir``, by default
+   ``cache_dir()``, under a name keyed by a hash of the rules, the action
+   sources and the precedence list, so a later process neither rebuilds the
+   tables nor regenerates the code.
+   ``CompiledParser`` runs it and is a drop-in for ``lalr.LRParser``.
+
+   The generated tables and reducers are immutable and keep no state of
+   their own; everything a parse changes lives on its stacks and on the
+   parser object passed to the reducers. ``shared_parser`` therefore hands
+   out one engine per parser class for the whole process. Each parse
+   passes a ``VerilogParser.context()`` of its own, so threads parse
+   concurrently without locks. Locks are taken only while loading.
+"""
+
+import io
+import os
+import ast
+import sys
+import hashlib
+import inspect
+import pathlib
+import threading
+
+from rules import get_rules
+from actions import rewrite_action
+from lalr import END, get_tables, write_file
+
+
+VERSION = 3
+
+# Up to this many shift targets are tested with ``if``, more go to a dict.
+SHIFT_TESTS = 4
+
+_loaded = {}
+_shared = {}
+_lock = threading.RLock()
+
+
+def cache_dir():
+    """ Per-user directory of the generated modules """
+    base = os.environ.get('XDG_CACHE_HOME') or os.environ.get('LOCALAPPDATA')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'verilog', 'lrtab')
+
+
+def _source(func):
+    try:
+        return inspect.getsource(func)
+    except (OSError, TypeError):
+        return repr(func)
+
+
+class _Reject(Exception):
+    """ Raised by a state function on a token it has no action for """
+
+
+def grammar_hash(parser_cls, unit_elimination=True, methods=()):
+    """ Hash of everything the generated module depends on """
+    h = hashlib.sha1()
+    h.update(repr((VERSION, unit_elimination, getattr(parser_cls, 'precedence', ()),
+                   tuple(sorted(methods)))).encode())
+    for rule in get_rules(parser_cls):
+        h.update(repr((rule.name, rule.lhs, rule.rhs, rule.prec)).encode())
+    for name in sorted(set(rule.name for rule in get_rules(parser_cls))):
+        h.update(_source(getattr(parser_cls, name)).encode())
+    return h.hexdigest()[:16]
+
+
+class _Store(ast.NodeTransformer):
+    """ Turn ``return value`` into storing ``value`` on the value stack """
+
+    def __init__(self, nargs):
+        self.nargs = nargs
+
+    def visit_Return(self, node):
+        values = ast.Name('_values', ast.Load())
+        if self.nargs:
+            target = ast.Subscript(values, ast.UnaryOp(ast.USub(), ast.Constant(1)), ast.Store())
+            store = ast.Assign([target], node.value)
+        else:
+            store = ast.Expr(ast.Call(ast.Attribute(values, 'append', ast.Load()), [node.value], []))
+        return [ast.copy_location(store, node), ast.copy_location(ast.Return(None), node)]
+
+
+def _reducer(r, prod, func, module_globals, method=False):
+    """ ``(body, self name, inline)`` of the reducer of production ``r``.
+
+    The body replaces the top ``len(prod.rhs)`` values by the result of the
+    action; ``inline`` tells whether it can go into a state function.
+    """
+    n = len(prod.rhs)
+    node = None
+    if not method and getattr(func, '__globals__', None) is module_globals:
+        node = rewrite_action(func, n)
+    if node is None:
+        # Not rewritable: call the method with a ``p`` sequence.
+        pop = 'p = [None]\n'
+        if n:
+            pop += 'p.extend(_values[-%d:])\ndel _values[-%d:]\n' % (n, n)
+        return pop + 'self.%s(p)\n_values.append(p[0])\n' % prod.name, 'self', False
+
+    if n == 1:
+        pop = '_p1 = _values[-1]\n'
+    elif n:
+        pop = '%s = _values[-%d:]\ndel _values[-%d:]\n' % (
+            ', '.join('_p%d' % k for k in range(1, n + 1)), n, n - 1)
+    else:
+        pop = ''
+    body = _Store(n).visit(ast.Module(node.body, type_ignores=[])).body
+    if isinstance(body[-1], ast.Return):
+        body.pop()
+    # An early return cannot be inlined, nor a body using the names of the
+    # state function's arguments.
+    inline = node.args.args[0].arg == 'self'
+    for stmt in body:
+        for sub in ast.walk(stmt):
+            if isinstance(sub, ast.Return) or (isinstance(sub, ast.Name) and
+                                               sub.id in ('_a', '_tok', '_states', '_s')):
+                inline = False
+    body = ast.unparse(ast.fix_missing_locations(ast.Module(body, type_ignores=[])))
+    return '# %s\n' % prod.name + pop + body + '\n', node.args.args[0].arg, inline
+
+
+def _indent(code, depth):
+    return ''.join(' ' * depth + line + '\n' for line in code.splitlines())
+
+
+def _predecessors(tables):
+    """ ``pred(k, rhs)``: the states that can lie ``len(rhs)`` entries below
+    state ``k`` on the state stack when ``rhs`` is on top of it.
+
+    It walks the edges of the final tables backwards. With unit
+    elimination a symbol may have been pushed through the edge of any
+    symbol reaching it over pass-through productions, so those count too.
+    """
+    g = tables.grammar
+    stands = dict((sym, set([sym])) for sym in g.terminals + g.nonterminals)
+    changed = True
+    while changed:
+        changed = False
+        for r in g.passthrough:
+            lhs, rhs = g.productions[r].lhs, g.productions[r].rhs[0]
+            for sym, below in stands.items():
+                if lhs in below and rhs not in below:
+                    below.add(rhs)
+                    changed = True
+
+    into = [{} for row in tables.action]
+    for rows in (tables.action, tables.goto):
+        for k, row in enumerate(rows):
+            for sym, t in row.items():
+                if t > 0:
+                    into[t].setdefault(sym, set()).add(k)
+
+    def pred(k, rhs):
+        ret = set([k])
+        for sym in reversed(rhs):
+            ret = set(p for q in ret for y in stands[sym] for p in into[q].get(y, ()))
+        return ret
+    return pred
+
+
+def _test(terminals):
+    if len(terminals) == 1:
+        return '_a == %r' % terminals[0]
+    return '_a in %r' % (tuple(sorted(terminals)),)
+
+
+def _state(k, row, tables, pred, reducers, dynamic):
+    """ Source of the function of state ``k`` and, in ``dynamic``, the
+    nonterminals whose GOTO it has to look up
+    """
+    out = ['def _s%d(self, _a, _tok, _states, _values):\n' % k]
+    shifts = {}
+    reductions = {}
+    accept = []
+    for a, act in row.items():
+        if act > 0:
+            shifts.setdefault(act, []).append(a)
+        elif act < 0:
+            reductions.setdefault(-act, []).append(a)
+        else:
+            accept.append(a)
+
+    push = ('        _states.append(%s)\n        _values.append(_tok.value)\n'
+            '        return 1\n')
+    if len(shifts) > SHIFT_TESTS:
+        out.append('    _s = _SH%d.get(_a)\n    if _s is not None:\n' % k + push % '_s')
+    else:
+        for t, terminals in sorted(shifts.items(), key=lambda e: -len(e[1])):
+            out.append('    if %s:\n' % _test(terminals) + push % ('_s%d' % t))
+    if accept:
+        out.append('    if %s:\n        return 2\n' % _test(accept))
+
+    # The largest group of reductions is the default one.
+    groups = sorted(reductions.items(), key=lambda e: (len(e[1]), -e[0]))
+    for i, (r, terminals) in enumerate(reversed(groups)):
+        n = tables.rhs_len[r]
+        lhs = tables.lhs[r]
+        code = ''
+        if r in reducers:
+            body, name, inline = reducers[r]
+            code += body if inline else '_r%d(self, _values)\n' % r
+        rhs = tables.grammar.productions[r].rhs
+        targets = set(tables.goto[p][lhs] for p in pred(k, rhs) if lhs in tables.goto[p])
+        if len(targets) == 1:
+            target = '_s%d' % targets.pop()
+        else:
+            dynamic.add(lhs)
+            target = '_G_%s[_states[%d]]' % (lhs, -2 if n else -1)
+        if n == 0:
+            code += '_states.append(%s)\n' % target
+        else:
+            if n > 1:
+                code += 'del _states[-%d:]\n' % (n - 1)
+            code += '_states[-1] = %s\n' % target
+        code += 'return 0\n'
+        if i == 0:
+            default = code
+            continue
+        out.append('    if %s:\n' % _test(terminals) + _indent(code, 8))
+    if reductions:
+        out.append(_indent(default, 4))
+    else:
+        out.append('    raise _Reject()\n')
+    return ''.join(out)
+
+
+def generate(parser_cls, unit_elimination=True, buf=None, methods=()):
+    """ Write the module source for ``parser_cls`` to ``buf`` (a new StringIO
+    by default) and return ``buf``.
+
+    The actions named in ``methods`` are called on the parser object
+    instead of being inlined.
+    """
+    buf = io.StringIO() if buf is None else buf
+    tables = get_tables(parser_cls, unit_elimination)
+    grammar = tables.grammar
+    module_globals = sys.modules[parser_cls.__module__].__dict__
+    methods = frozenset(methods)
+
+    buf.write('# Generated by lrcompile.py from %s.%s -- do not edit\n' %
+              (parser_cls.__module__, parser_cls.__qualname__))
+    buf.write('# grammar hash %s\n\n' % grammar_hash(parser_cls, unit_elimination, methods))
+
+    reducers = {}
+    for r, prod in enumerate(grammar.productions[1:], 1):
+        if r in grammar.passthrough and prod.name not in methods:
+            continue
+        func = getattr(parser_cls, prod.name)
+        body, name, inline = reducers[r] = _reducer(r, prod, func, module_globals,
+                                                    prod.name in methods)
+        if not inline:
+            buf.write('def _r%d(%s, _values):\n' % (r, name) + _indent(body, 4) + '\n\n')
+
+    pred = _predecessors(tables)
+    dynamic = set()
+    for k, row in enumerate(tables.action):
+        buf.write(_state(k, row, tables, pred, reducers, dynamic))
+        buf.write('\n\n')
+
+    for k, row in enumerate(tables.action):
+        shifts = dict((a, act) for a, act in row.items() if act > 0)
+        if len(set(shifts.values())) > SHIFT_TESTS:
+            buf.write('_SH%d = {%s}\n' % (k, ', '.join('%r: _s%d' % e for e in shifts.items())))
+    buf.write('\n')
+    for symbol in sorted(dynamic):
+        column = dict((k, row[symbol]) for k, row in enumerate(tables.goto) if symbol in row)
+        buf.write('_G_%s = {%s}\n' % (symbol, ', '.join('_s%d: _s%d' % e for e in column.items())))
+    buf.write('\nSTART = _s0\n')
+    return buf
+
+
+def load(parser_cls, unit_elimination=True, outputdir=None, methods=()):
+    """ Namespace of the generated module for ``parser_cls``.
+
+    The module is read from ``outputdir`` (``cache_dir()`` if None) if a
+    file with the current grammar hash exists there, otherwise generated
+    and written first. It runs in a copy of the globals of the module
+    defining ``parser_cls``, which is what the inlined action bodies refer
+    to.
+    """
+    methods = tuple(sorted(methods))
+    digest = grammar_hash(parser_cls, unit_elimination, methods)
+    key = (parser_cls, digest)
+    namespace = _loaded.get(key)
+    if namespace is not None:
+        return namespace
+    with _lock:
+        namespace = _loaded.get(key)
+        if namespace is None:
+            namespace = _loaded[key] = _load(parser_cls, unit_elimination, outputdir, digest,
+                                             methods)
+    return namespace
+
+
+def _load(parser_cls, unit_elimination, outputdir, digest, methods):
+    outputdir = pathlib.Path(cache_dir() if outputdir is None else outputdir)
+    outputdir.mkdir(parents=True, exist_ok=True)
+    path = outputdir / ('lrtab_%s_%s.py' % (parser_cls.__name__, digest))
+    if path.exists():
+        source = path.read_text(encoding='utf-8')
+    else:
+        source = generate(parser_cls, unit_elimination, methods=methods).getvalue()
+        write_file(path, source.encode('utf-8'))
+
+    namespace = dict(sys.modules[parser_cls.__module__].__dict__)
+    namespace['__name__'] = path.stem
+    namespace['_Reject'] = _Reject
+    exec(compile(source, str(path), 'exec'), namespace)
+    return namespace
+
+
+def shared_parser(parser_cls, unit_elimination=True, outputdir=None):
+    """ The process-wide ``CompiledParser`` of ``parser_cls``.
+
+    It holds no per-parse state: pass ``parser_cls.context(filename)`` to
+    ``parse`` to get a fresh one for each parse.
+    """
+    key = (parser_cls, unit_elimination)
+    engine = _shared.get(key)
+    if engine is None:
+        with _lock:
+            engine = _shared.get(key)
+            if engine is None:
+                engine = _shared[key] = CompiledParser(parser_cls.context(), unit_elimination,
+                                                       outputdir)
+    return engine
+
+
+class CompiledParser(object):
+    """ Parse loop over a module generated by ``generate`` """
+
+    def __init__(self, parser, unit_elimination=True, outputdir=None):
+        self.parser = parser
+        self.stats = getattr(parser, 'stats', None)
+        # Actions wrapped on the instance (stats, profiler) must still be seen.
+        methods = set(rule.name for rule in get_rules(type(parser))
+                      if rule.name in vars(parser))
+        if self.stats is not None:
+            with self.stats.phase('table'):
+                namespace = load(type(parser), unit_elimination, outputdir, methods)
+        else:
+            namespace = load(type(parser), unit_elimination, outputdir, methods)
+        self.start = namespace['START']
+
+    def parse(self, tokens, context=None):
+        """ Parse ``tokens`` with the per-parse state of ``context``, by
+        default the parser this engine was created with. Parses with
+        different contexts may run concurrently.
+        """
+        if self.stats is None:
+            return self._parse(tokens, context)
+        return self.stats.measure_parse(self._parse, tokens, context)
+
+    def _parse(self, tokens, context=None):
+        parser = self.parser if context is None else context
+        states = [self.start]
+        values = [None]
+        tok = None
+        try:
+            # A state function returns 1 once it has shifted the token, 0
+            # after a reduction and 2 on accept, which only comes on END.
+            for tok in tokens:
+                a = tok.type
+                while not states[-1](parser, a, tok, states, values):
+                    pass
+            tok = None
+            while states[-1](parser, END, None, states, values) != 2:
+                pass
+        except _Reject:
+            parser.error(tok)
+            return None
+        return values[-1]
+
+
+if __name__ == '__main__':
+    import os
+    import time
+    import tempfile
+    from lex import VerilogLexerPlex
+    from par_lalr import VerilogParser
+    from lalr import LRParser, _tables
+    from actions import POSITIONAL
+
+    def error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    paths = sys.argv[1:] or [os.path.join(os.path.dirname(__file__), 'verilog_example_1.v')]
+    sources = []
+    for path in paths:
+        with open(path) as fd:
+            lexer = VerilogLexerPlex(error_func=error)
+            lexer.input(fd.read())
+            sources.append(list(lexer))
+
+    outputdir = tempfile.mkdtemp()
+    start = time.perf_counter()
+    load(VerilogParser, True, outputdir)
+    print('tables + generate + load: %.3f s' % (time.perf_counter() - start))
+    _tables.clear()
+    _loaded.clear()
+    start = time.perf_counter()
+    load(VerilogParser, True, outputdir)
+    print('load from %s: %.3f s' % (outputdir, time.perf_counter() - start))
+
+    engines = [
+        ('table-driven', LRParser(VerilogParser(), True, POSITIONAL)),
+        ('compiled', CompiledParser(VerilogParser(), True, outputdir)),
+    ]
+    repeat = 20
+    best = {}
+    for label, engine in engines:
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            for tokens in sources:
+                engine.parse(tokens)
+            times.append(time.perf_counter() - start)
+        best[label] = min(times)
+        print('%-12s %.3f ms/pass (best of %d)' % (label, best[label] * 1e3, repeat))
+    print('speedup %.2fx' % (best['table-driven'] / best['compiled']))
+
+    import threading
+    engine = shared_parser(VerilogParser, True, outputdir)
+    start = time.perf_counter()
+    for i in range(10000):
+        VerilogParser.context('input.v')
+    print('context: %.2f us' % ((time.perf_counter() - start) / 10000 * 1e6))
+
+    def work():
+        for i in range(repeat):
+            for tokens in sources:
+                engine.parse(tokens, VerilogParser.context())
+    threads = [threading.Thread(target=work) for i in range(4)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print('4 threads, shared tables: %.3f ms/pass' %
+          ((time.perf_counter() - start) / (4 * repeat) * 1e3))
@@ -0,0 +1,393 @@
+"""
+   Connectivity graph of a gate-level netlist.
+
+   ``build_netgraph`` turns the ``InstanceList``/``Instance``/``PortArg``
+   connections and ``Assign`` statements of a ``ModuleDef`` into a directed
+   graph. Nets and cells share one integer id space (nets first), every cell
+   pin is interned into the pin arrays, and the adjacency is kept in CSR form
+   (``indptr``/``indices``) for both directions.
+
+   Nets are bit-blasted: a whole vector is connected bit by bit, with the
+   width of its declaration, so that ``n`` and ``n[0]`` are one net.
+
+   The arrays are ``array.array`` objects, or NumPy arrays when NumPy is
+   installed, in which case connected components and the topological
+   levelization run vectorized.
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from astnode import *
+from elaborate import port_names
+from consteval import ConstEvaluator, NotConstant
+
+
+# UNKNOWN pins connect their net and cell for components() but give no
+# edges, so they cannot invent paths or cycles in levels().
+IN, OUT, INOUT, UNKNOWN = 0, 1, 2, 3
+
+_DIRECTIONS = {
+    'in': IN, 'input': IN,
+    'out': OUT, 'output': OUT,
+    'inout': INOUT,
+}
+
+_PORT_TYPES = {Input: IN, Output: OUT, Inout: INOUT}
+
+
+def port_directions(moduledef):
+    """ ``{port name: IN/OUT/INOUT}`` of a ``ModuleDef`` """
+    ret = {}
+    for port in moduledef.portlist.ports if moduledef.portlist else ():
+        if isinstance(port, Ioport) and type(port.first) in _PORT_TYPES:
+            ret[port.first.name] = _PORT_TYPES[type(port.first)]
+    for item in moduledef.items or ():
+        if isinstance(item, Decl):
+            for var in item.list:
+                if type(var) in _PORT_TYPES:
+                    ret[var.name] = _PORT_TYPES[type(var)]
+    return ret
+
+
+def net_widths(moduledef, evaluator=None):
+    """ ``{name: (msb, lsb)}`` of the vectors declared in a ``ModuleDef`` """
+    ev = evaluator or ConstEvaluator()
+    env = ev.module_params(moduledef)
+    variables = []
+    for port in moduledef.portlist.ports if moduledef.portlist else ():
+        if isinstance(port, Ioport):
+            variables.extend(v for v in (port.first, port.second) if v is not None)
+    for item in moduledef.items or ():
+        if isinstance(item, Decl):
+            variables.extend(item.list)
+    ret = {}
+    for var in variables:
+        if isinstance(var, Variable) and var.width is not None:
+            try:
+                ret[var.name] = ev.range(var.width, env)
+            except NotConstant:
+                pass
+    return ret
+
+
+def _const(node):
+    if isinstance(node, IntConst):
+        try:
+            return node.decoded.to_int()
+        except ValueError:
+            return None
+    return None
+
+
+def _bits(name, msb, lsb):
+    step = -1 if msb > lsb else 1
+    for i in range(msb, lsb + step, step):
+        yield '%s[%d]' % (name, i)
+
+
+def net_names(expr, widths=None):
+    """ Names of the nets (bit-blasted where constant) an expression touches.
+
+    ``widths`` (see ``net_widths``) blasts whole vectors, most significant
+    bit first.
+    """
+    if expr is None:
+        return
+    if isinstance(expr, Identifier):
+        if widths and expr.name in widths:
+            for name in _bits(expr.name, *widths[expr.name]):
+                yield name
+        else:
+            yield expr.name
+    elif isinstance(expr, Pointer) and isinstance(expr.var, Identifier) and \
+            _const(expr.ptr) is not None:
+        yield '%s[%d]' % (expr.var.name, _const(expr.ptr))
+    elif isinstance(expr, Partselect) and isinstance(expr.var, Identifier) and \
+            _const(expr.msb) is not None and _const(expr.lsb) is not None:
+        for name in _bits(expr.var.name, _const(expr.msb), _const(expr.lsb)):
+            yield name
+    elif not isinstance(expr, Constant):
+        for c in expr.children():
+            for name in net_names(c, widths):
+                yield name
+
+
+def _is_reference(expr):
+    """ True if ``expr`` only names nets, so its bits map one to one """
+    if isinstance(expr, (Identifier, Pointer, Partselect)):
+        return True
+    return isinstance(expr, Concat) and all(_is_reference(c) for c in expr.list)
+
+
+def _csr(n, src, dst):
+    """ (indptr, indices) of the edges ``src[i] -> dst[i]`` over ``n`` nodes """
+    if numpy is not None:
+        src = numpy.frombuffer(src, dtype=numpy.int64) if len(src) else numpy.zeros(0, numpy.int64)
+        dst = numpy.frombuffer(dst, dtype=numpy.int64) if len(dst) else numpy.zeros(0, numpy.int64)
+        order = numpy.argsort(src, kind='stable')
+        indptr = numpy.zeros(n + 1, numpy.int64)
+        numpy.cumsum(numpy.bincount(src, minlength=n), out=indptr[1:])
+        return indptr, dst[order]
+    indptr = array('q', bytes(8 * (n + 1)))
+    for s in src:
+        indptr[s + 1] += 1
+    for i in range(n):
+        indptr[i + 1] += indptr[i]
+    fill = array('q', indptr)
+    indices = array('q', bytes(8 * len(src)))
+    for s, d in zip(src, dst):
+        indices[fill[s]] = d
+        fill[s] += 1
+    return indptr, indices
+
+
+class NetGraph(object):
+    """ Directed net/cell graph with CSR adjacency """
+
+    def __init__(self):
+        self.nets = []          # net id -> name
+        self.net_ids = {}
+        self.cells = []         # cell index -> instance name
+        self.cell_modules = []  # cell index -> module name
+        self.port_names = []    # port name id -> name
+        self.port_ids = {}
+        self.pin_cell = array('q')
+        self.pin_port = array('q')
+        self.pin_net = array('q')
+        self.pin_dir = array('b')
+        self._src = array('q')
+        self._dst = array('q')
+        self.indptr = self.indices = None
+        self.rindptr = self.rindices = None
+
+    # --------------------------------------------------------------------------
+    def net(self, name):
+        i = self.net_ids.get(name)
+        if i is None:
+            i = self.net_ids[name] = len(self.nets)
+            self.nets.append(name)
+        return i
+
+    def _port(self, name):
+        i = self.port_ids.get(name)
+        if i is None:
+            i = self.port_ids[name] = len(self.port_names)
+            self.port_names.append(name)
+        return i
+
+    def add_cell(self, name, module):
+        self.cells.append(name)
+        self.cell_modules.append(module)
+        return len(self.cells) - 1
+
+    def add_pin(self, cell, port, net, direction):
+        self.pin_cell.append(cell)
+        self.pin_port.append(self._port(port))
+        self.pin_net.append(net)
+        self.pin_dir.append(direction)
+
+    def add_edge(self, src, dst):
+        """ Edge between two net ids; cell edges are derived from the pins """
+        self._src.append(src)
+        self._dst.append(dst)
+
+    def freeze(self):
+        """ Build the forward and reverse CSR arrays """
+        n = self.size
+        net_count = len(self.nets)
+        # Pins refer to cells by index; cells follow the nets in the node ids.
+        for cell, net, direction in zip(self.pin_cell, self.pin_net, self.pin_dir):
+            if direction == UNKNOWN:
+                continue
+            if direction != OUT:
+                self.add_edge(net, net_count + cell)
+            if direction != IN:
+                self.add_edge(net_count + cell, net)
+        self.indptr, self.indices = _csr(n, self._src, self._dst)
+        self.rindptr, self.rindices = _csr(n, self._dst, self._src)
+        self._src = self._dst = None
+        return self
+
+    # --------------------------------------------------------------------------
+    @property
+    def size(self):
+        return len(self.nets) + len(self.cells)
+
+    def cell_node(self, cell):
+        return len(self.nets) + cell
+
+    def is_net(self, node):
+        return node < len(self.nets)
+
+    def node_name(self, node):
+        if node < len(self.nets):
+            return self.nets[node]
+        return self.cells[node - len(self.nets)]
+
+    def fanout(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def fanin(self, node):
+        return self.rindices[self.rindptr[node]:self.rindptr[node + 1]]
+
+    def pins(self, cell):
+        """ ``(port name, net name, direction)`` of a cell """
+        for i, c in enumerate(self.pin_cell):
+            if c == cell:
+                yield (self.port_names[self.pin_port[i]], self.nets[self.pin_net[i]],
+                       self.pin_dir[i])
+
+    # --------------------------------------------------------------------------
+    def _unknown_pins(self):
+        """ ``(net node, cell node)`` of the pins without a direction """
+        net_count = len(self.nets)
+        for cell, net, direction in zip(self.pin_cell, self.pin_net, self.pin_dir):
+            if direction == UNKNOWN:
+                yield net, net_count + cell
+
+    def components(self):
+        """ Weakly connected component label of every node, counting the
+        pins of unknown direction as connections """
+        n = self.size
+        unknown = list(self._unknown_pins())
+        if numpy is not None:
+            labels = numpy.arange(n, dtype=numpy.int64)
+            src = numpy.repeat(numpy.arange(n, dtype=numpy.int64), numpy.diff(self.indptr))
+            dst = numpy.asarray(self.indices)
+            if unknown:
+                pairs = numpy.array(unknown, dtype=numpy.int64)
+                src = numpy.concatenate((src, pairs[:, 0]))
+                dst = numpy.concatenate((dst, pairs[:, 1]))
+            while True:
+                prev = labels.copy()
+                m = numpy.minimum(labels[src], labels[dst])
+                numpy.minimum.at(labels, src, m)
+                numpy.minimum.at(labels, dst, m)
+                labels = labels[labels]     # pointer jumping
+                if numpy.array_equal(labels, prev):
+                    return labels
+        parent = array('q', range(n))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def union(s, d):
+            a, b = find(s), find(d)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+        for s in range(n):
+            for d in self.fanout(s):
+                union(s, d)
+        for s, d in unknown:
+            union(s, d)
+        return array('q', (find(x) for x in range(n)))
+
+    def levels(self):
+        """ Topological levels as a list of node-id arrays.
+
+        Nodes on a combinational cycle never reach in-degree zero; they are
+        returned separately as ``(levels, cyclic)``.
+        """
+        n = self.size
+        if numpy is not None:
+            indeg = numpy.diff(numpy.asarray(self.rindptr))
+            frontier = numpy.flatnonzero(indeg == 0)
+            levels = []
+            done = numpy.zeros(n, bool)
+            while len(frontier):
+                levels.append(frontier)
+                done[frontier] = True
+                starts = numpy.asarray(self.indptr)[frontier]
+                counts = numpy.asarray(self.indptr)[frontier + 1] - starts
+                offsets = numpy.repeat(starts - numpy.cumsum(counts) + counts, counts) + \
+                    numpy.arange(counts.sum())
+                targets = numpy.asarray(self.indices)[offsets]
+                indeg = indeg - numpy.bincount(targets, minlength=n)
+                frontier = numpy.flatnonzero((indeg == 0) & ~done)
+            return levels, numpy.flatnonzero(~done)
+
+        indeg = array('q', (self.rindptr[i + 1] - self.rindptr[i] for i in range(n)))
+        frontier = array('q', (i for i in range(n) if indeg[i] == 0))
+        levels = []
+        seen = 0
+        while frontier:
+            levels.append(frontier)
+            seen += len(frontier)
+            nxt = array('q')
+            for s in frontier:
+                for d in self.fanout(s):
+                    indeg[d] -= 1
+                    if indeg[d] == 0:
+                        nxt.append(d)
+            frontier = nxt
+        cyclic = array('q', (i for i in range(n) if indeg[i] > 0)) if seen < n else array('q')
+        return levels, cyclic
+
+    def topological_order(self):
+        levels, cyclic = self.levels()
+        order = array('q')
+        for level in levels:
+            order.extend(level)
+        return order, cyclic
+
+
+def build_netgraph(moduledef, modules=None, directions=None):
+    """ Build the ``NetGraph`` of ``moduledef``.
+
+    Pin directions come from ``directions`` (``{module: {port: 'input'|
+    'output'|'inout'}}``) or, failing that, from the port declarations of the
+    cell's ``ModuleDef`` in ``modules``; any other pin is ``UNKNOWN``.
+    """
+    modules = modules or {}
+    directions = directions or {}
+    cache = {}
+
+    def cell_ports(module):
+        ret = cache.get(module)
+        if ret is None:
+            dirs = dict((k, _DIRECTIONS[v]) for k, v in directions.get(module, {}).items())
+            names = []
+            target = modules.get(module)
+            if target is not None:
+                names = port_names(target)
+                for k, v in port_directions(target).items():
+                    dirs.setdefault(k, v)
+            ret = cache[module] = (names, dirs)
+        return ret
+
+    widths = net_widths(moduledef)
+    g = NetGraph()
+    for item in moduledef.items or ():
+        if isinstance(item, InstanceList):
+            names, dirs = cell_ports(item.module)
+            for inst in item.instances:
+                cell = g.add_cell(inst.name, item.module)
+                for i, arg in enumerate(inst.portlist or ()):
+                    port = arg.portname
+                    if port is None:
+                        port = names[i] if i < len(names) else str(i)
+                    direction = dirs.get(port, UNKNOWN)
+                    for name in net_names(arg.argname, widths):
+                        g.add_pin(cell, port, g.net(name), direction)
+        elif isinstance(item, Assign):
+            dsts = [g.net(name) for name in net_names(item.left, widths)]
+            srcs = [g.net(name) for name in net_names(item.right, widths)]
+            if len(srcs) == len(dsts) and _is_reference(item.left.var) and \
+                    _is_reference(item.right.var):
+                # A plain copy connects bit to bit
+                for s, d in zip(srcs, dsts):
+                    g.add_edge(s, d)
+                continue
+            for s in srcs:
+                for d in dsts:
+                    g.add_edge(s, d)
+    return g.freeze()
@@ -23,12 +23,41 @@ __ = 0
 class VerilogParser(Parser):
     'Verilog HDL Parser'
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.filename = '__FILE__'
+    def __init__(self, *args, stats=None, profiler=None, **kwargs):
+        self.stats = stats
+        self.profiler = profiler
+        if profiler is not None:
+            profiler.instrument_parser(self)
+        if stats is not None:
+            stats.instrument_parser(self)
+            with stats.phase('table'):
+                super().__init__(*args, **kwargs)
+        else:
+            super().__init__(*args, **kwargs)
+        self.reset()
+
+    @classmethod
+    def context(cls, filename='__FILE__'):
+        """ An instance holding only the per-parse state, for engines that
+        share their tables between instances (see ``lrcompile.shared_parser``)
+        """
+        self = cls.__new__(cls)
+        self.stats = None
+        self.profiler = None
+        self.reset(filename)
+        return self
+
+    def reset(self, filename='__FILE__'):
+        """ Clear the per-parse state """
+        self.filename = filename
         self.directives = []
         self.default_nettype = 'wire'
 
+    def parse(self, tokens, *args, **kwargs):
+        if self.stats is None:
+            return super().parse(tokens, *args, **kwargs)
+        return self.stats.measure_parse(super().parse, tokens, *args, **kwargs)
+
     def get_directives(self):
         return tuple(self.directives)
 
@@ -0,0 +1,263 @@
+"""
+   Chunked parallel lexing of one large source.
+
+   ``ParallelLexer`` splits the input right after newlines into chunks of
+   about ``chunk_size`` characters and lexes them speculatively in worker
+   processes, each as if it started a file. Line numbers and offsets are
+   relative to the chunk and are shifted while merging.
+
+   A chunk boundary is only a problem if a token spans it. In this lexer
+   that can only be a block comment: directives and line comments end at
+   their newline, strings cannot contain one, and a run of newlines split
+   in two only counts lines. A block comment left open at the end of a
+   chunk shows up in the speculative tokens as a ``DIVIDE`` directly
+   followed by ``TIMES`` or ``POWER``, because ``/\\*(.|\\n)*?\\*/`` found
+   no end. The tokens before it stand. From the ``/`` on the parent lexes
+   again, across the boundary, until one of its tokens starts where a
+   speculative token of the next chunk starts: the lexer keeps no state
+   between tokens, so from there on both agree and the rest of the
+   speculative chunk is used as it is. A comment still open at the end of
+   the next chunk takes in one more, and so on up to the end of the input,
+   where the result is what the sequential lexer gives for an unterminated
+   comment.
+
+   Workers hand their tokens back as ``TokenColumns``, a list of types, a
+   list of values and two ``array('q')`` columns: unpickling a list of
+   token tuples costs the parent more than the lexing it saves.
+
+   The merged stream holds ``tokcache.CachedToken`` tuples with the same
+   type, value, line number and offset as the sequential tokens. Lexing
+   errors are replayed to ``error_func`` in order with their sequential
+   location, and ``directives`` and ``default_nettype`` end up as after a
+   sequential run.
+"""
+
+import os
+from array import array
+
+from lex import VerilogLexerPlex, DEFAULT_NETTYPE
+from tokcache import CachedToken
+
+
+class TokenColumns(object):
+    """ Type, value, line number and offset of a run of tokens, by column """
+
+    def __init__(self):
+        self.types = []
+        self.values = []
+        self.linenos = array('q')
+        self.lexposes = array('q')
+
+    def __len__(self):
+        return len(self.types)
+
+    def append(self, t):
+        self.types.append(t.type)
+        self.values.append(t.value)
+        self.linenos.append(t.lineno)
+        self.lexposes.append(t.lexpos)
+
+
+def _lex(text, stop=None):
+    """ Lex ``text`` as if it were a whole file.
+
+    Returns ``(tokens, errors, directives, opened, synced)`` with the
+    ``TokenColumns`` counted from line 1 and offset 0. ``errors`` are ``(tokens
+    before it, msg, line, column)``, ``opened`` the indices of the
+    ``DIVIDE`` tokens that start an unterminated comment. With ``stop``, a
+    dict from offsets to values, lexing ends before the first token at one
+    of them and ``synced`` is its value; otherwise it is None.
+    """
+    tokens = TokenColumns()
+    errors = []
+    opened = []
+
+    def error(msg, line, column):
+        errors.append((len(tokens), msg, line, column))
+
+    lexer = VerilogLexerPlex(error_func=error)
+    lexer.input(text)
+    previous = None
+    for t in lexer:
+        if (previous is not None and previous.type == 'DIVIDE' and
+                previous.lexpos + 1 == t.lexpos and t.value[0] == '*'):
+            opened.append(len(tokens) - 1)
+        if stop is not None and t.lexpos in stop:
+            return tokens, errors, lexer.directives, opened, stop[t.lexpos]
+        tokens.append(t)
+        previous = t
+    return tokens, errors, lexer.directives, opened, None
+
+
+def split_lines(text, chunk_size):
+    """ ``[start, end)`` offsets of chunks of ``text`` ending after a newline """
+    bounds = []
+    start = 0
+    while start < len(text):
+        end = text.find('\n', start + chunk_size)
+        end = len(text) if end < 0 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+class ParallelLexer(object):
+    """ ``VerilogLexerPlex`` over worker processes, for very large inputs """
+
+    def __init__(self, error_func, processes=None, chunk_size=1 << 20):
+        self.error_func = error_func
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.repaired = 0       # chunk boundaries inside a block comment
+        self.reset()
+
+    def reset(self, filename=''):
+        self.filename = filename
+        self.directives = []
+        self.default_nettype = 'wire'
+        self.text = ''
+
+    def input(self, text):
+        self.text = text
+
+    def __iter__(self):
+        text = self.text
+        bounds = split_lines(text, self.chunk_size)
+        if len(bounds) <= 1 or self.processes <= 1:
+            return self._merge(bounds, map(_lex, (text[s:e] for s, e in bounds)))
+        return self._parallel(bounds)
+
+    def _parallel(self, bounds):
+        import multiprocessing
+        text = self.text
+        with multiprocessing.Pool(self.processes) as pool:
+            yield from self._merge(bounds, pool.imap(_lex, (text[s:e] for s, e in bounds)))
+
+    # --------------------------------------------------------------------------
+    def _merge(self, bounds, results):
+        text = self.text
+        results = iter(results)
+        lines = [1]
+        for start, end in bounds:
+            lines.append(lines[-1] + text.count('\n', start, end))
+
+        last = len(bounds) - 1
+        k = 0
+        lexed = next(results, None)
+        first, fresh = 0, True
+        while k <= last:
+            start, line = bounds[k][0], lines[k]
+            tokens = lexed[0]
+            opened = [j for j in lexed[3] if j >= first]
+            if not opened or k == last:
+                yield from self._emit(lexed, start, line, first, len(tokens), fresh)
+                k += 1
+                lexed = next(results, None)
+                first, fresh = 0, True
+                continue
+
+            j = opened[0]
+            yield from self._emit(lexed, start, line, first, j, fresh)
+            self.repaired += 1
+            start, line = start + tokens.lexposes[j], line + tokens.linenos[j] - 1
+            while True:
+                k += 1
+                lexed = next(results)
+                offset = bounds[k][0] - start
+                stop = dict((p + offset, i) for i, p in enumerate(lexed[0].lexposes))
+                region = _lex(text[start:bounds[k][1]], stop)
+                if region[3]:
+                    # Still open at the end of chunk k
+                    if k < last:
+                        continue
+                    if region[4] is not None:
+                        region = _lex(text[start:])
+                yield from self._emit(region, start, line, 0, len(region[0]), True)
+                if region[4] is None:
+                    k += 1
+                    lexed = next(results, None)
+                    first, fresh = 0, True
+                else:
+                    first, fresh = region[4], False
+                break
+
+        for n, value in self.directives:
+            m = DEFAULT_NETTYPE.match(value)
+            if m:
+                self.default_nettype = m.group(1)
+
+    def _emit(self, lexed, start, line, first, end, fresh):
+        """ Tokens ``[first, end)`` of a piece lexed from ``start``, whose
+        first line is ``line``, with the errors and directives among them.
+        Unless ``fresh`` the piece is entered at token ``first``, and what
+        precedes that token is someone else's.
+        """
+        tokens, errors, directives = lexed[:3]
+        types, values, linenos, lexposes = tokens.types, tokens.values, tokens.linenos, tokens.lexposes
+        shift = line - 1
+        low = None if fresh else linenos[first]
+        high = linenos[end] if end < len(tokens) else None
+        for n, value in directives:
+            if (low is None or n >= low) and (high is None or n < high):
+                self.directives.append((n + shift, value))
+
+        errors = iter([e for e in errors if (e[0] >= first if fresh else e[0] > first) and e[0] <= end])
+        error = next(errors, None)
+        for i in range(first, end):
+            while error is not None and error[0] <= i:
+                self._replay(error, start, shift)
+                error = next(errors, None)
+            yield CachedToken(types[i], values[i], linenos[i] + shift, lexposes[i] + start)
+        while error is not None:
+            self._replay(error, start, shift)
+            error = next(errors, None)
+
+    def _replay(self, error, start, shift):
+        i, msg, n, column = error
+        if n == 1 and start > 0:
+            # The column was counted from the start of the piece;
+            # VerilogLexerPlex._find_tok_column counts from the newline.
+            pos = start + column - 1
+            newline = self.text.rfind('\n', 1, pos + 1)
+            column = pos + 1 if newline < 0 else pos - newline + 1
+        self.error_func(msg, n + shift, column)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    def error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as fd:
+            text = fd.read()
+    else:
+        with open(os.path.join(os.path.dirname(__file__), 'verilog_example_1.v')) as fd:
+            module = fd.read()
+        # Long block comments make sure that some boundaries fall inside one.
+        comment = '/*\n' + ' * wrapped comment line\n' * 40 + ' */\n'
+        text = ''.join(module.replace('module top', 'module top%d' % i) + comment
+                       for i in range(200))
+
+    start = time.perf_counter()
+    lexer = VerilogLexerPlex(error_func=error)
+    lexer.input(text)
+    expected = [(t.type, t.value, t.lineno, t.lexpos) for t in lexer]
+    sequential = time.perf_counter() - start
+    print('sequential: %d tokens, %.3f s' % (len(expected), sequential))
+
+    chunk_size = max(len(text) // 16, 1)
+    for processes in sorted(set((1, os.cpu_count() or 1))):
+        plexer = ParallelLexer(error, processes, chunk_size)
+        plexer.input(text)
+        start = time.perf_counter()
+        tokens = [tuple(t) for t in plexer]
+        elapsed = time.perf_counter() - start
+        assert tokens == expected
+        assert plexer.directives == lexer.directives
+        assert plexer.default_nettype == lexer.default_nettype
+        print('%d processes: %.3f s (%.2fx), %d chunks, %d boundaries repaired, identical' %
+              (processes, elapsed, sequential / elapsed, len(split_lines(text, chunk_size)),
+               plexer.repaired))
@@ -0,0 +1,129 @@
+"""
+   Client of the parse server in ``server.py``, and its wire protocol.
+
+   Every message is a frame: a request starts with ``!BBI`` (operation,
+   flags, payload length), a response with ``!BI`` (status, payload
+   length). A failed request answers ``ERROR`` with the diagnostic as UTF-8.
+
+   ``PARSE`` carries ``!H``-prefixed file name followed by the source text,
+   both UTF-8; the flags select the reply: nothing (``CHECK``), the pickled
+   AST (``PICKLE``) or the regenerated source (``SOURCE``). ``INDEX``
+   carries a path for the server to (re)index and answers ``!B`` whether
+   the file had changed. ``PING`` and ``STOP`` carry nothing.
+
+   This module imports nothing from the parser, so the CLI starts in the
+   time of a bare interpreter:
+
+       python parseclient.py SOCKET check|source|index FILE...
+       python parseclient.py SOCKET stop
+"""
+
+import os
+import sys
+import socket
+import struct
+import pickle
+
+
+REQUEST = struct.Struct('!BBI')
+RESPONSE = struct.Struct('!BI')
+NAME = struct.Struct('!H')
+CHANGED = struct.Struct('!B')
+
+PING, PARSE, INDEX, STOP = range(4)
+CHECK, PICKLE, SOURCE = range(3)
+OK, ERROR = range(2)
+
+
+class ParseFailed(Exception):
+    pass
+
+
+def read_exactly(rfile, n):
+    data = rfile.read(n)
+    if len(data) != n:
+        raise EOFError('connection closed')
+    return data
+
+
+class ParseClient(object):
+    """ Connection to a running parse server """
+
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile('rb')
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --------------------------------------------------------------------------
+    def request(self, op, payload=b'', flags=0):
+        """ Send one request and return the payload of its response """
+        self.sock.sendall(REQUEST.pack(op, flags, len(payload)) + payload)
+        status, length = RESPONSE.unpack(read_exactly(self.rfile, RESPONSE.size))
+        data = read_exactly(self.rfile, length)
+        if status != OK:
+            raise ParseFailed(data.decode('utf-8', 'replace'))
+        return data
+
+    def ping(self):
+        self.request(PING)
+
+    def parse(self, text, filename='__FILE__', reply=PICKLE):
+        name = filename.encode('utf-8')
+        data = self.request(PARSE, NAME.pack(len(name)) + name + text.encode('utf-8'), reply)
+        if reply == PICKLE:
+            return pickle.loads(data)
+        if reply == SOURCE:
+            return data.decode('utf-8')
+        return None
+
+    def check(self, text, filename='__FILE__'):
+        """ Raise ``ParseFailed`` with the diagnostic if ``text`` does not parse """
+        self.parse(text, filename, CHECK)
+
+    def index(self, path):
+        # The server may run in another directory.
+        path = os.path.abspath(path).encode('utf-8')
+        return bool(CHANGED.unpack(self.request(INDEX, path))[0])
+
+    def stop(self):
+        self.request(STOP)
+
+
+def main(argv):
+    if len(argv) < 3 or argv[2] not in ('check', 'source', 'index', 'stop'):
+        sys.stderr.write('usage: %s SOCKET check|source|index FILE... | SOCKET stop\n' % argv[0])
+        return 2
+    status = 0
+    with ParseClient(argv[1]) as client:
+        if argv[2] == 'stop':
+            client.stop()
+            return 0
+        for path in argv[3:]:
+            try:
+                if argv[2] == 'index':
+                    client.index(path)
+                    continue
+                with open(path) as fd:
+                    text = fd.read()
+                if argv[2] == 'check':
+                    client.check(text, path)
+                else:
+                    sys.stdout.write(client.parse(text, path, SOURCE))
+            except (ParseFailed, OSError) as e:
+                sys.stderr.write('%s: %s\n' % (path, e))
+                status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
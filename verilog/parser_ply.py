@@ -21,10 +21,11 @@ import os
 import pathlib
 from ply.yacc import yacc
 
-from pyverilog.vparser.preprocessor import VerilogPreprocessor
 from pyverilog.vparser.lexer import VerilogLexer
 from pyverilog.vparser.ast import *
 
+from preprocessor import VerilogPreprocessor
+
 
 class VerilogParser(object):
     'Verilog HDL Parser'
@@ -49,7 +50,9 @@ class VerilogParser(object):
         # -> Strong
     )
 
-    def __init__(self, outputdir=".", debug=True):
+    def __init__(self, outputdir=".", debug=True, recover=False):
+        self.recover = recover
+        self.diagnostics = []
         self.lexer = VerilogLexer(error_func=self._lexer_error_func)
         self.lexer.build()
 
@@ -63,6 +66,10 @@ class VerilogParser(object):
         )
 
     def _lexer_error_func(self, msg, line, column):
+        if self.recover:
+            self.diagnostics.append(
+                Diagnostic(msg, self.lexer.filename, line, column))
+            return
         coord = self._coord(line, column)
         raise ParseError('%s: %s' % (coord, msg))
 
@@ -72,8 +79,15 @@ class VerilogParser(object):
     def get_default_nettype(self):
         return self.lexer.get_default_nettype()
 
+    def get_diagnostics(self):
+        return tuple(self.diagnostics)
+
     # Returns AST
+    # With recover=True, syntax errors are recorded in the diagnostics and
+    # parsing resumes at the next ';', 'end' or 'endmodule', so the returned
+    # AST is partial but covers every recoverable part of the input.
     def parse(self, text, debug=0):
+        self.diagnostics = []
         return self.parser.parse(text, lexer=self.lexer, debug=debug)
 
     # --------------------------------------------------------------------------
@@ -130,6 +144,22 @@ class VerilogParser(object):
         p.set_lineno(0, p.lineno(1))
         p[0].end_lineno = p.lineno(6)
 
+    def p_moduledef_error(self, p):
+        'moduledef : MODULE modulename paramlist portlist items error ENDMODULE'
+        p[0] = ModuleDef(name=p[2], paramlist=p[3], portlist=p[4], items=p[5],
+                         default_nettype=self.get_default_nettype(), lineno=p.lineno(1))
+        p.set_lineno(0, p.lineno(1))
+        p[0].end_lineno = p.lineno(7)
+        p.parser.errok()
+
+    def p_moduledef_header_error(self, p):
+        'moduledef : MODULE modulename error ENDMODULE'
+        p[0] = ModuleDef(name=p[2], paramlist=Paramlist(()), portlist=Portlist(()), items=(),
+                         default_nettype=self.get_default_nettype(), lineno=p.lineno(1))
+        p.set_lineno(0, p.lineno(1))
+        p[0].end_lineno = p.lineno(4)
+        p.parser.errok()
+
     def p_modulename(self, p):
         'modulename : ID'
         p[0] = p[1]
@@ -485,6 +515,12 @@ class VerilogParser(object):
         'items : empty'
         p[0] = ()
 
+    def p_items_error(self, p):
+        'items : items error SEMICOLON'
+        p[0] = p[1]
+        p.set_lineno(0, p.lineno(1))
+        p.parser.errok()
+
     def p_item(self, p):
         """item : standard_item
         | generate
@@ -1499,6 +1535,18 @@ class VerilogParser(object):
         p[0] = Block((), lineno=p.lineno(1))
         p.set_lineno(0, p.lineno(1))
 
+    def p_block_error(self, p):
+        'block : BEGIN block_statements error END'
+        p[0] = Block(p[2], lineno=p.lineno(1))
+        p.set_lineno(0, p.lineno(1))
+        p.parser.errok()
+
+    def p_block_empty_error(self, p):
+        'block : BEGIN error END'
+        p[0] = Block((), lineno=p.lineno(1))
+        p.set_lineno(0, p.lineno(1))
+        p.parser.errok()
+
     def p_block_statements(self, p):
         'block_statements : block_statements block_statement'
         p[0] = p[1] + (p[2],)
@@ -1509,6 +1557,20 @@ class VerilogParser(object):
         p[0] = (p[1],)
         p.set_lineno(0, p.lineno(1))
 
+    def p_block_statements_error(self, p):
+        'block_statements : block_statements error SEMICOLON'
+        p[0] = p[1]
+        p.set_lineno(0, p.lineno(1))
+        p.parser.errok()
+
+    # An error in the first statement must not take the rest of the block
+    # with it: resynchronize on its ';' like the later statements.
+    def p_block_statements_first_error(self, p):
+        'block_statements : error SEMICOLON'
+        p[0] = ()
+        p.set_lineno(0, p.lineno(2))
+        p.parser.errok()
+
     def p_block_statement(self, p):
         'block_statement : basic_statement'
         p[0] = p[1]
@@ -2265,7 +2327,14 @@ class VerilogParser(object):
 
     # --------------------------------------------------------------------------
     def p_error(self, p):
-        self._raise_error(p)
+        if not self.recover:
+            self._raise_error(p)
+        if p:
+            msg = 'before: "%s"' % p.value
+            self.diagnostics.append(Diagnostic(msg, self.lexer.filename, p.lineno,
+                                               self.lexer._find_tok_column(p)))
+        else:
+            self.diagnostics.append(Diagnostic('at end of input', self.lexer.filename))
 
     # --------------------------------------------------------------------------
     def _raise_error(self, p):
@@ -2290,36 +2359,65 @@ class ParseError(Exception):
     pass
 
 
+class Diagnostic(object):
+    'A syntax error recorded by a recovering parser'
+
+    def __init__(self, msg, filename='', lineno=None, column=None):
+        self.msg = msg
+        self.filename = filename
+        self.lineno = lineno
+        self.column = column
+
+    def __str__(self):
+        if self.lineno is None:
+            return '%s: %s' % (self.filename, self.msg)
+        ret = [self.filename, 'line:%s' % self.lineno]
+        if self.column is not None:
+            ret.append('column:%s' % self.column)
+        return '%s: %s' % (' '.join(ret), self.msg)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self)
+
+
 class VerilogCodeParser(object):
 
     def __init__(self, filelist, preprocess_output='preprocess.output',
                  preprocess_include=None,
                  preprocess_define=None,
                  outputdir=".",
-                 debug=True
+                 debug=True,
+                 recover=False
                  ):
         self.preprocess_output = preprocess_output
         self.directives = ()
-        self.preprocessor = VerilogPreprocessor(filelist, preprocess_output,
+        self.diagnostics = ()
+        # The native preprocessor returns the text directly;
+        # preprocess_output is kept for compatibility and no longer written.
+        self.preprocessor = VerilogPreprocessor(filelist, None,
                                                 preprocess_include,
                                                 preprocess_define)
-        self.parser = VerilogParser(outputdir=outputdir, debug=debug)
+        self.parser = VerilogParser(outputdir=outputdir, debug=debug, recover=recover)
 
     def preprocess(self):
-        self.preprocessor.preprocess()
-        text = open(self.preprocess_output).read()
-        # os.remove(self.preprocess_output)
-        return text
+        return self.preprocessor.preprocess()
+
+    def locate(self, lineno):
+        return self.preprocessor.locate(lineno)
 
     def parse(self, preprocess_output='preprocess.output', debug=0):
         text = self.preprocess()
         ast = self.parser.parse(text, debug=debug)
         self.directives = self.parser.get_directives()
+        self.diagnostics = self.parser.get_diagnostics()
         return ast
 
     def get_directives(self):
         return self.directives
 
+    def get_diagnostics(self):
+        return self.diagnostics
+
 
 def parse(
     filelist,
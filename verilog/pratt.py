@@ -0,0 +1,374 @@
+"""
+   Precedence-climbing fast path for the ``expression`` nonterminal.
+
+   ``ExpressionTables`` classifies the ``expression`` productions of an
+   ``LRTables`` grammar into binary, prefix, parenthesis and conditional
+   operators, and marks the ACTION entries of every state in which nothing
+   but an expression can start. When ``LRParser`` meets such a marker it
+   hands over to ``ExpressionParser``, which climbs over the grammar's
+   ``precedence`` levels and builds every node with the same ``p_*`` actions
+   the tables would have reduced by.
+
+   Operands that are a single token (identifiers, numbers) are reduced along
+   a chain of productions read off the tables for every (token, lookahead)
+   pair when the tables are built; after that nothing on them changes. Anything longer (pointers, part selects, concatenations, calls) is
+   parsed by the tables themselves from a private start state whose GOTO on
+   ``expression`` accepts.
+"""
+
+import types
+import threading
+
+from lalr import END, _Abort
+from actions import adapter
+
+
+class ExpressionTables(object):
+    """ Operator tables and patched ACTION/GOTO rows for one ``LRTables`` """
+
+    def __init__(self, tables, symbol='expression'):
+        g = tables.grammar
+        self.symbol = symbol
+        self.binary = {}      # operator -> production
+        self.prefix = {}      # operator -> production
+        self.paren = None     # (open, close, production)
+        self.ternary = None   # (question, colon, production)
+        for r in g.by_lhs[symbol]:
+            rhs = g.productions[r].rhs
+            terms = [sym not in g.by_lhs for sym in rhs]
+            if len(rhs) == 3 and rhs[0] == rhs[2] == symbol and terms[1]:
+                self.binary[rhs[1]] = r
+            elif len(rhs) == 2 and terms[0] and rhs[1] == symbol:
+                self.prefix[rhs[0]] = r
+            elif len(rhs) == 3 and terms[0] and rhs[1] == symbol and terms[2]:
+                self.paren = (rhs[0], rhs[2], r)
+            elif (len(rhs) == 5 and rhs[0] == rhs[2] == rhs[4] == symbol and
+                  terms[1] and terms[3]):
+                self.ternary = (rhs[1], rhs[3], r)
+
+        # A production binds the operators of its right operand whose level
+        # is at least right_min, as LRTables resolves the same conflicts;
+        # operators without a precedence are at level 0.
+        self.level = {}
+        self.right_min = {}
+        for op, r in self.binary.items():
+            self.level[op] = g.prec.get(op, (0, 'right'))[0]
+        if self.ternary is not None:
+            self.level[self.ternary[0]] = g.prec.get(self.ternary[0], (0, 'right'))[0]
+        for r in g.by_lhs[symbol]:
+            level, assoc = g.rule_prec[r]
+            self.right_min[r] = level + 1 if assoc == 'left' else level
+        self.all_ops = frozenset(self.level)
+
+        self._states(tables)
+
+    def _like(self, g, sym, seen=()):
+        """ True if ``sym`` derives nothing but ``symbol`` through unit rules """
+        if sym == self.symbol:
+            return True
+        if sym not in g.by_lhs or sym in seen:
+            return False
+        return all(len(g.productions[r].rhs) == 1 and
+                   self._like(g, g.productions[r].rhs[0], seen + (sym,))
+                   for r in g.by_lhs[sym])
+
+    def _pure(self, g, kernel):
+        for r, dot in kernel:
+            rhs = g.productions[r].rhs
+            if dot >= len(rhs) or not self._like(g, rhs[dot]):
+                return False
+        return True
+
+    def _states(self, tables):
+        g = tables.grammar
+        pure = [k for k, kernel in enumerate(tables.kernels)
+                if self.symbol in tables.goto[k] and self._pure(g, kernel)]
+        if not pure:
+            raise ValueError('no state where only %s can start' % self.symbol)
+        base = pure[0]
+        if self.paren is not None:
+            for k in pure:
+                if tables.kernels[k] == ((self.paren[2], 1),):
+                    base = k
+
+        # Prefix operators and parentheses whose shift leads to a state of
+        # their own production only; any other start token is an operand.
+        row = tables.action[base]
+        for op, r in list(self.prefix.items()):
+            if row.get(op, 0) <= 0 or tables.kernels[row[op]] != ((r, 1),):
+                del self.prefix[op]
+        if self.paren is not None:
+            op = self.paren[0]
+            if row.get(op, 0) <= 0 or tables.kernels[row[op]] != ((self.paren[2], 1),):
+                self.paren = None
+
+        self.action = list(tables.action)
+        self.goto = list(tables.goto)
+        self.start = len(self.action)
+        stop = self.start + 1
+        # With unit elimination some transitions of ``base`` already lead to
+        # its expression state directly; they must accept as well.
+        target = tables.goto[base][self.symbol]
+        self.action.append(dict((t, stop if act == target else act) for t, act in row.items()))
+        self.goto.append(dict((n, stop if t == target else t)
+                              for n, t in tables.goto[base].items()))
+        self.action.append(dict.fromkeys(g.terminals, 0))
+        self.goto.append({})
+        marker = len(self.action)
+
+        starts = [t for t, act in row.items() if act > 0]
+        self.ops = {}
+        for k in pure:
+            patched = dict(tables.action[k])
+            for t in starts:
+                if patched.get(t) == row[t]:
+                    patched[t] = marker
+            self.action[k] = patched
+            self.ops[k] = self._top_ops(tables, self.goto[k][self.symbol])
+        self.action = tuple(types.MappingProxyType(row) for row in self.action)
+        self.goto = tuple(types.MappingProxyType(row) for row in self.goto)
+        self.tables = tables
+        chains = {}
+        for first in starts:
+            for lookahead in g.terminals:
+                chains[first, lookahead] = self._chain(first, lookahead)
+        self.chains = types.MappingProxyType(chains)
+
+    def _top_ops(self, tables, state):
+        """ Operators the automaton shifts as such after an expression in ``state`` """
+        ret = set()
+        for op in self.all_ops:
+            t = tables.action[state].get(op, 0)
+            if t <= 0:
+                continue
+            r = self.ternary[2] if self.ternary and op == self.ternary[0] else self.binary.get(op)
+            if (r, 2) in tables.kernels[t]:
+                ret.add(op)
+        return frozenset(ret)
+
+    def chain(self, first, lookahead):
+        """ ``((production, rhs length), ...)`` reducing the single token
+        ``first`` to an expression before ``lookahead``, or None
+        """
+        return self.chains.get((first, lookahead))
+
+    def _chain(self, first, lookahead):
+        ret = None
+        act = self.action[self.start].get(first, 0)
+        if act > 0:
+            states = [self.start, act]
+            reductions = []
+            while True:
+                act = self.action[states[-1]].get(lookahead)
+                if act is None or act > 0:
+                    break
+                if act == 0:
+                    ret = tuple(reductions)
+                    break
+                n = self.tables.rhs_len[-act]
+                if n:
+                    del states[-n:]
+                states.append(self.goto[states[-1]][self.tables.lhs[-act]])
+                reductions.append((-act, n))
+        return ret
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def expression_tables(tables, symbol='expression'):
+    key = (tables, symbol)
+    ret = _cache.get(key)
+    if ret is None:
+        with _cache_lock:
+            ret = _cache.get(key)
+            if ret is None:
+                ret = _cache[key] = ExpressionTables(tables, symbol)
+    return ret
+
+
+_BARRIER = -2     # right_min of '(' and '?' entries: never reduced by an operator
+_END = -1         # level of a token that ends the operand being reduced
+_MISSING = object()
+
+
+class ExpressionParser(object):
+    """ Precedence climbing over the operators of ``engine``'s grammar.
+
+    The climb runs iteratively over one stack of pending operators, each
+    entry being ``(right_min, action, leading values)``; an operator of
+    level L reduces the entries above the innermost barrier whose
+    ``right_min`` exceeds L.
+    """
+
+    def __init__(self, engine, symbol='expression'):
+        self.engine = engine
+        self.tables = expression_tables(engine.tables, symbol)
+        self.symbol = symbol
+        self.calls = [None] + [action if positional else adapter(action) for action, positional
+                               in zip(engine.actions[1:], engine.positional[1:])]
+        self._chains = {}
+        t = self.tables
+        self._locals = ((t, self.calls, t.prefix, t.binary, t.level, t.right_min) +
+                        (t.paren or (None, None, None)) + (t.ternary or (None, None, None)) +
+                        (t.all_ops, self._chains))
+
+    def _error(self, tok):
+        self.engine.parser.error(tok)
+        raise _Abort()
+
+    def _chain(self, first, lookahead):
+        """ Callables reducing a one-token operand, None for longer ones """
+        key = (first, lookahead)
+        if key not in self._chains:
+            chain = self.tables.chain(first, lookahead)
+            if chain is not None and all(n == 1 for r, n in chain):
+                # Pass-through actions return their argument unchanged.
+                skip = self.tables.tables.grammar.passthrough
+                chain = tuple(self.calls[r] for r, n in chain if r not in skip)
+            elif chain is not None:
+                chain = False
+            self._chains[key] = chain
+        return self._chains[key]
+
+    def parse(self, state, tok, a, nxt):
+        """ Parse the expression starting at ``tok`` in LR state ``state`` """
+        (t, calls, prefix, binary, level, right_min, lparen, rparen, paren,
+         question, colon, ternary, all_ops, chains) = self._locals
+        top_ops = t.ops[state]
+
+        stack = []
+        barriers = 0
+        while True:
+            # Operand: prefix operators and '(' are pushed until an atom.
+            while True:
+                r = prefix.get(a)
+                if r is not None:
+                    stack.append((right_min[r], calls[r], (tok.value,)))
+                elif a == lparen:
+                    stack.append((_BARRIER, lparen, tok))
+                    barriers += 1
+                else:
+                    break
+                try:
+                    tok = nxt()
+                    a = tok.type
+                except StopIteration:
+                    tok = None
+                    a = END
+
+            first = tok
+            try:
+                tok = nxt()
+                a_next = tok.type
+            except StopIteration:
+                tok = None
+                a_next = END
+            chain = chains.get((a, a_next), _MISSING)
+            if chain is _MISSING:
+                chain = self._chain(a, a_next)
+            if chain is None:
+                act = t.action[t.start].get(a, 0)
+                if act <= 0:
+                    self._error(first)
+                value, tok, a_next = self.engine.run([t.start, act], [None, first.value],
+                                                     tok, a_next, nxt)
+            elif chain is False:
+                value = self._operand(first, tok, a_next, nxt)
+            else:
+                value = first.value
+                for call in chain:
+                    value = call(value)
+            a = a_next
+
+            # Operator, or the end of a parenthesis, a conditional or the whole.
+            while True:
+                ops = all_ops if barriers else top_ops
+                lvl = level[a] if a in ops else _END
+                while stack and lvl < stack[-1][0]:
+                    right, call, args = stack.pop()
+                    value = call(*args, value)
+                if lvl != _END:
+                    if a == question:
+                        stack.append((_BARRIER, question, (value, tok.value)))
+                        barriers += 1
+                    else:
+                        stack.append((right_min[binary[a]], calls[binary[a]], (value, tok.value)))
+                elif a == colon and stack and stack[-1][1] == question:
+                    cond, qval = stack.pop()[2]
+                    barriers -= 1
+                    stack.append((right_min[ternary], calls[ternary], (cond, qval, value, tok.value)))
+                elif a == rparen and stack and stack[-1][1] == lparen:
+                    open_tok = stack.pop()[2]
+                    barriers -= 1
+                    value = calls[paren](open_tok.value, value, tok.value)
+                    try:
+                        tok = nxt()
+                        a = tok.type
+                    except StopIteration:
+                        tok = None
+                        a = END
+                    continue
+                elif stack:
+                    self._error(tok)
+                else:
+                    return value, tok, a
+                try:
+                    tok = nxt()
+                    a = tok.type
+                except StopIteration:
+                    tok = None
+                    a = END
+                break
+
+    def _operand(self, first, tok, a, nxt):
+        """ Reduce a one-token operand whose chain has a longer production """
+        values = [first.value]
+        for r, n in self.tables.chain(first.type, a):
+            args = values[-n:] if n else ()
+            if n:
+                del values[-n:]
+            values.append(self.calls[r](*args))
+        return values[-1]
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from lex import VerilogLexerPlex
+    from par_lalr import VerilogParser
+    from lalr import LRParser
+
+    def error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    if sys.argv[1:]:
+        text = ''.join(open(path).read() for path in sys.argv[1:])
+    else:
+        # Expression-heavy synthetic module
+        lines = ['module bench(input [31:0] a, b, c, d, output [31:0] y);']
+        for i in range(2000):
+            lines.append('  assign y%d = (a + b * %d - (c << 2)) ^ (d & ~a | b >> %d) == c ? '
+                         '-a + b * c : (a - %d) * (b + c) / d;' % (i, i, i % 7, i))
+        lines.append('endmodule')
+        text = '\n'.join(lines) + '\n'
+    lexer = VerilogLexerPlex(error_func=error)
+    lexer.input(text)
+    tokens = list(lexer)
+
+    repeat = 15
+    results = {}
+    for expressions in (False, True):
+        engine = LRParser(VerilogParser(), True, 'positional', expressions)
+        engine.parse(tokens)
+        best = None
+        for i in range(repeat):
+            start = time.perf_counter()
+            engine.parse(tokens)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[expressions] = best
+        print('expressions=%-5s %8.2f ms/parse  %8.0f tokens/s' %
+              (expressions, best * 1e3, len(tokens) / best))
+    print('speedup: %.2fx' % (results[False] / results[True]))
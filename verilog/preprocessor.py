@@ -0,0 +1,411 @@
+"""
+   Native Verilog preprocessor.
+
+   Handles `define (with arguments), `undef, `ifdef/`ifndef/`elsif/`else/
+   `endif and `include in a single streaming pass, without shelling out to an
+   external preprocessor or writing temporary files. Other compiler
+   directives such as `timescale and `default_nettype are passed through for
+   the lexer to record.
+
+   Included files are read and split once per preprocessor (or once per
+   shared ``include_cache``), and macro expansions are memoized until the
+   next `define/`undef. Every output line keeps a source map entry pointing
+   back to the file and line it came from.
+"""
+
+import os
+import re
+
+
+class PreprocessError(Exception):
+    pass
+
+
+class _Unterminated(PreprocessError):
+    """ Macro arguments that go on past the end of the text """
+
+
+class Macro(object):
+    def __init__(self, name, body, params=None, defaults=None):
+        self.name = name
+        self.body = body
+        self.params = params  # None for object-like macros
+        self.defaults = defaults or {}
+
+
+_SCAN = re.compile(r'"(?:\\.|[^"\\])*"|//.*|/\*.*?(?:\*/|$)|`(`|"|[A-Za-z_][A-Za-z_0-9$]*)')
+_DEFINE = re.compile(r'\s*([A-Za-z_][A-Za-z_0-9$]*)(\([^)]*\))?\s?(.*)$', re.S)
+_INCLUDE = re.compile(r'\s*(?:"([^"]+)"|<([^>]+)>)')
+_NAME = re.compile(r'\s*([A-Za-z_][A-Za-z_0-9$]*)')
+_LINE_COMMENT = re.compile(r'//.*')
+
+CONDITIONALS = ('ifdef', 'ifndef', 'elsif', 'else', 'endif')
+
+PASSTHROUGH = (
+    'timescale', 'default_nettype', 'resetall', 'celldefine', 'endcelldefine',
+    'unconnected_drive', 'nounconnected_drive', 'line', 'pragma',
+    'begin_keywords', 'end_keywords', 'default_decay_time', 'default_trireg_strength',
+    'delay_mode_distributed', 'delay_mode_path', 'delay_mode_unit', 'delay_mode_zero',
+)
+
+
+def _unterminated(s):
+    return s.startswith('/*') and (len(s) < 4 or not s.endswith('*/'))
+
+
+def _split_args(text, pos):
+    """ ``text[pos]`` is '('; return (args, index after the closing ')') """
+    args = []
+    depth = 0
+    start = pos + 1
+    i = pos
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if c == '"':
+            i += 1
+            while i < n and text[i] != '"':
+                i += 2 if text[i] == '\\' else 1
+        elif c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+            if depth == 0:
+                args.append(text[start:i].strip())
+                return args, i + 1
+        elif c == ',' and depth == 1:
+            args.append(text[start:i].strip())
+            start = i + 1
+        i += 1
+    raise _Unterminated('unterminated macro arguments: %s' % text[pos:].strip())
+
+
+class VerilogPreprocessor(object):
+    """ Streaming Verilog preprocessor with include caching and source maps """
+
+    max_depth = 64
+
+    def __init__(self, filelist, outputfile=None, include=None, define=None,
+                 include_cache=None):
+        self.filelist = [filelist] if isinstance(filelist, str) else list(filelist)
+        self.outputfile = outputfile
+        self.include = list(include or ())
+        self.include_cache = {} if include_cache is None else include_cache
+        self.macros = {}
+        self.source_map = []
+        self._memo = {}
+        self._located = False   # the current expansion used `__LINE__/`__FILE__
+        for d in define or ():
+            name, _, value = d.partition('=')
+            self.define(name.strip(), value.strip() or '1')
+
+    # --------------------------------------------------------------------------
+    def define(self, name, body, params=None, defaults=None):
+        self.macros[name] = Macro(name, body, params, defaults)
+        self._memo.clear()
+
+    def undef(self, name):
+        self.macros.pop(name, None)
+        self._memo.clear()
+
+    def locate(self, lineno):
+        """ Map a 1-based output line number to ``(filename, lineno)`` """
+        return self.source_map[lineno - 1]
+
+    # --------------------------------------------------------------------------
+    def _read(self, path):
+        lines = self.include_cache.get(path)
+        if lines is None:
+            with open(path) as fd:
+                text = fd.read()
+            # The newline ending the last line does not start another one.
+            if text.endswith('\n'):
+                text = text[:-1]
+            lines = tuple(text.split('\n'))
+            self.include_cache[path] = lines
+        return lines
+
+    def _find_include(self, name, current):
+        if os.path.isabs(name):
+            return name
+        for d in [os.path.dirname(current)] + self.include:
+            path = os.path.join(d, name)
+            if os.path.exists(path):
+                return os.path.normpath(path)
+        raise PreprocessError('%s: include file not found: %s' % (current, name))
+
+    def _expand_macro(self, macro, args, filename, lineno, depth):
+        if macro.params is None:
+            key = macro.name
+        else:
+            key = (macro.name, tuple(args))
+        if key in self._memo:
+            return self._memo[key]
+        outer = self._located
+        self._located = False
+        body = macro.body
+        if macro.params is not None:
+            values = {}
+            for i, p in enumerate(macro.params):
+                if i < len(args) and args[i] != '':
+                    values[p] = args[i]
+                elif p in macro.defaults:
+                    values[p] = macro.defaults[p]
+                else:
+                    raise PreprocessError('%s:%d: missing argument %s of `%s' %
+                                          (filename, lineno, p, macro.name))
+            if values:
+                body = re.sub(r'\b(%s)\b' % '|'.join(map(re.escape, values)),
+                              lambda m: values[m.group(1)], body)
+        try:
+            ret = self.expand(body, filename, lineno, depth + 1)
+            # What depends on where it is used cannot be reused elsewhere.
+            if not self._located:
+                self._memo[key] = ret
+        finally:
+            self._located = outer or self._located
+        return ret
+
+    def _expand_at(self, text, m, filename, lineno, depth):
+        """ Expand the usage matched by ``m``; return (text, end position) """
+        name = m.group(1)
+        pos = m.end()
+        if name == '`':      # token pasting
+            return '', pos
+        if name == '"':
+            return '"', pos
+        if name == '__LINE__':
+            self._located = True
+            return str(lineno), pos
+        if name == '__FILE__':
+            self._located = True
+            return '"%s"' % filename, pos
+        macro = self.macros.get(name)
+        if macro is None:
+            return m.group(0), pos
+        args = ()
+        if macro.params is not None:
+            i = pos
+            while i < len(text) and text[i] in ' \t':
+                i += 1
+            if i < len(text) and text[i] == '(':
+                args, pos = _split_args(text, i)
+        return self._expand_macro(macro, args, filename, lineno, depth), pos
+
+    def expand(self, text, filename='', lineno=0, depth=0):
+        """ Expand every macro usage in ``text`` """
+        if '`' not in text:
+            return text
+        if depth > self.max_depth:
+            raise PreprocessError('%s:%d: macro expansion too deep' % (filename, lineno))
+        out = []
+        pos = 0
+        while True:
+            m = _SCAN.search(text, pos)
+            if m is None:
+                break
+            if m.group(1) is None:
+                out.append(text[pos:m.end()])
+                pos = m.end()
+                continue
+            out.append(text[pos:m.start()])
+            try:
+                ret, pos = self._expand_at(text, m, filename, lineno, depth)
+            except _Unterminated as e:
+                # Only a call in the source may go on on the next line
+                raise PreprocessError('%s:%d: %s' % (filename, lineno, e))
+            out.append(ret)
+        out.append(text[pos:])
+        return ''.join(out)
+
+    # --------------------------------------------------------------------------
+    def _define(self, rest, lines, i, filename):
+        """ Parse a `define whose text after the keyword is ``rest``.
+
+        Continuation lines are joined with a space, so that an expansion
+        never adds output lines; their ``//`` comments go first.
+        """
+        consumed = 0
+        while rest.endswith('\\'):
+            consumed += 1
+            rest = (_LINE_COMMENT.sub('', rest[:-1]) + ' ' +
+                    (lines[i + consumed] if i + consumed < len(lines) else ''))
+        m = _DEFINE.match(rest)
+        if m is None:
+            raise PreprocessError('%s:%d: malformed `define' % (filename, i + 1))
+        name, params, body = m.groups()
+        body = _LINE_COMMENT.sub('', body).strip()
+        if params is None:
+            self.define(name, body)
+        else:
+            names = []
+            defaults = {}
+            for p in params[1:-1].split(','):
+                p, eq, default = p.partition('=')
+                p = p.strip()
+                if p:
+                    names.append(p)
+                    if eq:
+                        defaults[p] = default.strip()
+            self.define(name, body, names, defaults)
+        return consumed
+
+    def iter_lines(self, filename, depth=0):
+        """ Yield ``(text, filename, lineno)`` for every output line """
+        if depth > self.max_depth:
+            raise PreprocessError('%s: include nesting too deep' % filename)
+        lines = self._read(filename)
+        stack = []        # [active, any_branch_taken, parent_active]
+        active = True
+        in_comment = False
+        i = 0
+        n = len(lines)
+        while i < n:
+            line = lines[i]
+            lineno = i + 1
+            i += 1
+            if in_comment:
+                end = line.find('*/')
+                if end < 0:
+                    yield (line if active else ''), filename, lineno
+                    continue
+                in_comment = False
+                head, line = line[:end + 2], line[end + 2:]
+            else:
+                head = ''
+
+            if '`' not in line:
+                if active:
+                    if '/*' in line:
+                        in_comment = self._opens_comment(line)
+                    yield head + line, filename, lineno
+                else:
+                    yield '', filename, lineno
+                continue
+
+            out = [head] if active else []
+            pos = 0
+            while True:
+                m = _SCAN.search(line, pos)
+                if m is None:
+                    if active:
+                        out.append(line[pos:])
+                    break
+                name = m.group(1)
+                if name is None:
+                    if _unterminated(m.group(0)):
+                        in_comment = True
+                    if active:
+                        out.append(line[pos:m.end()])
+                    pos = m.end()
+                    continue
+
+                if name in CONDITIONALS:
+                    if active:
+                        out.append(line[pos:m.start()])
+                    pos = m.end()
+                    if name in ('ifdef', 'ifndef', 'elsif'):
+                        nm = _NAME.match(line, pos)
+                        if nm is None:
+                            raise PreprocessError('%s:%d: `%s without a name' %
+                                                  (filename, lineno, name))
+                        pos = nm.end()
+                        cond = (nm.group(1) in self.macros) == (name != 'ifndef')
+                    if name in ('ifdef', 'ifndef'):
+                        stack.append([active and cond, active and cond, active])
+                    elif not stack:
+                        raise PreprocessError('%s:%d: `%s without `ifdef' %
+                                              (filename, lineno, name))
+                    elif name == 'elsif':
+                        top = stack[-1]
+                        top[0] = top[2] and not top[1] and cond
+                        top[1] = top[1] or top[0]
+                    elif name == 'else':
+                        top = stack[-1]
+                        top[0] = top[2] and not top[1]
+                        top[1] = True
+                    else:
+                        stack.pop()
+                    active = stack[-1][0] if stack else True
+                    continue
+
+                if not active:
+                    pos = m.end()
+                    continue
+
+                out.append(line[pos:m.start()])
+                if name == 'define':
+                    i += self._define(line[m.end():], lines, i - 1, filename)
+                    break
+                if name == 'undef':
+                    nm = _NAME.match(line, m.end())
+                    if nm is not None:
+                        self.undef(nm.group(1))
+                        pos = nm.end()
+                    else:
+                        pos = m.end()
+                    continue
+                if name == 'include':
+                    im = _INCLUDE.match(line, m.end())
+                    if im is None:
+                        raise PreprocessError('%s:%d: malformed `include' % (filename, lineno))
+                    path = self._find_include(im.group(1) or im.group(2), filename)
+                    yield ''.join(out), filename, lineno
+                    for ret in self.iter_lines(path, depth + 1):
+                        yield ret
+                    out = None
+                    break
+                if name in PASSTHROUGH:
+                    out.append(line[m.start():])
+                    break
+                try:
+                    ret, pos = self._expand_at(line, m, filename, lineno, 0)
+                except _Unterminated as e:
+                    if i >= n:
+                        raise PreprocessError('%s:%d: %s' % (filename, lineno, e))
+                    # The arguments go on on the next line: join it and
+                    # expand again.
+                    line = line + ' ' + lines[i]
+                    i += 1
+                    pos = m.start()
+                    continue
+                out.append(ret)
+
+            if out is not None:
+                yield ''.join(out), filename, lineno
+            # One empty line for every line joined into this one, so that
+            # the source map stays one entry per input line.
+            for k in range(lineno + 1, i + 1):
+                yield '', filename, k
+
+        if stack:
+            raise PreprocessError('%s: missing `endif' % filename)
+
+    @staticmethod
+    def _opens_comment(line):
+        pos = 0
+        while True:
+            m = _SCAN.search(line, pos)
+            if m is None:
+                return False
+            if _unterminated(m.group(0)):
+                return True
+            pos = m.end()
+
+    def iter_all(self):
+        for filename in self.filelist:
+            for ret in self.iter_lines(filename):
+                yield ret
+
+    def preprocess(self):
+        """ Preprocess every file of the filelist and return the text """
+        self.source_map = []
+        out = []
+        for text, filename, lineno in self.iter_all():
+            out.append(text)
+            self.source_map.append((filename, lineno))
+        text = ''.join(line + '\n' for line in out)
+        if self.outputfile is not None:
+            with open(self.outputfile, 'w') as fd:
+                fd.write(text)
+        return text
@@ -0,0 +1,96 @@
+"""
+   Per-rule profiler for the semantic actions of a Pison-based parser.
+
+   Pass ``profiler=RuleProfiler()`` to ``VerilogParser``; every ``p_*`` action
+   is then counted and timed. Results can be sorted, aggregated per
+   nonterminal, or written as folded stacks for ``flamegraph.pl``.
+"""
+
+import sys
+import time
+import functools
+
+from rules import rule_lhs
+
+
+class RuleProfiler(object):
+    """ Invocation counts and accumulated time per grammar rule """
+
+    sort_keys = {
+        'time': lambda e: e[3],
+        'count': lambda e: e[2],
+        'mean': lambda e: e[3] / e[2] if e[2] else 0.0,
+        'name': lambda e: (e[0], e[1]),
+    }
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.lhs = {}
+        self.counts = {}
+        self.times = {}
+
+    def reset(self):
+        for name in self.counts:
+            self.counts[name] = 0
+            self.times[name] = 0.0
+
+    def _wrap_action(self, name, action):
+        counts = self.counts
+        times = self.times
+        clock = self.clock
+
+        @functools.wraps(action)
+        def wrapper(p):
+            start = clock()
+            ret = action(p)
+            times[name] += clock() - start
+            counts[name] += 1
+            return ret
+        return wrapper
+
+    def instrument_parser(self, parser):
+        """ Install profiling wrappers around the ``p_*`` actions of ``parser``.
+
+        Must be called before the parser tables are built so that the
+        wrappers are the callables the engine picks up.
+        """
+        for name, lhs in rule_lhs(type(parser)).items():
+            self.lhs[name] = lhs
+            self.counts.setdefault(name, 0)
+            self.times.setdefault(name, 0.0)
+            setattr(parser, name, self._wrap_action(name, getattr(parser, name)))
+
+    # --------------------------------------------------------------------------
+    def entries(self, key='time', reverse=True):
+        """ Return ``(lhs, rule, count, seconds)`` tuples of the invoked rules """
+        ret = [(self.lhs[name], name, count, self.times[name])
+               for name, count in self.counts.items() if count]
+        ret.sort(key=self.sort_keys[key], reverse=reverse)
+        return ret
+
+    def by_nonterminal(self, key='time', reverse=True):
+        """ Return ``(lhs, count, seconds)`` tuples summed over alternatives """
+        acc = {}
+        for lhs, name, count, seconds in self.entries():
+            c, s = acc.get(lhs, (0, 0.0))
+            acc[lhs] = (c + count, s + seconds)
+        ret = [(lhs, c, s) for lhs, (c, s) in acc.items()]
+        index = 2 if key == 'time' else 1
+        ret.sort(key=lambda e: e[index], reverse=reverse)
+        return ret
+
+    def write_folded(self, buf=sys.stdout, weight='time'):
+        """ Write ``nonterminal;rule value`` lines for flamegraph tools.
+
+        With ``weight='time'`` the value is in microseconds, otherwise it is
+        the invocation count.
+        """
+        for lhs, name, count, seconds in self.entries(key='name', reverse=False):
+            value = int(seconds * 1e6) if weight == 'time' else count
+            buf.write('%s;%s %d\n' % (lhs, name, value))
+
+    def show(self, buf=sys.stdout, key='time', limit=20):
+        buf.write('%10s %12s %10s  %s\n' % ('calls', 'total(s)', 'per(us)', 'rule'))
+        for lhs, name, count, seconds in self.entries(key)[:limit]:
+            buf.write('%10d %12.6f %10.3f  %s (%s)\n' %
+                      (count, seconds, seconds / count * 1e6, name, lhs))
@@ -0,0 +1,171 @@
+"""
+   Grammar rule introspection for the Pison-based parsers.
+
+   The rules of a parser class are declared with ``@__(lhs, *rhs)`` on its
+   ``p_*`` methods. This module reads those declarations back from the class
+   source so that tooling in this package (statistics, profiling, alternative
+   engines) can see every production without reaching into Pison internals.
+"""
+
+import ast
+import inspect
+import itertools
+import textwrap
+from collections import namedtuple
+
+
+Rule = namedtuple('Rule', ('name', 'lhs', 'rhs', 'prec', 'func'))
+Rule.__doc__ = """ One production: ``lhs -> rhs`` reduced by action ``func``.
+
+    ``name`` is the name of the ``p_*`` method; it is shared by every
+    production a single decorator expands to. ``prec`` is the terminal named
+    by a ``%prec`` marker, if any.
+"""
+
+_rule_cache = {}
+_passthrough_cache = {}
+_defs_cache = {}
+_module_cache = {}
+
+
+def _expand_args(args):
+    """ Turn ``@__`` arguments into ``(rhs, prec)`` pairs. """
+    positions = []
+    prec = None
+    it = iter(args)
+    for a in it:
+        if a is None:
+            continue
+        if isinstance(a, str) and a.endswith('%prec'):
+            positions.append((a[:-len('%prec')].strip(),))
+            prec = next(it)
+            continue
+        positions.append(tuple(a) if isinstance(a, (list, tuple)) else (a,))
+    return [(rhs, prec) for rhs in itertools.product(*positions)]
+
+
+def _class_node(klass):
+    """ The ``ast.ClassDef`` of ``klass``, or None if its source is unknown.
+
+    The module is parsed once and the class found by its qualified name,
+    which is much cheaper than ``inspect.getsource`` on a large class.
+    """
+    try:
+        filename = inspect.getsourcefile(klass)
+    except TypeError:
+        return None
+    if filename is None:
+        return None
+    tree = _module_cache.get(filename)
+    if tree is None:
+        try:
+            with open(filename, 'rb') as fd:
+                tree = ast.parse(fd.read(), filename)
+        except OSError:
+            return None
+        _module_cache[filename] = tree
+    node = tree
+    for name in klass.__qualname__.split('.'):
+        for child in node.body:
+            if isinstance(child, ast.ClassDef) and child.name == name:
+                node = child
+                break
+        else:
+            return None
+    return node
+
+
+def _rule_defs(parser_cls):
+    """ The ``p_*`` function definitions of ``parser_cls``, base first. """
+    if parser_cls in _defs_cache:
+        return _defs_cache[parser_cls]
+    defs = []
+    for klass in reversed(parser_cls.__mro__):
+        if not any(k.startswith('p_') for k in klass.__dict__):
+            continue
+        node = _class_node(klass)
+        if node is None:
+            try:
+                source = textwrap.dedent(inspect.getsource(klass))
+            except (OSError, TypeError):
+                continue
+            node = ast.parse(source).body[0]
+        defs.extend(child for child in node.body
+                    if isinstance(child, ast.FunctionDef) and child.name.startswith('p_'))
+    _defs_cache[parser_cls] = defs
+    return defs
+
+
+def get_rules(parser_cls):
+    """ Return the productions of ``parser_cls`` in declaration order. """
+    if parser_cls in _rule_cache:
+        return _rule_cache[parser_cls]
+
+    # Walk from the base class down so that a subclass redefining a rule
+    # method replaces the productions of its parent.
+    by_name = {}
+    for node in _rule_defs(parser_cls):
+        prods = []
+        for deco in node.decorator_list:
+            if not (isinstance(deco, ast.Call) and isinstance(deco.func, ast.Name)
+                    and deco.func.id == '__'):
+                continue
+            args = [ast.literal_eval(a) for a in deco.args]
+            for rhs, prec in _expand_args(args[1:]):
+                prods.append(Rule(node.name, args[0], rhs, prec,
+                                  getattr(parser_cls, node.name)))
+        if prods:
+            by_name[node.name] = prods
+        else:
+            by_name.pop(node.name, None)
+
+    result = tuple(r for prods in by_name.values() for r in prods)
+    _rule_cache[parser_cls] = result
+    return result
+
+
+def rhs_lengths(parser_cls):
+    """ Map each ``p_*`` method name to the length of its right-hand side. """
+    return {r.name: len(r.rhs) for r in get_rules(parser_cls)}
+
+
+def rule_lhs(parser_cls):
+    """ Map each ``p_*`` method name to its left-hand nonterminal. """
+    return {r.name: r.lhs for r in get_rules(parser_cls)}
+
+
+def _is_forward(node):
+    """ True if the body of a ``p_*`` definition is just ``p[0] = p[1]`` """
+    body = [stmt for stmt in node.body
+            if not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant))]
+    if len(body) != 1 or not isinstance(body[0], ast.Assign):
+        return False
+    stmt = body[0]
+    if len(stmt.targets) != 1 or len(node.args.args) != 2:
+        return False
+    p = node.args.args[1].arg
+
+    def index(expr, k):
+        return (isinstance(expr, ast.Subscript) and isinstance(expr.value, ast.Name) and
+                expr.value.id == p and isinstance(expr.slice, ast.Constant) and
+                expr.slice.value == k)
+    return index(stmt.targets[0], 0) and index(stmt.value, 1)
+
+
+def passthrough_names(parser_cls):
+    """ Names of the ``p_*`` methods whose action only forwards ``p[1]``.
+
+    Productions of such methods with a single right-hand symbol are unit
+    productions an engine may skip without changing the result.
+    """
+    if parser_cls in _passthrough_cache:
+        return _passthrough_cache[parser_cls]
+    names = set()
+    for node in _rule_defs(parser_cls):
+        if _is_forward(node):
+            names.add(node.name)
+        else:
+            names.discard(node.name)
+    names = frozenset(names)
+    _passthrough_cache[parser_cls] = names
+    return names
@@ -0,0 +1,172 @@
+"""
+   Lightweight module index built directly on the lexer token stream.
+
+   ``scan_modules`` extracts module names, port names and the module types of
+   instances without running the parser or building ``astnode`` trees. It is
+   meant for dependency resolution and file ordering, where the full AST is
+   not needed.
+"""
+
+import os
+import sys
+import time
+from collections import namedtuple
+
+from lex import VerilogLexerPlex
+
+
+ModuleSummary = namedtuple('ModuleSummary', ('name', 'ports', 'instances', 'lineno'))
+InstanceRef = namedtuple('InstanceRef', ('module', 'name', 'lineno'))
+
+_OPEN = {'LPAREN': 'RPAREN', 'LBRACKET': 'RBRACKET', 'LBRACE': 'RBRACE'}
+
+# Lexed as plain identifiers, but followed by a name they are not module
+# instantiations: a defparam, or an instance of a built-in primitive.
+_NOT_MODULES = frozenset((
+    'defparam',
+    'and', 'nand', 'nor', 'xor', 'xnor', 'buf', 'not',
+    'bufif0', 'bufif1', 'notif0', 'notif1', 'pullup', 'pulldown',
+    'nmos', 'pmos', 'rnmos', 'rpmos', 'cmos', 'rcmos',
+    'tran', 'rtran', 'tranif0', 'tranif1', 'rtranif0', 'rtranif1',
+))
+
+
+def _skip_group(toks, i):
+    """ ``toks[i]`` opens a group; return the index just past its closer. """
+    depth = 0
+    n = len(toks)
+    while i < n:
+        t = toks[i].type
+        if t in _OPEN:
+            depth += 1
+        elif t in ('RPAREN', 'RBRACKET', 'RBRACE'):
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return i
+
+
+def _scan_ports(toks, i):
+    """ ``toks[i]`` is the '(' of a port list; return (ports, next index). """
+    ports = []
+    depth = 0
+    n = len(toks)
+    while i < n:
+        t = toks[i].type
+        if t in ('LPAREN', 'LBRACKET', 'LBRACE'):
+            depth += 1
+        elif t in ('RPAREN', 'RBRACKET', 'RBRACE'):
+            depth -= 1
+            if depth == 0:
+                return tuple(ports), i + 1
+        elif t == 'ID' and depth == 1 and i + 1 < n and toks[i + 1].type in ('COMMA', 'RPAREN'):
+            ports.append(toks[i].value)
+        i += 1
+    return tuple(ports), i
+
+
+def _scan_instances(toks, i, module, instances):
+    """ ``toks[i]`` is the first instance name after ``module [#(...)]``. """
+    n = len(toks)
+    while i < n and toks[i].type == 'ID':
+        instances.append(InstanceRef(module, toks[i].value, toks[i].lineno))
+        i += 1
+        while i < n and toks[i].type == 'LBRACKET':
+            i = _skip_group(toks, i)
+        if i < n and toks[i].type == 'LPAREN':
+            i = _skip_group(toks, i)
+        if i < n and toks[i].type == 'COMMA':
+            i += 1
+            continue
+        break
+    return i
+
+
+def scan_tokens(toks):
+    """ Build ``ModuleSummary`` records from a list of lexer tokens """
+    modules = []
+    n = len(toks)
+    i = 0
+    while i < n:
+        if toks[i].type != 'MODULE' or i + 1 >= n:
+            i += 1
+            continue
+        lineno = toks[i].lineno
+        name = toks[i + 1].value
+        i += 2
+        if i < n and toks[i].type == 'DELAY':
+            i = _skip_group(toks, i + 1)
+        ports = ()
+        if i < n and toks[i].type == 'LPAREN':
+            ports, i = _scan_ports(toks, i)
+
+        instances = []
+        depth = 0
+        while i < n:
+            t = toks[i].type
+            if t == 'ENDMODULE':
+                i += 1
+                break
+            if t in _OPEN:
+                depth += 1
+            elif t in ('RPAREN', 'RBRACKET', 'RBRACE'):
+                depth -= 1
+            elif (t == 'ID' and depth == 0 and i + 1 < n and toks[i - 1].type != 'COLON' and
+                    toks[i].value not in _NOT_MODULES):
+                # In a module body only an instantiation puts an identifier
+                # right after another one or after a '#' parameter override;
+                # an identifier after ':' is a block label.
+                nt = toks[i + 1].type
+                if nt == 'ID':
+                    i = _scan_instances(toks, i + 1, toks[i].value, instances)
+                    continue
+                if nt == 'DELAY' and i + 2 < n and toks[i + 2].type == 'LPAREN':
+                    j = _skip_group(toks, i + 2)
+                    i = _scan_instances(toks, j, toks[i].value, instances)
+                    continue
+            i += 1
+        modules.append(ModuleSummary(name, ports, tuple(instances), lineno))
+    return modules
+
+
+def scan_modules(text, error_func=None):
+    """ Return a ``ModuleSummary`` for every module declared in ``text`` """
+    lexer = VerilogLexerPlex(error_func=error_func or (lambda msg, line, column: None))
+    lexer.input(text)
+    return scan_tokens(list(lexer))
+
+
+def scan_file(filename, error_func=None):
+    with open(filename) as fd:
+        return scan_modules(fd.read(), error_func)
+
+
+if __name__ == '__main__':
+    from par_lalr import VerilogParser
+
+    fname = os.path.normpath(os.path.join(__file__, '../verilog_example_1.v'))
+    if len(sys.argv) > 1:
+        fname = sys.argv[1]
+    with open(fname) as fd:
+        text = fd.read()
+
+    for m in scan_modules(text):
+        print(m)
+
+    repeat = 100
+    time_start = time.time()
+    for _ in range(repeat):
+        scan_modules(text)
+    time_scan = time.time() - time_start
+
+    par = VerilogParser()
+    time_start = time.time()
+    for _ in range(repeat):
+        lexer = VerilogLexerPlex(error_func=lambda msg, line, column: None)
+        lexer.input(text)
+        par.parse(iter(lexer))
+    time_parse = time.time() - time_start
+
+    sys.stderr.write('scan:  %f\nparse: %f\nratio: %.1fx\n' %
+                     (time_scan, time_parse, time_parse / time_scan))
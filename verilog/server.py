@@ -0,0 +1,243 @@
+"""
+   Long-running parse server on a Unix domain socket.
+
+   ``ParseServer`` loads the lexer and the shared parser tables once and
+   then answers the framed requests of ``parseclient.py`` (see there for
+   the protocol): parse a source and return its AST, its regenerated text
+   or just the diagnostic, and (re)index a file into a ``SymbolIndex``. A
+   connection may carry any number of requests. Every connection is served
+   on a thread of its own and parses run concurrently on the shared tables;
+   index requests are queued to the one thread that owns the SQLite index.
+
+       python server.py SOCKET [INDEX_DB]      serve until a STOP request
+       python server.py --bench [FILE...]      daemon vs. cold processes
+"""
+
+import os
+import sys
+import stat
+import queue
+import socket
+import pickle
+import threading
+import socketserver
+import concurrent.futures
+
+from lex import VerilogLexerPlex
+from par_lalr import VerilogParser
+from lrcompile import shared_parser
+from symindex import SymbolIndex
+from codegen import to_source
+from parseclient import (REQUEST, RESPONSE, NAME, CHANGED, PING, PARSE, INDEX, STOP,
+                         CHECK, PICKLE, SOURCE, OK, ERROR, read_exactly)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                op, flags, length = REQUEST.unpack(read_exactly(self.rfile, REQUEST.size))
+                payload = read_exactly(self.rfile, length)
+            except EOFError:
+                return
+            try:
+                status, data = OK, server.dispatch(op, flags, payload)
+            except Exception as e:
+                status, data = ERROR, str(e).encode('utf-8')
+            self.wfile.write(RESPONSE.pack(status, len(data)) + data)
+            self.wfile.flush()
+            if op == STOP and status == OK:
+                # shutdown() waits for serve_forever, so not on this thread
+                threading.Thread(target=server.shutdown).start()
+                return
+
+
+def _remove_stale_socket(path):
+    """ Unlink ``path`` if it is a socket nobody listens on """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError('%s exists and is not a socket' % path)
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise OSError('a server is already listening on %s' % path)
+
+
+class ParseServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Parse and index requests against warm tables """
+
+    daemon_threads = True
+
+    def __init__(self, path, index=':memory:', outputdir=None):
+        self.engine = shared_parser(VerilogParser, outputdir=outputdir)
+        self.requests = 0
+        self._lock = threading.Lock()
+        # Warm the lexer as well
+        self.parse('module warm; endmodule\n')
+
+        # SQLite connections belong to the thread that opened them.
+        self.index = None
+        self._jobs = queue.Queue()
+        opened = concurrent.futures.Future()
+        self._indexer = threading.Thread(target=self._index_loop, args=(index, opened),
+                                         daemon=True)
+        self._indexer.start()
+        opened.result()
+
+        try:
+            _remove_stale_socket(path)
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        except BaseException:
+            self._stop_indexer()
+            raise
+
+    def _index_loop(self, index, opened):
+        try:
+            self.index = SymbolIndex(index)
+        except Exception as e:
+            opened.set_exception(e)
+            return
+        opened.set_result(None)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    return
+                path, future = job
+                try:
+                    future.set_result(self.index.update_file(path, self.parse_file))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            self.index.close()
+
+    def _stop_indexer(self):
+        self._jobs.put(None)
+        self._indexer.join()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self._stop_indexer()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+    def update_index(self, path):
+        """ ``SymbolIndex.update_file`` of ``path``, run on the index thread """
+        future = concurrent.futures.Future()
+        self._jobs.put((path, future))
+        return future.result()
+
+    @staticmethod
+    def _raise_error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    def parse(self, text, filename='__FILE__'):
+        lexer = VerilogLexerPlex(error_func=self._raise_error)
+        lexer.filename = filename
+        lexer.input(text)
+        return self.engine.parse(lexer, VerilogParser.context(filename))
+
+    def parse_file(self, path):
+        with open(path) as fd:
+            return self.parse(fd.read(), path)
+
+    def dispatch(self, op, flags, payload):
+        """ Response payload of one request; raising answers ``ERROR`` """
+        with self._lock:
+            self.requests += 1
+        if op == PARSE:
+            if flags not in (CHECK, PICKLE, SOURCE):
+                raise ValueError('unknown reply format %d' % flags)
+            n = NAME.unpack_from(payload)[0]
+            filename = payload[NAME.size:NAME.size + n].decode('utf-8')
+            ast = self.parse(payload[NAME.size + n:].decode('utf-8'), filename)
+            if flags == PICKLE:
+                return pickle.dumps(ast, pickle.HIGHEST_PROTOCOL)
+            if flags == SOURCE:
+                return to_source(ast).encode('utf-8')
+            return b''
+        if op == INDEX:
+            return CHANGED.pack(self.update_index(payload.decode('utf-8')))
+        if op in (PING, STOP):
+            return b''
+        raise ValueError('unknown operation %d' % op)
+
+
+def _bench(paths):
+    import time
+    import tempfile
+    import subprocess
+    from parseclient import ParseClient
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp()
+    sock = os.path.join(workdir, 'parse.sock')
+    texts = []
+    for path in paths:
+        with open(path) as fd:
+            texts.append((path, fd.read()))
+
+    # Cold: one interpreter per file, as a lint job would run today. The
+    # generated parser module is already on disk, so this is the best case.
+    cold = ('import sys; sys.path.insert(0, %r); from server import ParseServer; '
+            'from lex import VerilogLexerPlex; from par_lalr import VerilogParser; '
+            'from lrcompile import shared_parser; '
+            'lexer = VerilogLexerPlex(error_func=ParseServer._raise_error); '
+            'lexer.input(open(sys.argv[1]).read()); '
+            'shared_parser(VerilogParser, outputdir=%r).parse(lexer, VerilogParser.context())'
+            % (here, workdir))
+    subprocess.run([sys.executable, '-c', cold, paths[0]], check=True)
+    start = time.perf_counter()
+    for path in paths:
+        subprocess.run([sys.executable, '-c', cold, path], check=True)
+    t_cold = time.perf_counter() - start
+
+    server = subprocess.Popen([sys.executable, os.path.join(here, 'server.py'), sock])
+    while not os.path.exists(sock):
+        time.sleep(0.01)
+
+    # Thin client: still one interpreter per file, but no parser imports
+    client = [sys.executable, os.path.join(here, 'parseclient.py'), sock, 'check']
+    start = time.perf_counter()
+    for path in paths:
+        subprocess.run(client + [path], check=True)
+    t_thin = time.perf_counter() - start
+
+    # One connection from a running process
+    repeat = 10
+    with ParseClient(sock) as c:
+        start = time.perf_counter()
+        for i in range(repeat):
+            for path, text in texts:
+                c.check(text, path)
+        t_conn = (time.perf_counter() - start) / repeat
+        c.stop()
+    server.wait()
+
+    n = len(paths)
+    for label, t in (('cold process per file', t_cold), ('thin client per file', t_thin),
+                     ('one connection', t_conn)):
+        print('%-22s %8.1f ms/file %8.1f files/s' % (label, t / n * 1e3, n / t))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench':
+        _bench(sys.argv[2:] or [os.path.join(os.path.dirname(__file__), 'verilog_example_1.v')])
+        sys.exit(0)
+    if len(sys.argv) < 2:
+        sys.stderr.write('usage: %s SOCKET [INDEX_DB] | --bench [FILE...]\n' % sys.argv[0])
+        sys.exit(2)
+    server = ParseServer(sys.argv[1], *sys.argv[2:3])
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
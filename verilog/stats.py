@@ -0,0 +1,139 @@
+"""
+   Opt-in counters and phase timers for the lexer and the parser.
+
+   Pass a ``ParseStats`` object as ``stats=`` to ``VerilogLexerPlex`` and/or
+   ``VerilogParser``. Nothing is wrapped or timed unless a stats object is
+   given, so the default code paths are left untouched.
+"""
+
+import sys
+import time
+import functools
+from contextlib import contextmanager
+
+from rules import rhs_lengths
+
+
+class ParseStats(object):
+    """ Counters and wall times collected during lexing and parsing """
+
+    phases = ('table', 'lex', 'parse', 'ast')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tokens = 0
+        self.shifts = 0
+        self.reductions = {}
+        self.max_stack_depth = 0
+        self.times = dict.fromkeys(self.phases, 0.0)
+        self._depth = 0
+
+    @property
+    def total_reductions(self):
+        return sum(self.reductions.values())
+
+    def most_common(self, n=None):
+        ret = sorted(self.reductions.items(), key=lambda kv: kv[1], reverse=True)
+        return ret if n is None else ret[:n]
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.times[name] += time.perf_counter() - start
+
+    # --------------------------------------------------------------------------
+    def count_tokens(self, tokens):
+        """ Wrap a token iterator of the lexer, timing every pull """
+        nxt = iter(tokens).__next__
+        clock = time.perf_counter
+        times = self.times
+        while True:
+            start = clock()
+            try:
+                tok = nxt()
+            except StopIteration:
+                times['lex'] += clock() - start
+                return
+            times['lex'] += clock() - start
+            self.tokens += 1
+            yield tok
+
+    def _count_shifts(self, tokens, pulled):
+        nxt = iter(tokens).__next__
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                tok = nxt()
+            except StopIteration:
+                pulled[0] += clock() - start
+                return
+            pulled[0] += clock() - start
+            self.shifts += 1
+            self._depth += 1
+            if self._depth > self.max_stack_depth:
+                self.max_stack_depth = self._depth
+            yield tok
+
+    def _wrap_action(self, name, action, rhslen):
+        reductions = self.reductions
+        times = self.times
+        clock = time.perf_counter
+
+        @functools.wraps(action)
+        def wrapper(p):
+            start = clock()
+            ret = action(p)
+            times['ast'] += clock() - start
+            reductions[name] = reductions.get(name, 0) + 1
+            self._depth += 1 - rhslen
+            if self._depth > self.max_stack_depth:
+                self.max_stack_depth = self._depth
+            return ret
+        return wrapper
+
+    def instrument_parser(self, parser):
+        """ Install counting wrappers around the ``p_*`` actions of ``parser``.
+
+        Must be called before the parser tables are built so that the
+        wrappers are the callables the engine picks up.
+        """
+        for name, rhslen in rhs_lengths(type(parser)).items():
+            setattr(parser, name, self._wrap_action(name, getattr(parser, name), rhslen))
+
+    def measure_parse(self, parse, tokens, *args, **kwargs):
+        """ Run ``parse(tokens, ...)`` and split its wall time into phases """
+        self._depth = 0
+        ast_before = self.times['ast']
+        lex_before = self.times['lex']
+        pulled = [0.0]
+        start = time.perf_counter()
+        try:
+            return parse(self._count_shifts(tokens, pulled), *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            # A lexer sharing this stats object already accounts for its time.
+            if self.times['lex'] == lex_before:
+                self.times['lex'] += pulled[0]
+            self.times['parse'] += elapsed - pulled[0] - (self.times['ast'] - ast_before)
+
+    # --------------------------------------------------------------------------
+    def show(self, buf=sys.stdout, rules=10):
+        buf.write('tokens lexed:    %d\n' % self.tokens)
+        buf.write('shifts:          %d\n' % self.shifts)
+        buf.write('reductions:      %d (%d rules)\n' % (self.total_reductions, len(self.reductions)))
+        buf.write('max stack depth: %d\n' % self.max_stack_depth)
+        for name in self.phases:
+            buf.write('time %-10s %.6fs\n' % (name + ':', self.times[name]))
+        for name, count in self.most_common(rules):
+            buf.write('  %8d  %s\n' % (count, name))
+
+    def __repr__(self):
+        return '<%s tokens=%d shifts=%d reductions=%d max_stack_depth=%d>' % (
+            self.__class__.__name__, self.tokens, self.shifts,
+            self.total_reductions, self.max_stack_depth)
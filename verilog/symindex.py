@@ -0,0 +1,261 @@
+"""
+   Design-wide symbol index stored in a SQLite file.
+
+   ``SymbolIndex.update`` walks a parsed ``Source``/``ModuleDef`` tree and
+   records declarations and references per file. Names and modules are
+   interned into integer ids, and every row is keyed by its file, so
+   re-indexing a changed file only replaces that file's rows. Lookups go
+   through indexed integer columns and never reparse anything.
+
+   Kinds are stored as text, so adding one does not change the meaning of
+   existing rows. A database written with another ``SCHEMA_VERSION`` is
+   an out-of-date cache and is emptied when opened.
+"""
+
+import os
+import hashlib
+import sqlite3
+from collections import namedtuple
+
+from astnode import *
+
+
+Symbol = namedtuple('Symbol', ('name', 'kind', 'module', 'path', 'lineno'))
+
+DECL_KINDS = {
+    ModuleDef: 'module',
+    Input: 'input',
+    Output: 'output',
+    Inout: 'inout',
+    Tri: 'tri',
+    Wire: 'wire',
+    Reg: 'reg',
+    Integer: 'integer',
+    Real: 'real',
+    Parameter: 'parameter',
+    Localparam: 'localparam',
+    Genvar: 'genvar',
+    Function: 'function',
+    Task: 'task',
+    Instance: 'instance',
+}
+
+REF_KINDS = {
+    Identifier: 'identifier',
+    Instance: 'module',
+}
+
+SCHEMA_VERSION = 2
+
+_DROP = """
+DROP TABLE IF EXISTS files;
+DROP TABLE IF EXISTS names;
+DROP TABLE IF EXISTS decls;
+DROP TABLE IF EXISTS refs;
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime REAL, digest TEXT);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS decls (
+    name INTEGER NOT NULL, file INTEGER NOT NULL, module INTEGER, kind TEXT, lineno INTEGER);
+CREATE TABLE IF NOT EXISTS refs (
+    name INTEGER NOT NULL, file INTEGER NOT NULL, module INTEGER, kind TEXT, lineno INTEGER);
+CREATE INDEX IF NOT EXISTS decls_name ON decls (name, module);
+CREATE INDEX IF NOT EXISTS decls_file ON decls (file);
+CREATE INDEX IF NOT EXISTS refs_name ON refs (name, module);
+CREATE INDEX IF NOT EXISTS refs_file ON refs (file);
+"""
+
+
+def file_digest(path):
+    with open(path, 'rb') as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+def collect_symbols(ast):
+    """ Yield ``(is_decl, name, kind, module, lineno)`` for every symbol.
+
+    The named connections ``.port(...)`` and ``.param(...)`` of an instance
+    are references of kind ``'port'`` and ``'parameter'`` in the scope of
+    the instantiated module, where they are declared.
+    """
+    stack = [(ast, None)]
+    while stack:
+        node, module = stack.pop()
+        cls = type(node)
+        kind = DECL_KINDS.get(cls)
+        if kind is not None:
+            if cls is ModuleDef:
+                yield (True, node.name, kind, None, node.lineno)
+                module = node.name
+            else:
+                yield (True, node.name, kind, module, node.lineno)
+        kind = REF_KINDS.get(cls)
+        if kind is not None:
+            name = node.module if cls is Instance else node.name
+            yield (False, name, kind, module, node.lineno)
+        if cls is Instance:
+            for arg in node.parameterlist or ():
+                if arg.paramname:
+                    yield (False, arg.paramname, 'parameter', node.module, arg.lineno)
+            for arg in node.portlist or ():
+                if arg.portname:
+                    yield (False, arg.portname, 'port', node.module, arg.lineno)
+        stack.extend((c, module) for c in reversed(node.children()))
+
+
+class SymbolIndex(object):
+    """ Persistent declaration/reference index of a design """
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.db.executescript(_DROP)
+            self.db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.db.executescript(_SCHEMA)
+        # name -> id; ids never change once assigned, and a name missing here
+        # may have been added by another writer, see _name_id.
+        self._names = dict((n, i) for i, n in self.db.execute('SELECT id, name FROM names'))
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _name_id(self, name):
+        i = self._names.get(name)
+        if i is None:
+            row = self.db.execute('SELECT id FROM names WHERE name = ?', (name,)).fetchone()
+            if row is not None:
+                i = self._names[name] = row[0]
+        return i
+
+    def _intern(self, cur, name, new):
+        """ Id of ``name`` inside the write transaction of ``cur``. Ids it
+        assigns go to ``new`` until the transaction commits. """
+        i = self._names.get(name)
+        if i is None:
+            i = new.get(name)
+        if i is None:
+            cur.execute('INSERT OR IGNORE INTO names (name) VALUES (?)', (name,))
+            if cur.rowcount == 1:
+                i = cur.lastrowid
+            else:
+                i = cur.execute('SELECT id FROM names WHERE name = ?', (name,)).fetchone()[0]
+            new[name] = i
+        return i
+
+    # --------------------------------------------------------------------------
+    def is_current(self, path, mtime=None, digest=None):
+        """ True if ``path`` was indexed with the same mtime (or digest) """
+        row = self.db.execute('SELECT mtime, digest FROM files WHERE path = ?',
+                              (path,)).fetchone()
+        if row is None:
+            return False
+        if mtime is not None and row[0] == mtime:
+            return True
+        return digest is not None and row[1] == digest
+
+    def update(self, path, ast, mtime=None, digest=None):
+        """ Replace the symbols recorded for ``path`` with those of ``ast`` """
+        decls = []
+        refs = []
+        new_names = {}
+        with self.db:
+            cur = self.db.cursor()
+            # Take the write lock first, so that the names table cannot
+            # change under _intern.
+            cur.execute('BEGIN IMMEDIATE')
+            row = cur.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                cur.execute('INSERT INTO files (path, mtime, digest) VALUES (?, ?, ?)',
+                            (path, mtime, digest))
+                file_id = cur.lastrowid
+            else:
+                file_id = row[0]
+                cur.execute('UPDATE files SET mtime = ?, digest = ? WHERE id = ?',
+                            (mtime, digest, file_id))
+                cur.execute('DELETE FROM decls WHERE file = ?', (file_id,))
+                cur.execute('DELETE FROM refs WHERE file = ?', (file_id,))
+
+            for is_decl, name, kind, module, lineno in collect_symbols(ast):
+                rec = (self._intern(cur, name, new_names), file_id,
+                       None if module is None else self._intern(cur, module, new_names),
+                       kind, lineno)
+                (decls if is_decl else refs).append(rec)
+
+            cur.executemany('INSERT INTO decls VALUES (?, ?, ?, ?, ?)', decls)
+            cur.executemany('INSERT INTO refs VALUES (?, ?, ?, ?, ?)', refs)
+        # Only ids that were committed may be cached.
+        self._names.update(new_names)
+        return len(decls), len(refs)
+
+    def update_file(self, path, parse):
+        """ (Re)index ``path`` with ``parse(path) -> ast`` if it changed """
+        mtime = os.path.getmtime(path)
+        if self.is_current(path, mtime=mtime):
+            return False
+        digest = file_digest(path)
+        if self.is_current(path, digest=digest):
+            with self.db:
+                self.db.execute('UPDATE files SET mtime = ? WHERE path = ?', (mtime, path))
+            return False
+        self.update(path, parse(path), mtime, digest)
+        return True
+
+    def remove(self, path):
+        with self.db:
+            row = self.db.execute('SELECT id FROM files WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return
+            self.db.execute('DELETE FROM decls WHERE file = ?', row)
+            self.db.execute('DELETE FROM refs WHERE file = ?', row)
+            self.db.execute('DELETE FROM files WHERE id = ?', row)
+
+    # --------------------------------------------------------------------------
+    def _query(self, table, name, module):
+        name_id = self._name_id(name)
+        if name_id is None:
+            return []
+        sql = ('SELECT t.kind, m.name, f.path, t.lineno FROM %s t '
+               'JOIN files f ON f.id = t.file LEFT JOIN names m ON m.id = t.module '
+               'WHERE t.name = ?' % table)
+        args = [name_id]
+        if module is not None:
+            module_id = self._name_id(module)
+            if module_id is None:
+                return []
+            sql += ' AND t.module = ?'
+            args.append(module_id)
+        return [Symbol(name, kind, mod, path, lineno)
+                for kind, mod, path, lineno in self.db.execute(sql, args)]
+
+    def definitions(self, name, module=None):
+        """ Declarations of ``name``, optionally restricted to ``module`` """
+        return self._query('decls', name, module)
+
+    def references(self, name, module=None):
+        """ References to ``name``, optionally restricted to ``module`` """
+        return self._query('refs', name, module)
+
+    def goto_definition(self, name, module=None):
+        """ Resolve ``name`` as seen from ``module``: local scope, then global """
+        if module is not None:
+            local = self.definitions(name, module)
+            if local:
+                return local
+        return [s for s in self.definitions(name) if s.module is None] or \
+            self.definitions(name)
+
+    def files(self):
+        return [r[0] for r in self.db.execute('SELECT path FROM files ORDER BY id')]
@@ -0,0 +1,154 @@
+"""
+   Token-level cache for `include'd files.
+
+   ``TokenCache`` lexes every file once with ``VerilogLexerPlex`` and keeps
+   the resulting token array keyed by path, mtime and content hash. When a
+   token stream reaches an `include directive, the pre-lexed tokens of the
+   header are spliced in instead of lexing the header text again. One cache
+   is meant to be shared by all files of a filelist, and it can optionally be
+   persisted to a directory so that later runs start warm.
+
+   The splice happens on the token stream, so `ifdef/`define are not
+   evaluated here; use ``preprocessor.VerilogPreprocessor`` for sources that
+   rely on conditional compilation.
+"""
+
+import os
+import re
+import bisect
+import pickle
+import hashlib
+from collections import namedtuple
+
+from lex import VerilogLexerPlex
+
+
+CachedToken = namedtuple('CachedToken', ('type', 'value', 'lineno', 'lexpos'))
+
+_INCLUDE = re.compile(r'^`include\s+(?:"([^"]+)"|<([^>]+)>)')
+
+
+class CacheEntry(object):
+    def __init__(self, mtime_ns, size, digest, tokens, directives):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.tokens = tokens
+        self.directives = directives
+        self.linenos = [t.lineno for t in tokens]
+
+
+class TokenCache(object):
+    """ Pre-lexed token arrays of source files, shared across a filelist """
+
+    max_depth = 64
+
+    def __init__(self, directory=None, include=None, error_func=None):
+        self.directory = directory
+        self.include = list(include or ())
+        self.error_func = error_func or self._raise_error
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _raise_error(msg, line, column):
+        raise SyntaxError('%s: line:%s column:%s' % (msg, line, column))
+
+    # --------------------------------------------------------------------------
+    def _lex(self, path, data):
+        lexer = VerilogLexerPlex(error_func=self.error_func)
+        lexer.filename = path
+        lexer.input(data.decode())
+        tokens = tuple(CachedToken(t.type, t.value, t.lineno, t.lexpos) for t in lexer)
+        return tokens, tuple(lexer.directives)
+
+    def _disk_path(self, path):
+        return os.path.join(self.directory,
+                            hashlib.sha1(path.encode()).hexdigest() + '.tokens')
+
+    def _load(self, path):
+        if self.directory is None:
+            return None
+        try:
+            with open(self._disk_path(path), 'rb') as fd:
+                return CacheEntry(*pickle.load(fd))
+        except (OSError, EOFError, pickle.UnpicklingError, TypeError):
+            return None
+
+    def _store(self, path, entry):
+        if self.directory is None:
+            return
+        tmp = self._disk_path(path) + '.%d' % os.getpid()
+        with open(tmp, 'wb') as fd:
+            pickle.dump((entry.mtime_ns, entry.size, entry.digest,
+                         entry.tokens, entry.directives), fd, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._disk_path(path))
+
+    def entry(self, path):
+        """ Return the up-to-date ``CacheEntry`` of ``path`` """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        entry = self.entries.get(path)
+        if entry is None:
+            entry = self._load(path)
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            self.hits += 1
+            self.entries[path] = entry
+            return entry
+
+        with open(path, 'rb') as fd:
+            data = fd.read()
+        digest = hashlib.sha1(data).hexdigest()
+        if entry is not None and entry.digest == digest:
+            # Touched but unchanged: keep the tokens, refresh the stamp.
+            self.hits += 1
+            entry.mtime_ns = st.st_mtime_ns
+            entry.size = st.st_size
+        else:
+            self.misses += 1
+            tokens, directives = self._lex(path, data)
+            entry = CacheEntry(st.st_mtime_ns, st.st_size, digest, tokens, directives)
+        self.entries[path] = entry
+        self._store(path, entry)
+        return entry
+
+    # --------------------------------------------------------------------------
+    def _find_include(self, name, current):
+        if os.path.isabs(name):
+            return name
+        for d in [os.path.dirname(current)] + self.include:
+            path = os.path.join(d, name)
+            if os.path.exists(path):
+                return path
+        raise IOError('%s: include file not found: %s' % (current, name))
+
+    def tokens(self, path, depth=0):
+        """ Yield the tokens of ``path`` with `include'd files spliced in """
+        if depth > self.max_depth:
+            raise RecursionError('%s: include nesting too deep' % path)
+        entry = self.entry(path)
+        tokens = entry.tokens
+        start = 0
+        for lineno, text in entry.directives:
+            m = _INCLUDE.match(text)
+            if m is None:
+                continue
+            # The directive swallows the rest of its line, so every token of
+            # the including file after it has a larger line number.
+            end = bisect.bisect_right(entry.linenos, lineno, start)
+            for i in range(start, end):
+                yield tokens[i]
+            start = end
+            for tok in self.tokens(self._find_include(m.group(1) or m.group(2), path), depth + 1):
+                yield tok
+        for i in range(start, len(tokens)):
+            yield tokens[i]
+
+    def filelist_tokens(self, filelist):
+        """ Yield the tokens of every file of ``filelist`` in order """
+        for path in filelist:
+            for tok in self.tokens(path):
+                yield tok